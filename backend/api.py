@@ -1,15 +1,29 @@
 # https://stackoverflow.com/a/59155127
 from init import app, socketio, login_manager, mail, db, logger
 import eventlet
-from flask import request, abort, copy_current_request_context
+from flask import Response, request, abort, copy_current_request_context, stream_with_context
 from flask_socketio import leave_room
 from flask_login import login_user, current_user, login_required
 from datetime import datetime
 import json
-from sqlalchemy import select, func
-from model import User, Lobby, LobbyUser, Scramble, Solve, SocketConnection, CubeEntity, UserRole, LobbyStatus, Invitation
-from cube import Cube
-from typing import TypedDict, Optional, Dict
+import gzip
+import math
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.orm import aliased
+from model import User, Lobby, LobbyUser, Scramble, Solve, SocketConnection, CubeEntity, UserRole, LobbyStatus, Invitation, TogetherLobby, load_replay
+from cube import Cube, state_to_string
+from simplify import simplify, count_moves
+from scramble_pool import scramble_pool
+from startup import startup
+from live_cubes import live_cubes
+from replay_cache import replay_cache, CachedReplay
+from connections import connections
+from user_cache import user_cache
+from move_broadcast import move_broadcast
+from protocol import protocols
+from rate_limit import rate_limiter
+from typing import TypedDict, Optional, Dict, Iterator, List, Tuple
+from itertools import chain, islice
 from eventlet import sleep
 from functools import wraps
 
@@ -18,7 +32,7 @@ class RequestSolutionData(TypedDict):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, user_id)
+    return user_cache.get(int(user_id))
 
 # https://flask.palletsprojects.com/en/2.3.x/patterns/viewdecorators/
 def admin_required(fun):
@@ -55,6 +69,8 @@ def update_banned_status():
 
     user.banned = status
     db.session.commit()
+    user_cache.invalidate(user.id)
+    replay_cache.invalidate(db.session.scalars(select(Solve.id).where(Solve.user_id == user.id)))
 
     return "ok", 200
 
@@ -80,6 +96,7 @@ def update_solve_deleted_status():
 
     solve.deleted = status
     db.session.commit()
+    replay_cache.invalidate([solve.id])
 
     return "ok", 200
 
@@ -94,6 +111,7 @@ def make_admin(username: str):
     if user:
         user.role = UserRole.ADMIN
         db.session.commit()
+        user_cache.invalidate(user.id)
         return "success", 200
 
     return "error", 400
@@ -150,43 +168,168 @@ def get_solves_to_continue():
     return {"solves": [solve._asdict() for solve in solves]}
 
 
-def get_solves(username: Optional[str] = None, cube_size: Optional[int] = None):
-    rows = db.session.execute(
-            select(
-            Solve.id.label("id"),
-            Solve.completed.label("completed"),
-            Solve.time.label("time"),
-            Solve.race_id.label("race_id"),
-            Scramble.cube_size.label("cube_size"),
-            User.username.label("username"),
-            User.banned.label("banned"),
-            Solve.deleted.label("deleted"),
-        ).join(
-            Scramble, Solve.scramble_id == Scramble.id,
-        ).outerjoin(
-            User, Solve.user_id == User.id
-        ).where(
-            # if username is specified, filter by it
-            not username or User.username == username,
-            not cube_size or Scramble.cube_size == cube_size
-        ).order_by(
-            Solve.end_timestamp.desc()
-        )
+# maximum number of solves in a page of /api/fetch_solves
+MAX_SOLVES_PAGE = 1000
+# number of solves in a page of /api/get_solves and /api/user_info
+SOLVES_PAGE = 100
+
+
+def encode_solve_cursor(end_timestamp: Optional[datetime], solve_id: int) -> str:
+    return f"{solve_id}:{end_timestamp.isoformat() if end_timestamp else ''}"
+
+
+def decode_solve_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    solve_id, _, end_timestamp = cursor.partition(":")
+    return datetime.fromisoformat(end_timestamp) if end_timestamp else None, int(solve_id)
+
+
+def iter_solves(
+    username: Optional[str] = None,
+    cube_size: Optional[int] = None,
+    completed: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Iterator[Dict]:
+    # solves ordered by end_timestamp (unfinished first) and id, the most
+    # recent first, starting after the solve with the given cursor
+    # the rows are fetched in batches, so the memory does not grow with
+    # the number of solves
+    creator = aliased(User)
+    query = select(
+        Solve.id.label("id"),
+        Solve.completed.label("completed"),
+        Solve.time.label("time"),
+        Solve.race_id.label("race_id"),
+        Scramble.cube_size.label("cube_size"),
+        User.username.label("username"),
+        User.banned.label("banned"),
+        Solve.deleted.label("deleted"),
+        # together lobby solves do not have a user
+        creator.username.label("creator"),
+        Solve.end_timestamp.label("end_timestamp"),
+    ).join(
+        Scramble, Solve.scramble_id == Scramble.id,
+    ).outerjoin(
+        User, Solve.user_id == User.id
+    ).outerjoin(
+        TogetherLobby, Solve.lobby_together_id == TogetherLobby.id
+    ).outerjoin(
+        creator, TogetherLobby.creator_id == creator.id
+    ).order_by(
+        Solve.end_timestamp.desc().nulls_first(),
+        Solve.id.desc()
+    ).execution_options(
+        yield_per=500
     )
 
-    rows = [row._asdict() for row in rows.all()]
-    for row in rows:
-        if not row["username"]:
-            solve = db.session.get(Solve, row["id"])
-            creator = solve.lobby_together.creator.username
-            row["username"] = f"{creator}' LobbyTogether"
-
-    return rows
+    if username:
+        query = query.where(User.username == username)
+    if cube_size:
+        query = query.where(Scramble.cube_size == cube_size)
+    if completed is not None:
+        query = query.where(Solve.completed == completed)
+
+    if cursor:
+        end_timestamp, solve_id = decode_solve_cursor(cursor)
+        if end_timestamp is None:
+            query = query.where(or_(
+                and_(Solve.end_timestamp.is_(None), Solve.id < solve_id),
+                Solve.end_timestamp.is_not(None)
+            ))
+        else:
+            query = query.where(or_(
+                Solve.end_timestamp < end_timestamp,
+                and_(Solve.end_timestamp == end_timestamp, Solve.id < solve_id)
+            ))
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    for row in db.session.execute(query):
+        solve = row._asdict()
+        creator_username = solve.pop("creator")
+        if not solve["username"]:
+            solve["username"] = f"{creator_username}' LobbyTogether"
+        solve["cursor"] = encode_solve_cursor(solve.pop("end_timestamp"), solve["id"])
+        yield solve
+
+
+def get_solves(username: Optional[str] = None, cube_size: Optional[int] = None) -> List[Dict]:
+    solves = list(iter_solves(username, cube_size))
+    for solve in solves:
+        del solve["cursor"]
+    return solves
+
+
+def get_solves_page(
+    username: Optional[str] = None,
+    cube_size: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Dict:
+    # page of solves in the format of /api/fetch_solves with limit
+    limit = SOLVES_PAGE if limit is None else max(1, min(limit, MAX_SOLVES_PAGE))
+    # one more solve tells whether there is a next page
+    page = list(iter_solves(username, cube_size, cursor=cursor, limit=limit + 1))
+    return {
+        "solves": page[:limit],
+        "next": page[limit - 1]["cursor"] if len(page) > limit else None
+    }
 
 
 @app.route('/api/fetch_solves', methods=["GET", "POST"])
 def fetch_solves():
-    return get_solves(), 200
+    # without limit, all the solves are returned as a JSON array
+    # with limit, a page is returned as {"solves": [...], "next": cursor},
+    # next is null on the last page - pass it as cursor to get the next page
+    # with format=ndjson, solves are sent one per line, the cursor of a solve
+    # is in its "cursor" field
+    args = request.args
+    limit = args.get("limit", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_SOLVES_PAGE))
+
+    solves = iter_solves(
+        username=args.get("username"),
+        cube_size=args.get("cube_size", type=int),
+        completed={"true": True, "false": False}.get(args.get("completed", "")),
+        cursor=args.get("cursor"),
+        # one more solve tells whether there is a next page
+        limit=None if limit is None else limit + 1
+    )
+
+    # the cursor is parsed before the response starts
+    try:
+        solves = chain([next(solves)], solves)
+    except StopIteration:
+        solves = iter(())
+    except ValueError:
+        return abort(400)
+
+    def generate_ndjson() -> Iterator[str]:
+        for solve in islice(solves, limit):
+            yield json.dumps(solve) + "\n"
+
+    def generate_array() -> Iterator[str]:
+        yield "["
+        for i, solve in enumerate(solves):
+            del solve["cursor"]
+            yield ("," if i else "") + json.dumps(solve)
+        yield "]"
+
+    def generate_page() -> Iterator[str]:
+        yield "{\"solves\": ["
+        page = list(islice(solves, limit + 1))
+        for i, solve in enumerate(page[:limit]):
+            yield ("," if i else "") + json.dumps(solve)
+        next_cursor = page[limit - 1]["cursor"] if len(page) > limit else None
+        yield "], \"next\": " + json.dumps(next_cursor) + "}"
+
+    if args.get("format") == "ndjson":
+        return Response(stream_with_context(generate_ndjson()), mimetype="application/x-ndjson")
+    if limit is None:
+        return Response(stream_with_context(generate_array()), mimetype="application/json")
+    return Response(stream_with_context(generate_page()), mimetype="application/json")
 
 
 @app.route('/api/is_user', methods=["POST"])
@@ -202,7 +345,17 @@ def is_user():
 
 @app.route('/api/get_solves/<string:username>/<int:cube_size>')
 def get_solves_(username: str, cube_size: int):
-    return get_solves(username, cube_size), 200
+    # a page of solves as {"solves": [...], "next": cursor}, pass next as
+    # cursor to get the next page, with all=true all the solves are
+    # returned as a JSON array
+    args = request.args
+    if args.get("all") == "true":
+        return get_solves(username, cube_size), 200
+
+    try:
+        return get_solves_page(username, cube_size, args.get("cursor"), args.get("limit", type=int)), 200
+    except ValueError:
+        return abort(400)
 
 
 @app.route('/api/current_user_info')
@@ -231,26 +384,36 @@ def get_user_info():
     if user is None:
         return abort(404)
 
+    # the first page of the solves, the next pages are in /api/fetch_solves,
+    # with "all": true all the solves are returned without "next"
+    if data.get("all"):
+        solves = {"solves": get_solves(user.username)}
+    else:
+        try:
+            solves = get_solves_page(user.username, cursor=data.get("cursor"), limit=data.get("limit"))
+        except (ValueError, TypeError):
+            return abort(400)
+
     return {
         "username": user.username,
         "banned": user.banned,
         "role": "user" if user.role == UserRole.USER else "admin",
         "created_date": user.created_date,
-        "solves": get_solves(user.username)
+        **solves
     }
 
 @socketio.on("get_moves")
 def get_solution():
     # return a list of moves that applying them to a cube will result in the current state
     # This includes the scrambles moves.
-    connection = SocketConnection.get(request.sid)
+    connection = connections.get(request.sid)
     if connection is None:
         return {"status": "error"}
 
-    if connection.user.role != UserRole.ADMIN:
+    if db.session.get(User, connection.user_id).role != UserRole.ADMIN:
         return {"status": "error"}
 
-    solve = connection.cube.current_solve
+    solve = db.session.get(CubeEntity, connection.cube_id).current_solve
     if solve is None:
         return {"status", "error"}
 
@@ -260,22 +423,33 @@ def get_solution():
 
     moves = list(map(lambda move: move["move"], solve.get_moves()))
     allmoves = solve.scramble.scramble_string.split() + moves
-    return {"status": "ok", "moves": allmoves}
+    return {"status": "ok", "moves": list(simplify(allmoves, solve.scramble.cube_size))}
 
 
 
 @app.route("/api/solve/<int:solve_id>")
 def solve(solve_id: int):
-    solve: Solve = db.session.get(Solve, solve_id)
+    # read before the solve is loaded (see ReplayCache.put)
+    generation = replay_cache.generation(solve_id)
+    cached = replay_cache.get(solve_id)
+    if cached is not None:
+        return replay_response(cached)
+
+    solve: Solve = load_replay(solve_id)
     if solve is None:
         abort(404)
 
-    return {
+    moves = solve.get_moves()
+
+    replay = {
         "id": solve.id,
         "cube_size": solve.scramble.cube_size,
         "scramble": solve.scramble.scramble_string,
-        "scramble_state": solve.scramble.cube_state.decode("UTF-8"),
-        "moves": solve.get_moves(),
+        "scramble_state": state_to_string(solve.scramble.cube_state),
+        "moves": moves,
+        "move_count": count_moves(
+            [move["move"] for move in moves], solve.scramble.cube_size
+        ),
         "camera_changes": solve.get_camera_changes(),
         "completed": solve.completed,
         "time": solve.time,
@@ -283,6 +457,67 @@ def solve(solve_id: int):
         "deleted": solve.deleted
     }
 
+    # replays of unfinished solves change with every move
+    if not solve.completed:
+        return replay
+
+    return replay_response(replay_cache.put(solve_id, replay, generation))
+
+
+def replay_response(replay: CachedReplay) -> Response:
+    if request.if_none_match.contains(replay.etag):
+        response = Response(status=304)
+    elif "gzip" in request.accept_encodings:
+        response = Response(replay.body, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(gzip.decompress(replay.body), mimetype="application/json")
+
+    response.set_etag(replay.etag)
+    # the deleted and banned flags can change, clients have to revalidate
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+@app.route("/api/ready")
+def ready():
+    # readiness probe - 503 until the server is serving and warmed up
+    report = startup.report()
+    report["scramble_pool"] = scramble_pool.metrics()["depth"]
+    return report, 200 if startup.ready else 503
+
+
+@app.route("/api/metrics")
+@admin_required
+def metrics():
+    return {
+        "scramble_pool": scramble_pool.metrics(),
+        "replay_cache": replay_cache.metrics(),
+        "move_broadcast": move_broadcast.metrics(),
+        "rate_limiter": rate_limiter.metrics()
+    }
+
+
+@app.route("/api/solve/<int:solve_id>/state")
+def solve_state(solve_id: int):
+    # cube state t ms after the start of the solve (as sinceStart of moves)
+    solve: Solve = db.session.get(Solve, solve_id)
+    if solve is None:
+        abort(404)
+
+    t = request.args.get("t", type=float)
+    if t is None or not math.isfinite(t):
+        abort(400)
+
+    move_count = solve.count_moves_until(t)
+    return {
+        "id": solve.id,
+        "cube_size": solve.scramble.cube_size,
+        "t": t,
+        "move_count": move_count,
+        "state": state_to_string(solve.get_state_after(move_count))
+    }
+
 def create_connection(size, cube_id=None, lobby_id=None):
     default_state = Cube(size).serialize()
 
@@ -305,12 +540,14 @@ def create_connection(size, cube_id=None, lobby_id=None):
 
     db.session.add(connection)
     db.session.commit()
+    connections.add(connection)
 
     return connection.id
 
 @socketio.event
-def connect():
-    pass
+def connect(auth=None):
+    # the client can choose the format of the events (see protocol.py)
+    protocols.set(request.sid, (auth or {}).get("protocol"))
 
 
 def together_lobby_dc(connection: SocketConnection):
@@ -324,10 +561,12 @@ def together_lobby_dc(connection: SocketConnection):
     )
     users = connection.together_lobby.users
     for together_user in users:
-        if together_user.user == current_user:
+        # current_user is a cached snapshot, not the User of this session
+        if together_user.user_id == current_user.id:
             users.remove(together_user)
             db.session.delete(together_user)
             db.session.commit()
+            break
 
 
 def lobby_dc(connection: SocketConnection):
@@ -377,13 +616,27 @@ def lobby_dc(connection: SocketConnection):
 @socketio.event
 def disconnect():
     now = datetime.now()
-    connection = SocketConnection.get(request.sid)
-    if not connection:
+    # the socket leaves all its rooms
+    protocols.remove(request.sid)
+    rate_limiter.remove(request.sid)
+    registered = connections.get(request.sid)
+    if not registered:
         return
+    connections.remove(request.sid)
 
+    connection = db.session.get(SocketConnection, registered.id)
     connection.disconnection_date = now
     db.session.commit()
 
+    # store the state of the cube moved by the user, it is loaded again
+    # on the next move, cubes of together lobbies are kept while other
+    # users move them
+    if connection.cube_id is not None:
+        if connections.uses_cube(connection.cube_id):
+            live_cubes.flush(connection.cube_id)
+        else:
+            live_cubes.discard(connection.cube_id)
+
     socketio.emit(
         "lobby_disconnection",
         { "username": current_user.username },
@@ -0,0 +1,82 @@
+import unittest
+import json
+from unittest import mock
+from datetime import datetime, timedelta
+from database_testing import DatabaseTestCase
+from init import app, db
+from cube import Cube
+from model import User, Scramble, Solve
+import api
+
+
+class TestSolvePages(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # the database is shared by the tests
+        self.username = self._testMethodName
+        user = User(username=self.username)
+        db.session.add(user)
+        scramble = Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).serialize())
+        db.session.add(scramble)
+        db.session.commit()
+
+        # two solves end at the same time, the last one is not finished
+        start = datetime(2024, 1, 1)
+        ends = [start, start + timedelta(minutes=1), start + timedelta(minutes=1), start + timedelta(minutes=2), None]
+        solves = [
+            Solve(
+                scramble_id=scramble.id,
+                user_id=user.id,
+                inspection_startdate=start,
+                solve_startdate=start,
+                end_timestamp=end
+            ) for end in ends
+        ]
+        db.session.add_all(solves)
+        db.session.commit()
+        self.solve_ids = [solve.id for solve in reversed(solves)]
+        self.client = app.test_client()
+
+    def user_info(self, **data) -> dict:
+        return self.client.post("/api/user_info", data=json.dumps({"username": self.username, **data})).json
+
+    def test_user_info(self):
+        with mock.patch.object(api, "SOLVES_PAGE", 2):
+            info = self.user_info()
+        self.assertEqual([solve["id"] for solve in info["solves"]], self.solve_ids[:2])
+
+        # the next pages are in /api/fetch_solves
+        solve_ids = [solve["id"] for solve in info["solves"]]
+        cursor = info["next"]
+        while cursor is not None:
+            page = self.client.get("/api/fetch_solves", query_string={
+                "username": self.username, "limit": 2, "cursor": cursor
+            }).json
+            solve_ids += [solve["id"] for solve in page["solves"]]
+            cursor = page["next"]
+        self.assertEqual(solve_ids, self.solve_ids)
+
+        self.assertEqual([solve["id"] for solve in self.user_info(all=True)["solves"]], self.solve_ids)
+        self.assertNotIn("next", self.user_info(all=True))
+        self.assertEqual(self.client.post("/api/user_info", data=json.dumps({"username": self.username, "cursor": "x"})).status_code, 400)
+
+    def test_get_solves(self):
+        solve_ids = []
+        query = {}
+        with mock.patch.object(api, "SOLVES_PAGE", 2):
+            while True:
+                page = self.client.get(f"/api/get_solves/{self.username}/3", query_string=query).json
+                self.assertLessEqual(len(page["solves"]), 2)
+                solve_ids += [solve["id"] for solve in page["solves"]]
+                if page["next"] is None:
+                    break
+                query = {"cursor": page["next"]}
+        self.assertEqual(solve_ids, self.solve_ids)
+
+        solves = self.client.get(f"/api/get_solves/{self.username}/3", query_string={"all": "true"}).json
+        self.assertEqual([solve["id"] for solve in solves], self.solve_ids)
+        self.assertEqual(self.client.get(f"/api/get_solves/{self.username}/4").json, {"solves": [], "next": None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from flask_mail import Message
 from threading import Thread
 from init import app, db, logger
 from model import ANONYMOUS_PREFIX, User
+from user_cache import user_cache
 from typing import Optional
 
 from flask import abort, flash, render_template, request
@@ -81,9 +82,11 @@ def register():
     email_hash = generate_password_hash(email)
 
     if keep_data:
-        current_user.username = username
-        current_user.password_hash = password_hash,
-        current_user.email_hash=email_hash
+        # current_user is a cached snapshot
+        user = db.session.get(User, current_user.id)
+        user.username = username
+        user.password_hash = password_hash
+        user.email_hash=email_hash
     else:
         user = User(
             username=username,
@@ -93,6 +96,7 @@ def register():
         db.session.add(user)
 
     db.session.commit()
+    user_cache.invalidate(user.id)
 
     return {"msg": "ok"}, 200
 
@@ -121,6 +125,7 @@ def reset_password():
 
     ret.password_hash = generate_password_hash(password)
     db.session.commit()
+    user_cache.invalidate(ret.id)
     return {"msg": "Your password has been reset", "status": 200}
 
 
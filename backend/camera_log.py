@@ -0,0 +1,259 @@
+"""Coalescing of camera events and storage of camera paths.
+
+Clients send their camera position at pointer-move frequency. Only the
+latest position of each connection is kept, the positions are broadcast
+to the other users at CAMERA_BROADCAST_RATE per second (0 broadcasts every
+position right away). The broadcast positions of solves form camera paths,
+which are simplified and appended to packed arrays
+(SolvingSession.packed_camera) every CAMERA_WRITE_INTERVAL seconds and when
+a solving session ends. The arrays are appended to in the database, so the
+periodic write and the end of a session do not overwrite each other.
+"""
+from init import app, socketio, logger, db
+from protocol import protocols
+from move_log import append_bytes
+from transaction_hooks import after_transaction
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, case, func
+import numpy as np
+
+# packed camera path starts with a byte with the format version, followed
+# by rows of ms since the session start (int32, float32 loses whole ms after
+# 4.6 hours) and x, y, z
+CAMERA_PATH_VERSION = 1
+CAMERA_ROW = np.dtype([("time", "<i4"), ("position", "<f4", 3)])
+# paths stored before the version byte was added are float32 rows of the
+# same size, so they can be told apart by their length
+LEGACY_CAMERA_DTYPE = np.dtype("<f4")
+
+
+def _encode_rows(path: np.ndarray) -> bytes:
+    rows = np.empty(len(path), dtype=CAMERA_ROW)
+    rows["time"] = np.round(path[:, 0])
+    rows["position"] = path[:, 1:]
+    return rows.tobytes()
+
+
+def encode_path(path: np.ndarray) -> bytes:
+    """Packs a camera path.
+
+    Args:
+        path (np.ndarray): (k, 4) array of ms since the session start and
+            x, y, z coordinates of the camera.
+
+    Returns:
+        bytes: Packed path.
+    """
+    return bytes([CAMERA_PATH_VERSION]) + _encode_rows(path)
+
+
+def append_path(column, path: np.ndarray):
+    """SQL expression that appends a camera path to a packed path column.
+
+    Paths in the legacy format are continued in it.
+
+    Args:
+        column: Binary column with a path packed by encode_path.
+        path (np.ndarray): (k, 4) array of the positions to append.
+
+    Returns:
+        SQL expression of the new value of the column.
+    """
+    legacy = and_(column.is_not(None), func.length(column) % CAMERA_ROW.itemsize == 0)
+    return case(
+        (legacy, append_bytes(column, path.astype(LEGACY_CAMERA_DTYPE).tobytes())),
+        else_=append_bytes(column, _encode_rows(path), bytes([CAMERA_PATH_VERSION]))
+    )
+
+
+def decode_path(buffer: Optional[bytes]) -> np.ndarray:
+    """Unpacks a camera path packed by encode_path.
+
+    Args:
+        buffer (Optional[bytes]): Packed path, possibly None or empty.
+
+    Returns:
+        np.ndarray: (k, 4) float array.
+    """
+    if not buffer:
+        return np.empty((0, 4))
+    if len(buffer) % CAMERA_ROW.itemsize == 0:
+        return np.frombuffer(buffer, dtype=LEGACY_CAMERA_DTYPE).reshape(-1, 4).astype(float)
+
+    assert buffer[0] == CAMERA_PATH_VERSION
+    rows = np.frombuffer(buffer[1:], dtype=CAMERA_ROW)
+    return np.column_stack([rows["time"], rows["position"]]).astype(float)
+
+
+def simplify_path(path: np.ndarray, tolerance: float) -> np.ndarray:
+    """Simplifies a camera path with the Ramer-Douglas-Peucker algorithm.
+
+    The first and the last position are always kept, the positions in
+    between are dropped if they are closer than tolerance to the simplified
+    path.
+
+    Args:
+        path (np.ndarray): (k, 4) array of times and camera positions.
+        tolerance (float): Maximum distance of a dropped position from the
+            simplified path.
+
+    Returns:
+        np.ndarray: Rows of the path that are kept.
+    """
+    if len(path) <= 2:
+        return path
+
+    positions = path[:, 1:]
+    keep = np.zeros(len(path), dtype=bool)
+    keep[[0, -1]] = True
+
+    segments = [(0, len(path) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+
+        # distances of the inner positions from the segment
+        a = positions[start]
+        segment = positions[end] - a
+        inner = positions[start + 1:end] - a
+        length = segment @ segment
+        t = np.zeros(len(inner)) if length == 0 else np.clip(inner @ segment / length, 0, 1)
+        distances = np.linalg.norm(inner - t[:, np.newaxis] * segment, axis=1)
+
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            segments += [(start, middle), (middle, end)]
+
+    return path[keep]
+
+
+@dataclass
+class CameraPosition:
+    position: dict
+    timestamp: datetime
+    username: str
+    # session of the solve, the path is recorded only for solves
+    session_id: Optional[int] = None
+    session_start: Optional[datetime] = None
+    # rooms to broadcast the position to
+    together_room: Optional[str] = None
+    lobby_id: Optional[int] = None
+
+
+class CameraLog:
+    def __init__(self, broadcast_rate: float, write_interval: float, tolerance: float):
+        # 0 broadcasts every position right away
+        self.broadcast_rate = broadcast_rate
+        self.write_interval = write_interval
+        self.tolerance = tolerance
+        # latest position of each connection (by socket id)
+        self.latest: Dict[str, CameraPosition] = {}
+        # positions of each session that were not stored yet
+        self.paths: Dict[int, List[List[float]]] = {}
+        self.running = False
+
+    def add(self, sid: str, position: CameraPosition) -> None:
+        self.latest[sid] = position
+        if self.broadcast_rate <= 0:
+            self.broadcast()
+
+    def broadcast(self) -> None:
+        latest, self.latest = self.latest, {}
+        for sid, camera in latest.items():
+            if camera.session_id is not None:
+                time = (camera.timestamp - camera.session_start) / timedelta(milliseconds=1)
+                self.paths.setdefault(camera.session_id, []).append([
+                    time, camera.position["x"], camera.position["y"], camera.position["z"]
+                ])
+
+            if camera.together_room is not None:
+                protocols.emit(
+                    "together_camera",
+                    { "position": camera.position, "username": camera.username },
+                    room=camera.together_room
+                )
+
+            if camera.lobby_id is not None:
+                protocols.emit(
+                    "lobby_camera",
+                    { "username": camera.username, "position": camera.position },
+                    room=camera.lobby_id,
+                    skip_sid=sid
+                )
+
+    def end_session(self, session) -> None:
+        # store the path of a solving session that ended, committed by the
+        # caller - it is queued again if the transaction ends without a commit
+        self.broadcast()
+        paths = {session.id: self.paths.pop(session.id, [])}
+        try:
+            self._store(session.id, paths[session.id])
+        except Exception:
+            self._requeue(paths)
+            raise
+        after_transaction(rolled_back=lambda: self._requeue(paths))
+
+    def write(self) -> None:
+        paths, self.paths = self.paths, {}
+        try:
+            for session_id, path in paths.items():
+                self._store(session_id, path)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._requeue(paths)
+            raise
+
+    def _requeue(self, paths: Dict[int, List[List[float]]]) -> None:
+        # put the paths back in front of the positions added since
+        for session_id, path in self.paths.items():
+            paths.setdefault(session_id, []).extend(path)
+        self.paths = {session_id: path for session_id, path in paths.items() if path}
+
+    def _store(self, session_id: int, path: List[List[float]]) -> None:
+        from model import SolvingSession
+        from sqlalchemy import update
+
+        if not path:
+            return
+        simplified = simplify_path(np.array(path), self.tolerance)
+        db.session.execute(
+            update(SolvingSession)
+            .where(SolvingSession.id == session_id)
+            .values({SolvingSession.packed_camera: append_path(
+                SolvingSession.packed_camera, simplified
+            )})
+        )
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._loop)
+
+    def _loop(self) -> None:
+        last_write = datetime.now()
+        # without ticks, the loop only writes the paths
+        interval = 1 / self.broadcast_rate if self.broadcast_rate > 0 else self.write_interval
+        while True:
+            socketio.sleep(interval)
+            try:
+                self.broadcast()
+                if datetime.now() - last_write >= timedelta(seconds=self.write_interval):
+                    last_write = datetime.now()
+                    with app.app_context():
+                        self.write()
+            except Exception:
+                logger.exception("Camera broadcast failed")
+
+
+camera_log = CameraLog(
+    broadcast_rate=app.config["CAMERA_BROADCAST_RATE"],
+    write_interval=app.config["CAMERA_WRITE_INTERVAL"],
+    tolerance=app.config["CAMERA_PATH_TOLERANCE"]
+)
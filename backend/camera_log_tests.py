@@ -0,0 +1,162 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy.exc import OperationalError
+from database_testing import DatabaseTestCase
+from init import db
+from cube import Cube
+from model import Scramble, Solve, SolvingSession
+from camera_log import CameraLog, CameraPosition, encode_path, decode_path, simplify_path, LEGACY_CAMERA_DTYPE
+
+
+def orbit(count: int) -> np.ndarray:
+    # camera moving around the cube every 10 ms
+    angles = np.linspace(0, np.pi, count)
+    return np.column_stack([
+        10 * np.arange(count), 6 * np.sin(angles), np.full(count, 3.0), 6 * np.cos(angles)
+    ])
+
+
+class TestClass(unittest.TestCase):
+    def test_roundtrip(self):
+        path = orbit(50)
+        self.assertTrue(np.allclose(decode_path(encode_path(path)), path, atol=1e-3))
+        self.assertEqual(len(encode_path(path)), 1 + 50 * 4 * 4)
+        self.assertEqual(decode_path(None).shape, (0, 4))
+
+        # times are kept to the ms in long sessions
+        late = np.array([[5 * 3600 * 1000 + 1, 1, 2, 3], [-2500, 0, 0, 0]])
+        self.assertEqual(decode_path(encode_path(late)).tolist(), late.tolist())
+
+        # paths stored as float32 rows
+        legacy = path.astype(LEGACY_CAMERA_DTYPE).tobytes()
+        self.assertTrue(np.allclose(decode_path(legacy), path, atol=1e-3))
+
+    def test_simplify(self):
+        # positions on a line collapse to the end points
+        line = np.column_stack([np.arange(10), np.arange(10), np.zeros(10), np.zeros(10)])
+        self.assertTrue(np.array_equal(simplify_path(line, 0.01), line[[0, -1]]))
+
+        # a still camera is stored once
+        still = np.column_stack([np.arange(10), np.ones((10, 3))])
+        self.assertEqual(len(simplify_path(still, 0.01)), 2)
+
+        path = orbit(500)
+        simplified = simplify_path(path, 0.05)
+        self.assertLess(len(simplified), len(path) / 5)
+        self.assertTrue(np.array_equal(simplified[[0, -1]], path[[0, -1]]))
+
+        # every dropped position is close to the simplified path
+        for time, *position in path:
+            after = np.searchsorted(simplified[:, 0], time)
+            if simplified[min(after, len(simplified) - 1), 0] == time:
+                continue
+            a, b = simplified[after - 1, 1:], simplified[after, 1:]
+            t = np.clip((position - a) @ (b - a) / ((b - a) @ (b - a)), 0, 1)
+            self.assertLessEqual(np.linalg.norm(position - a - t * (b - a)), 0.05 + 1e-9)
+
+    def test_immediate_broadcast(self):
+        log = CameraLog(broadcast_rate=0, write_interval=5, tolerance=0.05)
+        position = { "x": 1, "y": 2, "z": 3 }
+        with mock.patch("camera_log.protocols.emit") as emit:
+            log.add("sid", CameraPosition(position, datetime.now(), "a", lobby_id=1))
+        emit.assert_called_once_with("lobby_camera", { "username": "a", "position": position }, room=1, skip_sid="sid")
+        self.assertEqual(log.latest, {})
+
+        # the loop only writes the paths
+        with mock.patch("camera_log.socketio.sleep", side_effect=[None, KeyboardInterrupt]) as sleep:
+            with self.assertRaises(KeyboardInterrupt):
+                log._loop()
+        self.assertEqual(sleep.call_args.args, (5,))
+
+
+class TestStore(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        scramble = Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).serialize())
+        db.session.add(scramble)
+        db.session.commit()
+
+        self.start = datetime(2024, 1, 1)
+        solve = Solve(scramble_id=scramble.id, inspection_startdate=self.start, solve_startdate=self.start)
+        db.session.add(solve)
+        db.session.commit()
+        session = SolvingSession(solve_id=solve.id, start=self.start)
+        db.session.add(session)
+        db.session.commit()
+        self.session = session
+        self.log = CameraLog(broadcast_rate=10, write_interval=5, tolerance=0)
+
+    def add(self, ms: int, x: float, y: float = 0) -> None:
+        self.log.add("sid", CameraPosition(
+            { "x": x, "y": y, "z": 0 },
+            self.start + timedelta(milliseconds=ms),
+            "a",
+            session_id=self.session.id,
+            session_start=self.start
+        ))
+        self.log.broadcast()
+
+    def stored_path(self) -> list:
+        db.session.expire_all()
+        return decode_path(db.session.get(SolvingSession, self.session.id).packed_camera).tolist()
+
+    def test_append(self):
+        self.add(0, 0)
+        self.add(100, 1)
+        self.log.write()
+        self.assertEqual(self.stored_path(), [[0, 0, 0, 0], [100, 1, 0, 0]])
+
+        # the end of the session appends to the written path
+        session = db.session.get(SolvingSession, self.session.id)
+        self.add(200, 3)
+        self.log.write()
+        self.add(300, 0)
+        self.log.end_session(session)
+        db.session.commit()
+        self.assertEqual([row[0] for row in self.stored_path()], [0, 100, 200, 300])
+
+    def test_legacy_path(self):
+        # the path of an ongoing session stored as float32 rows is continued
+        # in the same format
+        session = db.session.get(SolvingSession, self.session.id)
+        session.packed_camera = np.array([[0, 0, 0, 0]]).astype(LEGACY_CAMERA_DTYPE).tobytes()
+        db.session.commit()
+        self.add(100, 1)
+        self.log.write()
+        self.assertEqual(self.stored_path(), [[0, 0, 0, 0], [100, 1, 0, 0]])
+
+    def test_failed_write(self):
+        self.add(0, 0)
+        self.add(100, 1)
+        error = OperationalError("commit", {}, Exception("connection lost"))
+        with mock.patch.object(db.session, "commit", side_effect=error):
+            with self.assertRaises(OperationalError):
+                self.log.write()
+        self.assertIsNone(db.session.get(SolvingSession, self.session.id).packed_camera)
+
+        # the path is written with the positions added since
+        self.add(200, 1, 1)
+        self.log.write()
+        self.assertEqual([row[0] for row in self.stored_path()], [0, 100, 200])
+        self.assertEqual(self.log.paths, {})
+
+        # the path of an ended session is queued again when the commit of
+        # the caller fails
+        session = db.session.get(SolvingSession, self.session.id)
+        self.add(300, 2)
+        self.log.end_session(session)
+        with mock.patch.object(db.session, "commit", side_effect=error):
+            with self.assertRaises(OperationalError):
+                db.session.commit()
+        db.session.rollback()
+        self.assertEqual([row[0] for row in self.stored_path()], [0, 100, 200])
+
+        self.log.write()
+        self.assertEqual([row[0] for row in self.stored_path()], [0, 100, 200, 300])
+        self.assertEqual(self.log.paths, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
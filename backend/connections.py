@@ -0,0 +1,64 @@
+"""Registry of the socket connections of this server.
+
+Socket event handlers look up the connection of the sender by its socket
+id. The registry maps socket ids to the ids of the user, the cube and the
+lobbies of the connection, so the lookup does not query the database.
+Connections are registered when they are created and removed when they
+disconnect. The socket_connection table stays the durable record, it is
+queried for connections that are not registered (e.g. after a restart).
+"""
+from model import SocketConnection
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class Connection:
+    # id of the SocketConnection row
+    id: int
+    user_id: int
+    cube_id: Optional[int]
+    lobby_id: Optional[int]
+    together_lobby_id: Optional[int]
+    # socketio room of the together lobby
+    together_room: Optional[str]
+
+
+class Connections:
+    def __init__(self):
+        self.connections: Dict[str, Connection] = {}
+
+    def add(self, socket_connection: SocketConnection) -> Connection:
+        connection = self.connections[socket_connection.socket_id] = Connection(
+            id=socket_connection.id,
+            user_id=socket_connection.user_id,
+            cube_id=socket_connection.cube_id,
+            lobby_id=socket_connection.lobby_id,
+            together_lobby_id=socket_connection.together_lobby_id,
+            together_room=(
+                socket_connection.together_lobby.get_room()
+                if socket_connection.together_lobby_id is not None else None
+            )
+        )
+        return connection
+
+    def get(self, sid: str) -> Optional[Connection]:
+        connection = self.connections.get(sid)
+        if connection is not None:
+            return connection
+
+        socket_connection = SocketConnection.get(sid)
+        if socket_connection is None or socket_connection.disconnection_date is not None:
+            return None
+        return self.add(socket_connection)
+
+    def remove(self, sid: str) -> None:
+        self.connections.pop(sid, None)
+
+    def uses_cube(self, cube_id: int) -> bool:
+        # whether a registered connection moves the cube, e.g. a teammate in
+        # a together lobby
+        return any(connection.cube_id == cube_id for connection in self.connections.values())
+
+
+connections = Connections()
@@ -1,9 +1,11 @@
+import re
+import importlib
 import numpy as np
-from typing import List, Optional
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 from enum import Enum
-from math import floor
-from random import choices
-from pyTwistyScrambler import scrambler222, scrambler333, scrambler444, scrambler555, scrambler666, scrambler777
+from functools import lru_cache
+from math import floor, isqrt
+from random import getrandbits
 
 
 class Face(Enum):
@@ -65,9 +67,128 @@ def get_terminal_color(color: bytes) -> str:
     return u"\u001b[48;5;" + colors[color]
 
 
+# stickers are stored as small integer color codes - the index of the color
+# in this array, which is also the index of the face with this color in the
+# default cube state
+COLOR_LETTERS = np.array(list(colors.keys()), dtype=np.dtype("S1"))
+
+# maps color letters (as byte values) to color codes
+_LETTER_CODES = np.zeros(256, dtype=np.uint8)
+_LETTER_CODES[COLOR_LETTERS.view(np.uint8)] = np.arange(len(COLOR_LETTERS))
+
+# serialized state starts with a header of two bytes - the format version and
+# the cube size, followed by color codes packed into 3 bits per sticker
+# states serialized by older versions are plain color letters, one byte per
+# sticker, and can be told apart by their first byte
+STATE_FORMAT_VERSION = 1
+BITS_PER_STICKER = 3
+
+# seed of the keys used for hashing cube states - changing it changes all the
+# hashes, including the stored ones
+ZOBRIST_SEED = 0x5eed
+
+# weights packing 8 color codes into a 24-bit word, first code in the highest
+# bits
+_PACK_WEIGHTS = (1 << np.arange(7 * BITS_PER_STICKER, -1, -BITS_PER_STICKER)).astype(np.uint32)
+
+
+def encode_state(n: int, codes: np.ndarray) -> bytes:
+    """Packs sticker color codes into the serialized state format.
+
+    Args:
+        n (int): Cube size.
+        codes (np.ndarray): Array of 6 * n * n color codes.
+
+    Returns:
+        bytes: Serialized cube state.
+    """
+    # every 8 codes make 3 bytes, the last word is padded with zero codes
+    words = np.zeros(-(-len(codes) // 8) * 8, dtype=np.uint32)
+    words[:len(codes)] = codes
+    words = words.reshape(-1, 8) @ _PACK_WEIGHTS
+    packed = words.astype(">u4").view(np.uint8).reshape(-1, 4)[:, 1:]
+    return bytes([STATE_FORMAT_VERSION, n]) + packed.tobytes()[:state_size(n) - 2]
+
+
+def state_size(n: int) -> int:
+    """Returns the length of a serialized n x n cube state.
+
+    Args:
+        n (int): Cube size.
+
+    Returns:
+        int: Number of bytes returned by encode_state.
+    """
+    return 2 + (6 * n * n * BITS_PER_STICKER + 7) // 8
+
+
+def decode_state(buffer: bytes) -> Tuple[int, np.ndarray]:
+    """Unpacks a serialized state into sticker color codes.
+
+    Both the packed format and the legacy format (one color letter per
+    sticker) are accepted.
+
+    Args:
+        buffer (bytes): Serialized cube state.
+
+    Returns:
+        Tuple[int, np.ndarray]: Cube size and a new array of 6 * n * n color
+            codes.
+    """
+    if buffer[0] in COLOR_LETTERS.view(np.uint8):
+        n = isqrt(len(buffer) // 6)
+        assert 6 * n * n == len(buffer)
+        return n, _LETTER_CODES[np.frombuffer(buffer, np.uint8)]
+
+    version, n = buffer[0], buffer[1]
+    assert version == STATE_FORMAT_VERSION
+
+    stickers = 6 * n * n
+    bits = np.unpackbits(np.frombuffer(buffer, np.uint8, offset=2))
+    bits = bits[:stickers * BITS_PER_STICKER].reshape(stickers, BITS_PER_STICKER)
+    weights = 1 << np.arange(BITS_PER_STICKER - 1, -1, -1, dtype=np.uint8)
+    return n, bits @ weights
+
+
+def state_to_string(buffer: bytes) -> str:
+    """Converts a serialized state to a string of color letters, one letter
+    per sticker. This is the format of cube states sent to the clients.
+
+    Args:
+        buffer (bytes): Serialized cube state, possibly empty.
+
+    Returns:
+        str: Sticker colors, e.g. "WWWWWWWWWGGGGGGGGG..." for a solved 3x3.
+    """
+    if not buffer:
+        return ""
+
+    _, codes = decode_state(buffer)
+    return COLOR_LETTERS[codes].tobytes().decode("UTF-8")
+
+
+def string_to_state(state: str) -> bytes:
+    """Converts a string of color letters (see state_to_string) to the
+    serialized state format.
+
+    Args:
+        state (str): Sticker colors, one letter per sticker.
+
+    Returns:
+        bytes: Serialized cube state.
+    """
+    codes = _LETTER_CODES[np.frombuffer(state.encode(), np.uint8)]
+    return encode_state(isqrt(len(state) // 6), codes)
+
+
 INVERTED_DIRECTION_LAYERS = "DBLM"
 
 
+class Engine(Enum):
+    VIEWS = 0  # rotate numpy views of the faces for every move
+    TABLE = 1  # apply precompiled index permutations
+
+
 class Move:
     def __init__(self, face: str, index: int, wide: bool, dir: Direction):
         """Initializes the object.
@@ -181,9 +302,200 @@ class Move:
             dir=dir
         )
 
+    def to_code(self) -> int:
+        """Returns the integer code of the move (see encode_move).
+
+        Returns:
+            int: Move code.
+        """
+        return (
+            self.index << INDEX_SHIFT
+            | self.wide << WIDE_SHIFT
+            | DIRECTION_CODES.index(self.dir) << DIRECTION_SHIFT
+            | MOVE_FACES.index(self.face)
+        )
+
+    @staticmethod
+    def from_code(code: int) -> "Move":
+        """Initialize the move from its integer code.
+
+        Args:
+            code (int): Move code returned by encode_move.
+
+        Returns:
+            Move: A Move object.
+        """
+        return Move(
+            face=MOVE_FACES[code & FACE_MASK],
+            index=code >> INDEX_SHIFT,
+            wide=bool(code >> WIDE_SHIFT & 1),
+            dir=DIRECTION_CODES[code >> DIRECTION_SHIFT & DIRECTION_MASK]
+        )
+
+    def to_string(self) -> str:
+        """Returns the move in canonical Rubik's cube notation, the same as
+        the clients use - e.g. "R", "3Rw2", "M'", "x".
+
+        Returns:
+            str: Move string.
+        """
+        index = str(self.index) if self.index > 1 else ""
+        wide = "w" if self.wide else ""
+        return f"{index}{self.face}{wide}{self.dir.to_string()}"
+
+
+# a move is encoded into a single integer:
+#   bits 0-3  face, index into MOVE_FACES
+#   bits 4-5  direction, index into DIRECTION_CODES
+#   bit  6    wide flag
+#   bits 7-   layer index (1 for the outer layer)
+MOVE_FACES = "UFRBLDMSExyz"
+DIRECTION_CODES = [Direction.CW, Direction.CCW, Direction.DOUBLE]
+FACE_MASK = 0b1111
+DIRECTION_SHIFT = 4
+DIRECTION_MASK = 0b11
+WIDE_SHIFT = 6
+INDEX_SHIFT = 7
+MAX_LAYER_INDEX = 1 << 12
+
+# face codes from this one on are whole cube rotations
+FIRST_ROTATION_FACE = MOVE_FACES.index("x")
+FIRST_MIDDLE_FACE = MOVE_FACES.index("M")
+_INVERTED_FACES = np.array([face in INVERTED_DIRECTION_LAYERS for face in MOVE_FACES])
+
+# layer index, face (lowercase means wide), wide suffix, direction suffix
+# a double move can have a ' suffix (R2'), the direction does not matter then
+_MOVE_PATTERN = re.compile(r"([1-9][0-9]*)?([UFRBLDMSEufrbldmsexyz])(w?)(2'?|')?")
+
+# tokenized moves, direction is a Direction value (1, -1 or 2) and first,
+# last are the 0-indexed layers of the move along its axis (see
+# Move.get_layer_indices), the move turns layers first..last
+MOVE_DTYPE = np.dtype([
+    ("code", np.uint32),
+    ("face", np.uint8),
+    ("index", np.uint16),
+    ("wide", np.bool_),
+    ("dir", np.int8),
+    ("first", np.int16),
+    ("last", np.int16),
+])
+
+
+@lru_cache(maxsize=4096)
+def encode_move(move_str: str) -> int:
+    """Parses a single move into its integer code.
+
+    The notation is checked strictly, unlike in Move.from_string. Parsed
+    moves are cached, so a token that was seen before costs one lookup.
+    Different spellings of the same move (r and Rw, R2 and R2') have the
+    same code.
+
+    Args:
+        move_str (str): Move in Rubik's cube notation.
+
+    Raises:
+        ValueError: If the string is not a valid move.
+
+    Returns:
+        int: Move code.
+    """
+    match = _MOVE_PATTERN.fullmatch(move_str)
+    if match is None:
+        raise ValueError(f"invalid move {move_str!r}")
+
+    index, face, wide, dir = match.groups()
+    is_rotation = face in "xyz"
+    if is_rotation and (index or wide):
+        raise ValueError(f"invalid rotation {move_str!r}")
+    if index and int(index) >= MAX_LAYER_INDEX:
+        raise ValueError(f"layer index of {move_str!r} is too large")
+
+    return Move(
+        face=face if is_rotation else face.upper(),
+        index=int(index) if index else 1,
+        wide=bool(wide) or (face.islower() and not is_rotation),
+        dir=Direction.DOUBLE if dir and dir[0] == "2" else Direction.CCW if dir else Direction.CW
+    ).to_code()
+
+
+def tokenize(moves_str: str, n: int) -> np.ndarray:
+    """Parses a sequence of moves into an array of tokens.
+
+    All the moves are checked before the array is returned, so invalid
+    notation and moves that are not possible on the cube are rejected before
+    any of the moves is performed.
+
+    Args:
+        moves_str (str): Moves in Rubik's cube notation separated by
+            whitespace.
+        n (int): Cube size.
+
+    Raises:
+        ValueError: If some move is invalid or not possible on a n x n cube.
+
+    Returns:
+        np.ndarray: Array of MOVE_DTYPE, one element for every move.
+    """
+    tokens = moves_str.split()
+    codes = np.array([encode_move(token) for token in tokens], dtype=np.uint32)
+    moves, invalid = _decode_codes(codes, n)
+    if invalid.size:
+        raise ValueError(f"move {tokens[invalid[0]]!r} is not possible on {n}x{n} cube")
+    return moves
+
+
+@lru_cache(maxsize=None)
+def is_possible(n: int, move: int) -> bool:
+    """Checks whether a move can be performed on a n x n cube, as tokenize
+    does for every move of a sequence.
+
+    Args:
+        n (int): Cube size.
+        move (int): Move code returned by encode_move.
+
+    Returns:
+        bool: True if the move is possible.
+    """
+    return _decode_codes(np.array([move], dtype=np.uint32), n)[1].size == 0
+
+
+def _decode_codes(codes: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # tokens of the move codes and the indices of the moves that are not
+    # possible on a n x n cube
+    moves = np.empty(len(codes), dtype=MOVE_DTYPE)
+    moves["code"] = codes
+    face = moves["face"] = codes & FACE_MASK
+    index = moves["index"] = codes >> INDEX_SHIFT
+    wide = moves["wide"] = (codes >> WIDE_SHIFT & 1).astype(bool)
+    direction = codes >> DIRECTION_SHIFT & DIRECTION_MASK
+    moves["dir"] = np.array([dir.value for dir in DIRECTION_CODES], dtype=np.int8)[direction]
+
+    # layers counted from the face of the move
+    first = np.where(wide, 0, index.astype(np.int64) - 1)
+    last = np.where(wide, np.maximum(index, 2) - 1, index.astype(np.int64) - 1)
+    inverted = _INVERTED_FACES[face]
+    first, last = np.where(inverted, n - 1 - last, first), np.where(inverted, n - 1 - first, last)
+
+    middle = (face >= FIRST_MIDDLE_FACE) & (face < FIRST_ROTATION_FACE)
+    first = np.where(middle, np.where(wide, 1, n // 2), first)
+    last = np.where(middle, np.where(wide, n - 2, n // 2), last)
+
+    rotation = face >= FIRST_ROTATION_FACE
+    first = np.where(rotation, 0, first)
+    last = np.where(rotation, n - 1, last)
+
+    moves["first"] = first
+    moves["last"] = last
+    return moves, np.flatnonzero((first < 0) | (last > n - 1) | (middle & (n < 3)))
+
 
 class Cube:
-    def __init__(self, n: int, state: Optional[bytes] = None):
+    def __init__(
+        self,
+        n: int,
+        state: Optional[bytes] = None,
+        engine: Engine = Engine.TABLE
+    ):
         """Create a Cube object.
 
         Args:
@@ -192,25 +504,119 @@ class Cube:
                 method. If no state is passed, a cube with default state will
                 be created. Default state has the white color facing up
                 and green facing front.
+            engine (Engine, optional): How the moves are performed.
+                Engine.TABLE compiles every distinct move once into an index
+                permutation of self._flat, Engine.VIEWS rotates the faces
+                directly. Both engines give the same results.
         """
         self.n = n
+        self.engine = engine
 
-        # for each sticker, create a array element
+        # for each sticker, create a array element with its color code
+        # (index into COLOR_LETTERS)
         # this flat array will be used for serialization of the cube state
         if state is None:
-            self.flat = np.zeros(n * n * 6, dtype=np.dtype("S1"))
+            self._flat = np.repeat(np.arange(6, dtype=np.uint8), n * n)
         else:
-            self.flat = np.frombuffer(state, np.dtype("S1")).copy()
+            size, self._flat = decode_state(state)
+            assert size == n
+
+        # self._faces is a numpy view, that means any changes in self._faces
+        # will reflected in self._flat and vice versa
+        # self._faces will be used for indexing the cube
+        # self._faces[i] is nxn array
+        self._faces = self._flat.reshape(6, n, n)
+
+        # whole cube rotations only change the orientation frame, the
+        # stickers stay in place until the frame is materialized
+        # the cube state is self._flat[orientations(n).perms[self._orientation]]
+        self._orientation = 0
+
+        self.hashes = None
+        self._init_tracking(with_hash=False)
+
+        # packed state returned by serialize, None after the state changes
+        self._serialized = None
+
+    @property
+    def flat(self) -> np.ndarray:
+        """Color codes of all the stickers, face after face."""
+        self._materialize()
+        return self._flat
+
+    @property
+    def faces(self) -> np.ndarray:
+        """Color codes of the stickers as 6 x n x n array."""
+        self._materialize()
+        return self._faces
+
+    def _materialize(self) -> None:
+        """Applies the pending whole cube rotation to the stickers."""
+        if self._orientation == 0:
+            return
 
-        # self.faces is a numpy view, that means any changes in self.faces
-        # will reflected in self.flat and vice versa
-        # self.faces will be used for indexing the cube
-        # self.faces[i] is nxn array
-        self.faces = self.flat.reshape(6, n, n)
+        perm = orientations(self.n).perms[self._orientation]
+        self._flat = self._flat[perm]
+        self._faces = self._flat.reshape(6, self.n, self.n)
+        # the stored stickers are now in the rotated state, so the hash of
+        # orientation o is the hash of the old orientation composed with o
+        if self.hashes is not None:
+            self.hashes = self.hashes[orientations(self.n).compose[self._orientation]]
+        self._orientation = 0
+
+        # the stickers changed faces, the state (and its hash) did not
+        self._init_tracking(with_hash=False)
+
+    def _init_tracking(self, with_hash: bool = True) -> None:
+        """Computes the incrementally tracked properties from scratch.
+
+        self.face_colors[6 * f + c] is the number of stickers with color c on
+        face f. The counts are then updated only for the stickers that each
+        move takes to another face, so the solved check does not have to scan
+        the cube.
+
+        self.hashes[o] is a Zobrist hash of the stored stickers seen in
+        orientation o - xor of random keys, one for each (sticker position,
+        color) pair. A move changes the hashes only by the keys of the
+        stickers it moves. Whole cube rotations only change the orientation
+        frame, so the hash of the state is self.hashes[self._orientation]
+        without any update. The hashes are computed when they are first
+        requested (self.hashes is None until then).
 
-        if state is None:
-            for i, color in enumerate(colors.keys()):
-                self.faces[i] = color
+        Args:
+            with_hash (bool, optional): Whether to compute the hashes as well.
+                Defaults to True.
+        """
+        slots = np.arange(6 * self.n * self.n)
+        faces = slots // (self.n * self.n)
+        self.face_colors = np.bincount(faces * 6 + self._flat, minlength=36)
+        if with_hash:
+            self.hashes = np.bitwise_xor.reduce(
+                all_oriented_zobrist_keys(self.n)[slots * 6 + self._flat], axis=0
+            )
+
+    def state_hash(self) -> int:
+        """Returns 64-bit hash of the cube state.
+
+        Equal states have equal hashes in all processes, so the hash can be
+        used for caching and for looking up stored states.
+
+        Returns:
+            int: Signed 64-bit integer.
+        """
+        if self.hashes is None:
+            self._init_tracking()
+        return int(self.hashes[self._orientation])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Cube):
+            return NotImplemented
+        # compare the hashes first, the states only if they match
+        return (
+            self.n == other.n
+            and self.state_hash() == other.state_hash()
+            and np.array_equal(self.flat, other.flat)
+        )
 
     def serialize(self) -> bytes:
         """Returns serialized inner cube state, which can be used to init
@@ -219,7 +625,10 @@ class Cube:
         Returns:
             bytes: Serialized cube state.
         """
-        return self.flat.tobytes()
+        if self._serialized is None:
+            self._materialize()
+            self._serialized = encode_state(self.n, self._flat)
+        return self._serialized
 
     def deserialize(self, buffer: bytes) -> None:
         """Initialize inner cube state from serialized state.
@@ -228,8 +637,21 @@ class Cube:
             buffer (bytes): Cube state, which was obtained with the .serizalize
                 method.
         """
-        arr = np.frombuffer(buffer, np.dtype("S1"))
-        self.flat[:] = arr.copy()
+        size, codes = decode_state(buffer)
+        assert size == self.n
+        self._flat[:] = codes
+        self._orientation = 0
+        self.hashes = None
+        self._serialized = None
+        self._init_tracking(with_hash=False)
+
+    def to_string(self) -> str:
+        """Returns sticker colors as a string of color letters.
+
+        Returns:
+            str: Cube state in the format used by the clients.
+        """
+        return COLOR_LETTERS[self.flat].tobytes().decode("UTF-8")
 
     def _get_face(self, face: Face) -> np.ndarray:
         """Gets cube face.
@@ -240,7 +662,7 @@ class Cube:
         Returns:
             np.ndarray: ndarray of stickers with self.n * self.n dimensions
         """
-        return self.faces[face.value]
+        return self._faces[face.value]
 
     def pprint(self) -> None:
         """
@@ -258,6 +680,8 @@ class Cube:
               Y Y Y
               Y Y Y
         """
+        # the stickers are read from the faces directly
+        self._materialize()
 
         table_height = 3 * self.n
         table_width = 4 * self.n
@@ -271,7 +695,7 @@ class Cube:
             print_table[
                 row_start: row_start + self.n,
                 col_start: col_start + self.n
-            ] = self._get_face(face)
+            ] = COLOR_LETTERS[self._get_face(face)]
 
         # fill the print_table with corresponding stickers
         fill(0, 1, Face.U)
@@ -423,14 +847,12 @@ class Cube:
         self._rotate_face(f1, rotation.dir)
         self._rotate_face(f2, rotation.dir.reverse())
 
-    def _single_move(self, move_str: str):
+    def _single_move(self, move: Move):
         """Performs a single move on the cube.
 
         Args:
-            move_str (str): Move in Rubik's cube notation.
+            move (Move): The move.
         """
-        move: Move = Move.from_string(move_str)
-
         if move.is_rotation:
             self._perform_rotation(move)
             return
@@ -450,36 +872,552 @@ class Cube:
             moves_str (str): A single move a multiple moves in Rubik's cube
                 notation separated by whitespace.
 
+        Raises:
+            ValueError: If some of the moves is invalid. No move is performed
+                in that case.
+
         Returns:
             Cube: self
         """
-        moves: List[str] = moves_str.split()
-        for move_str in moves:
-            self._single_move(move_str)
+        tokens = moves_str.split()
+        if len(tokens) != 1:
+            return self.move_codes(tokenize(moves_str, self.n)["code"])
+
+        # single moves (replays, socket events) skip building the tokens
+        code = encode_move(tokens[0])
+        if not is_possible(self.n, code):
+            raise ValueError(f"move {tokens[0]!r} is not possible on {self.n}x{self.n} cube")
+        return self.move_codes([code])
+
+    def move_codes(self, codes: Iterable[int]) -> "Cube":
+        """Performs moves given by their integer codes.
+
+        Args:
+            codes (Iterable[int]): Codes of moves that are possible on this
+                cube, e.g. the "code" field of tokenize output.
+
+        Returns:
+            Cube: self
+        """
+        if isinstance(codes, np.ndarray):
+            codes = codes.tolist()
+
+        self._serialized = None
+        for code in codes:
+            if self.engine == Engine.TABLE and is_rotation(code):
+                # only change the orientation frame, the stickers stay
+                self._orientation = rotate_orientation(
+                    self.n, self._orientation, code
+                )
+            elif self.engine == Engine.TABLE:
+                # the move is translated through the orientation frame
+                self._apply_permutation(
+                    *oriented_move(self.n, self._orientation, code)
+                )
+            else:
+                self._single_move(Move.from_code(code))
+                self._init_tracking(with_hash=False)
+                self.hashes = None
 
         return self
 
+    def apply_sequence(self, moves_str: str, inverse: bool = False) -> "Cube":
+        """Performs a whole sequence of moves with a single permutation.
+
+        The sequence is compiled with compile_sequence, so repeated
+        sequences (scrambles, algorithms) cost one gather regardless of their
+        length.
+
+        Args:
+            moves_str (str): Moves in Rubik's cube notation separated by
+                whitespace.
+            inverse (bool, optional): Perform the inverse of the sequence
+                instead. Defaults to False.
+
+        Returns:
+            Cube: self
+        """
+        perm, inverse_perm = compile_sequence(self.n, moves_str)
+        self._materialize()
+        self._apply_permutation(inverse_perm if inverse else perm)
+        return self
+
+    def _apply_permutation(
+        self,
+        perm: np.ndarray,
+        updates: Optional["PermutationUpdates"] = None
+    ) -> None:
+        """Moves the stickers according to an index permutation.
+
+        After the call, position i holds the sticker that was at position
+        perm[i] before the call.
+
+        Args:
+            perm (np.ndarray): Index permutation of the stickers as they are
+                stored, not translated through the orientation frame.
+            updates (PermutationUpdates, optional): Precomputed data for
+                updating the tracked properties, as returned by move_updates.
+                Computed from perm if not passed.
+        """
+        if updates is None:
+            updates = permutation_updates(self.n, perm)
+
+        # update color counts only for the stickers that change faces
+        colors = self._flat[updates.transfer_src]
+        self.face_colors += (
+            np.bincount(updates.offsets_to + colors, minlength=36)
+            - np.bincount(updates.offsets_from + colors, minlength=36)
+        )
+
+        # update the hashes only for the stickers that change places
+        if self.hashes is not None:
+            keys = all_oriented_zobrist_keys(self.n)
+            self.hashes ^= np.bitwise_xor.reduce(
+                keys.take(updates.touched_slots + self._flat[updates.touched], axis=0)
+                ^ keys.take(updates.touched_slots + self._flat[updates.touched_src], axis=0),
+                axis=0
+            )
+
+        self._flat = self._flat[perm]
+        self._faces = self._flat.reshape(6, self.n, self.n)
+        self._serialized = None
+
     def is_solved(self) -> bool:
         """Checks whether the cube is solved.
 
+        This takes constant time, as only the color counts of each face are
+        checked.
+
+        Returns:
+            bool: true if the cube is solved, false otherwise.
+        """
+        # each face has some stickers, so the cube is solved exactly when
+        # every face has stickers of one color only
+        return np.count_nonzero(self.face_colors) == 6
+
+    def _scan_solved(self) -> bool:
+        """Checks whether the cube is solved by scanning all the stickers.
+
         Returns:
             bool: true if the cube is solved, false otherwise.
         """
-        for face in self.faces:
+        for face in self._faces:
             # check whether all stickers on the face are of the same color
             if not (face == face[0][0]).all():
                 return False
         return True
 
+
+class CubeBatch:
+    def __init__(self, n: int, states: List[Optional[bytes]]):
+        """Create a batch of cubes of the same size.
+
+        The states of all cubes are stored as rows of a single
+        (len(states), 6 * n * n) array, so the moves and checks are
+        performed for all the cubes at once.
+
+        Args:
+            n (int): Size of the cubes.
+            states (List[Optional[bytes]]): Cube states obtained with the
+                Cube.serialize method, None for a cube with default state.
+        """
+        self.n = n
+        self.flat = np.empty((len(states), 6 * n * n), dtype=np.uint8)
+        for row, state in zip(self.flat, states):
+            row[:] = Cube(n, state).flat
+
+    def __len__(self) -> int:
+        return self.flat.shape[0]
+
+    def get_cube(self, i: int) -> Cube:
+        """Returns a copy of the i-th cube in the batch.
+
+        Args:
+            i (int): Index of the cube.
+
+        Returns:
+            Cube: A Cube object with the state of the i-th cube.
+        """
+        return Cube(self.n, encode_state(self.n, self.flat[i]))
+
+    def serialize(self) -> List[bytes]:
+        """Returns serialized states of all the cubes.
+
+        Returns:
+            List[bytes]: Cube states in the Cube.serialize format.
+        """
+        return [encode_state(self.n, row) for row in self.flat]
+
+    def move_all(self, moves_str: str) -> "CubeBatch":
+        """Performs the same move or sequence of moves on all the cubes.
+
+        Args:
+            moves_str (str): Moves in Rubik's cube notation separated by
+                whitespace.
+
+        Returns:
+            CubeBatch: self
+        """
+        perm, _ = compile_sequence(self.n, moves_str)
+        self.flat = self.flat[:, perm]
+        return self
+
+    def move_each(self, moves: List[str]) -> "CubeBatch":
+        """Performs a different move or sequence of moves on each cube.
+
+        Args:
+            moves (List[str]): For each cube in the batch, moves in Rubik's
+                cube notation. Use an empty string to leave the cube as it is.
+
+        Returns:
+            CubeBatch: self
+        """
+        assert len(moves) == len(self)
+        if len(moves) == 0:
+            return self
+
+        # compile every distinct sequence only once
+        distinct, inverse = np.unique(np.array(moves, dtype=object), return_inverse=True)
+        perms = np.stack([compile_sequence(self.n, m)[0] for m in distinct])
+        self.flat = np.take_along_axis(self.flat, perms[inverse], axis=1)
+        return self
+
+    def is_solved(self) -> np.ndarray:
+        """Checks which cubes are solved.
+
+        Returns:
+            np.ndarray: Boolean mask, True for every solved cube.
+        """
+        faces = self.flat.reshape(len(self), 6, self.n * self.n)
+        return (faces == faces[:, :, :1]).all(axis=(1, 2))
+
+    def state_hashes(self) -> np.ndarray:
+        """Returns hashes of all the cube states.
+
+        Returns:
+            np.ndarray: int64 array, the same values as Cube.state_hash
+                returns.
+        """
+        slots = np.arange(6 * self.n * self.n) * 6
+        return np.bitwise_xor.reduce(zobrist_keys(self.n)[slots + self.flat], axis=1)
+
+
+@lru_cache(maxsize=None)
+def compile_move(n: int, move: int) -> np.ndarray:
+    """Compiles a single move into an index permutation of Cube.flat.
+
+    The permutation is obtained by performing the move with the view based
+    engine on a cube, whose stickers are their own indices. Compiled moves
+    are cached, so each distinct move is compiled only once for each size.
+
+    Args:
+        n (int): Cube size.
+        move (int): Move code returned by encode_move.
+
+    Returns:
+        np.ndarray: Read-only permutation perm, performing the move is
+            equivalent to flat = flat[perm].
+    """
+    cube = Cube(n, engine=Engine.VIEWS)
+    cube._flat = np.arange(6 * n * n)
+    cube._faces = cube._flat.reshape(6, n, n)
+    cube._single_move(Move.from_code(move))
+
+    perm = cube._flat
+    perm.flags.writeable = False
+    return perm
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(n: int) -> np.ndarray:
+    """Returns random keys for Zobrist hashing of n x n cube states.
+
+    The keys are generated from a fixed seed, so they are the same in every
+    process.
+
+    Args:
+        n (int): Cube size.
+
+    Returns:
+        np.ndarray: Read-only int64 array, the key of color c at sticker
+            position i is at index 6 * i + c.
+    """
+    rng = np.random.default_rng([ZOBRIST_SEED, n])
+    keys = rng.integers(
+        np.iinfo(np.int64).min,
+        np.iinfo(np.int64).max,
+        size=6 * n * n * 6,
+        dtype=np.int64,
+        endpoint=True
+    )
+    keys.flags.writeable = False
+    return keys
+
+
+class PermutationUpdates(NamedTuple):
+    # stickers moved to another face - their indices before the permutation
+    # and color count offsets (6 * face index) of their faces before and
+    # after the permutation
+    transfer_src: np.ndarray
+    offsets_from: np.ndarray
+    offsets_to: np.ndarray
+    # stickers that change places - their indices i after the permutation,
+    # their indices perm[i] before the permutation and 6 * i
+    touched: np.ndarray
+    touched_src: np.ndarray
+    touched_slots: np.ndarray
+
+
+def permutation_updates(n: int, perm: np.ndarray) -> PermutationUpdates:
+    """Computes the data needed to update the tracked properties of a cube
+    (color counts and hash) when a permutation is applied.
+
+    Args:
+        n (int): Cube size.
+        perm (np.ndarray): Index permutation of Cube.flat.
+
+    Returns:
+        PermutationUpdates: Indices of the affected stickers.
+    """
+    slots = np.arange(6 * n * n)
+    faces = slots // (n * n)
+
+    dst = np.flatnonzero(faces != faces[perm])
+    transfer_src = perm[dst]
+
+    touched = np.flatnonzero(slots != perm)
+
+    return PermutationUpdates(
+        transfer_src=transfer_src,
+        offsets_from=faces[transfer_src] * 6,
+        offsets_to=faces[dst] * 6,
+        touched=touched,
+        touched_src=perm[touched],
+        touched_slots=touched * 6
+    )
+
+
+@lru_cache(maxsize=None)
+def move_updates(n: int, move: int) -> PermutationUpdates:
+    """Returns cached permutation_updates of a single move.
+
+    Args:
+        n (int): Cube size.
+        move (int): Move code returned by encode_move.
+
+    Returns:
+        PermutationUpdates: Indices of the stickers affected by the move.
+    """
+    return permutation_updates(n, compile_move(n, move))
+
+
+def is_rotation(move: int) -> bool:
+    """Checks whether a move is a whole cube rotation (x, y or z).
+
+    Args:
+        move (int): Move code returned by encode_move.
+
+    Returns:
+        bool: True for rotations.
+    """
+    return (move & FACE_MASK) >= FIRST_ROTATION_FACE
+
+
+class Orientations(NamedTuple):
+    # perms[o] rotates a cube from the default orientation to orientation o
+    perms: np.ndarray
+    # inverses[o] is the inverse permutation of perms[o]
+    inverses: np.ndarray
+    # maps perms[o].tobytes() to o
+    index: Dict[bytes, int]
+    # perms[o][perms[p]] is perms[compose[o, p]]
+    compose: np.ndarray
+
+
+@lru_cache(maxsize=None)
+def orientations(n: int) -> Orientations:
+    """Enumerates all 24 orientations of a n x n cube as permutations.
+
+    Orientation 0 is the default orientation (no rotation).
+
+    Args:
+        n (int): Cube size.
+
+    Returns:
+        Orientations: Permutations of the orientations and their inverses.
+    """
+    identity = np.arange(6 * n * n)
+    perms = [identity]
+    index = {identity.tobytes(): 0}
+
+    # every orientation can be reached by a sequence of x and y rotations
+    for perm in perms:
+        for rotation in ["x", "y"]:
+            rotated = perm[compile_move(n, encode_move(rotation))]
+            if rotated.tobytes() not in index:
+                index[rotated.tobytes()] = len(perms)
+                perms.append(rotated)
+
+    assert len(perms) == 24
+
+    perms_array = np.stack(perms)
+    inverses = np.empty_like(perms_array)
+    np.put_along_axis(inverses, perms_array, identity[np.newaxis, :], axis=1)
+
+    compose = np.array([
+        [index[perms_array[o][perms_array[p]].tobytes()] for p in range(24)]
+        for o in range(24)
+    ])
+
+    perms_array.flags.writeable = False
+    inverses.flags.writeable = False
+    compose.flags.writeable = False
+    return Orientations(perms=perms_array, inverses=inverses, index=index, compose=compose)
+
+
+@lru_cache(maxsize=None)
+def rotate_orientation(n: int, orientation: int, move: int) -> int:
+    """Returns the orientation after a whole cube rotation.
+
+    Args:
+        n (int): Cube size.
+        orientation (int): Orientation before the rotation.
+        move (int): Code of a rotation (x, y' z2, ...).
+
+    Returns:
+        int: Orientation after the rotation.
+    """
+    tables = orientations(n)
+    rotated = tables.perms[orientation][compile_move(n, move)]
+    return tables.index[rotated.tobytes()]
+
+
+@lru_cache(maxsize=None)
+def oriented_move(n: int, orientation: int, move: int) -> Tuple[np.ndarray, PermutationUpdates]:
+    """Compiles a move performed on a cube with pending rotation.
+
+    Performing a move m on a cube in orientation o is the same as performing
+    the conjugate o m o^-1 on the stickers as they are stored.
+
+    Args:
+        n (int): Cube size.
+        orientation (int): Orientation of the cube.
+        move (int): Move code returned by encode_move.
+
+    Returns:
+        Tuple[np.ndarray, PermutationUpdates]: Permutation of the stored
+            stickers and the data for updating the tracked properties.
+    """
+    if orientation == 0:
+        return compile_move(n, move), move_updates(n, move)
+
+    tables = orientations(n)
+    perm = tables.perms[orientation][compile_move(n, move)][tables.inverses[orientation]]
+    perm.flags.writeable = False
+    return perm, permutation_updates(n, perm)
+
+
+@lru_cache(maxsize=None)
+def oriented_zobrist_keys(n: int, orientation: int) -> np.ndarray:
+    """Returns Zobrist keys for stickers stored with a pending rotation.
+
+    Hashing the stored stickers with these keys gives the same hash as
+    hashing the rotated state with zobrist_keys.
+
+    Args:
+        n (int): Cube size.
+        orientation (int): Orientation of the cube.
+
+    Returns:
+        np.ndarray: Read-only int64 array indexed as zobrist_keys.
+    """
+    if orientation == 0:
+        return zobrist_keys(n)
+
+    inverse = orientations(n).inverses[orientation]
+    keys = zobrist_keys(n).reshape(-1, 6)[inverse].reshape(-1)
+    keys.flags.writeable = False
+    return keys
+
+
+@lru_cache(maxsize=None)
+def all_oriented_zobrist_keys(n: int) -> np.ndarray:
+    """Returns Zobrist keys of all the orientations side by side.
+
+    Args:
+        n (int): Cube size.
+
+    Returns:
+        np.ndarray: Read-only int64 array, row 6 * i + c holds the keys of
+            color c at sticker position i, column o is oriented_zobrist_keys
+            of orientation o.
+    """
+    keys = np.column_stack([oriented_zobrist_keys(n, o) for o in range(24)])
+    keys.flags.writeable = False
+    return keys
+
+
+@lru_cache(maxsize=1024)
+def _compile_sequence(n: int, codes: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    perm = np.arange(6 * n * n)
+    for code in np.frombuffer(codes, dtype=np.uint32).tolist():
+        perm = perm[compile_move(n, code)]
+
+    inverse = np.empty_like(perm)
+    inverse[perm] = np.arange(perm.size)
+
+    perm.flags.writeable = False
+    inverse.flags.writeable = False
+    return perm, inverse
+
+
+def compile_sequence(n: int, moves_str: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Composes a sequence of moves into a single index permutation.
+
+    Results are cached by (n, move codes), so neither whitespace nor the
+    spelling of the moves (r or Rw) matter.
+
+    Args:
+        n (int): Cube size.
+        moves_str (str): Moves in Rubik's cube notation separated by
+            whitespace.
+
+    Raises:
+        ValueError: If some move is invalid or not possible on a n x n cube.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Read-only permutation of the sequence
+            and its inverse. Performing the sequence is equivalent to
+            flat = flat[perm], flat = flat[inverse] undoes it.
+    """
+    return _compile_sequence(n, tokenize(moves_str, n)["code"].tobytes())
+
+
+# WCA scramblers - the JavaScript scramblers are only loaded when they are
+# first used, so that importing this module stays fast
 scrambler_dispatch = {
-    2: scrambler222,
-    3: scrambler333,
-    4: scrambler444,
-    5: scrambler555,
-    6: scrambler666,
-    7: scrambler777
+    2: "pyTwistyScrambler.scrambler222",
+    3: "pyTwistyScrambler.scrambler333",
+    4: "pyTwistyScrambler.scrambler444",
+    5: "pyTwistyScrambler.scrambler555",
+    6: "pyTwistyScrambler.scrambler666",
+    7: "pyTwistyScrambler.scrambler777"
 }
 
+
+@lru_cache(maxsize=None)
+def get_scrambler(size: int):
+    """Loads the WCA scrambler of given size.
+
+    Args:
+        size (int): Cube size, one of the keys of scrambler_dispatch.
+
+    Returns:
+        module: pyTwistyScrambler module with get_WCA_scramble function.
+    """
+    return importlib.import_module(scrambler_dispatch[size])
+
+
 def generate_scramble(size: int) -> str:
     """Generates scramble.
 
@@ -490,19 +1428,124 @@ def generate_scramble(size: int) -> str:
         str: Scramble in Rubik's cube notation
     """
     if (size <= 7):
-        return scrambler_dispatch[size].get_WCA_scramble()
+        return get_scrambler(size).get_WCA_scramble()
+
+    scrambles, _ = generate_seeded_scrambles(size, [random_seed()])
+    return scrambles[0]
 
-    # generate moves that are possible on a size x size cube
-    # note that the list will not contain all the possible moves, but this is
-    # not necessary for this usage
-    possible_moves: List[str] = []
 
+# version of the seeded scramble generator - a stored (version, seed) pair
+# has to give the same scramble forever, so any change to the generator
+# needs a new version
+SEEDED_SCRAMBLE_VERSION = 1
+SEEDED_SCRAMBLE_LENGTH = 120
+
+
+def random_seed() -> int:
+    """Returns a random seed for generate_seeded_scrambles, which fits into
+    a signed 64-bit database column."""
+    return getrandbits(63)
+
+
+@lru_cache(maxsize=None)
+def seeded_scramble_moves(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the moves, that seeded scrambles consist of.
+
+    Note that the list does not contain all the possible moves, but this is
+    not necessary for this usage.
+
+    Args:
+        size (int): Cube size
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Move strings (object array) and
+            a (moves, 6 * size * size) array of their compiled permutations.
+    """
+    moves: List[str] = []
     for face in "UFRBLD":
         for layer_index in range(1, floor(size / 2) + 1):
             for dir in ["", "'", "2"]:
                 index = layer_index if layer_index > 1 else ""
-                possible_moves.append(f"{index}{face}{dir}")
+                moves.append(f"{index}{face}{dir}")
+
+    perms = np.stack([compile_move(size, encode_move(move)) for move in moves])
+    perms.flags.writeable = False
+    return np.array(moves, dtype=object), perms
+
+
+def generate_seeded_scrambles(
+    size: int,
+    seeds: List[int],
+    version: int = SEEDED_SCRAMBLE_VERSION
+) -> Tuple[List[str], CubeBatch]:
+    """Generates random move scrambles determined by their seeds.
+
+    The scrambles are generated together, their permutations are composed
+    for all of them at once.
+
+    Args:
+        size (int): Cube size
+        seeds (List[int]): Non-negative seeds, one for each scramble.
+        version (int, optional): Generator version. Defaults to
+            SEEDED_SCRAMBLE_VERSION.
+
+    Raises:
+        ValueError: If the version is not known.
+
+    Returns:
+        Tuple[List[str], CubeBatch]: Scrambles in Rubik's cube notation and
+            a batch of the scrambled cubes.
+    """
+    if version != 1:
+        raise ValueError(f"unknown scramble generator version {version}")
+
+    moves, perms = seeded_scramble_moves(size)
+    chosen = np.empty((len(seeds), SEEDED_SCRAMBLE_LENGTH), dtype=np.intp)
+    for row, seed in zip(chosen, seeds):
+        rng = np.random.default_rng([version, size, seed])
+        row[:] = rng.integers(len(moves), size=SEEDED_SCRAMBLE_LENGTH)
+
+    # compose the permutations of the i-th moves of all the scrambles
+    scrambles = np.broadcast_to(np.arange(6 * size * size), (len(seeds), 6 * size * size))
+    for step in range(SEEDED_SCRAMBLE_LENGTH):
+        scrambles = np.take_along_axis(scrambles, perms[chosen[:, step]], axis=1)
+
+    batch = CubeBatch(size, [])
+    batch.flat = np.repeat(np.arange(6, dtype=np.uint8), size * size)[scrambles]
+
+    return [" ".join(row) for row in moves[chosen]], batch
+
 
-    scramble_size = 120
-    scramble_moves = choices(possible_moves, k=scramble_size)
-    return ' '.join(scramble_moves)
\ No newline at end of file
+@lru_cache(maxsize=256)
+def seeded_scramble(size: int, version: int, seed: int) -> Tuple[str, bytes]:
+    """Regenerates a stored seeded scramble. Results are cached.
+
+    Args:
+        size (int): Cube size
+        version (int): Generator version.
+        seed (int): Seed of the scramble.
+
+    Returns:
+        Tuple[str, bytes]: Scramble in Rubik's cube notation and serialized
+            state of the scrambled cube.
+    """
+    scrambles, batch = generate_seeded_scrambles(size, [seed], version)
+    return scrambles[0], batch.serialize()[0]
+
+
+def make_scramble(size: int) -> Tuple[str, bytes, int]:
+    """Generates a scramble together with the scrambled cube state.
+
+    This is the job performed by the scramble pool workers, so it only
+    depends on this module.
+
+    Args:
+        size (int): Cube size
+
+    Returns:
+        Tuple[str, bytes, int]: Scramble in Rubik's cube notation, serialized
+            state of the scrambled cube and its Cube.state_hash.
+    """
+    scramble_string = generate_scramble(size)
+    cube = Cube(size).apply_sequence(scramble_string)
+    return scramble_string, cube.serialize(), cube.state_hash()
@@ -0,0 +1,173 @@
+"""Micro benchmarks of the cube engine.
+
+Run with:
+    python cube_benchmarks.py
+"""
+import timeit
+from random import Random
+from typing import Callable, List
+
+from cube import Cube, Engine, Move, compile_move, encode_move, move_updates, is_rotation, tokenize
+from cube_tests import wr7x7scramble, wr7x7solve
+
+
+def random_moves(n: int, count: int, seed: int = 0) -> List[str]:
+    """Generates random outer and inner layer moves for a n x n cube.
+
+    Args:
+        n (int): Cube size.
+        count (int): Number of moves.
+        seed (int, optional): Seed of the generator. Defaults to 0.
+
+    Returns:
+        List[str]: Moves in Rubik's cube notation.
+    """
+    rng = Random(seed)
+    moves = []
+    for _ in range(count):
+        index = rng.randint(1, max(n // 2, 1))
+        prefix = str(index) if index > 1 else ""
+        moves.append(prefix + rng.choice("UFRBLD") + rng.choice(["", "'", "2"]))
+    return moves
+
+
+def measure(fun: Callable[[], object], number: int) -> float:
+    """Returns the best time of a single call in microseconds."""
+    return min(timeit.repeat(fun, number=number, repeat=5)) / number * 1e6
+
+
+def benchmark_is_solved() -> None:
+    """Compares the incremental solved check with scanning all the stickers.
+
+    The scan is the slowest for a solved cube (all faces have to be checked),
+    the incremental check does not depend on the state. The "move + check"
+    column replays random moves and checks the cube after each one, the moves
+    update the color counters in both cases.
+    """
+    print("is_solved: incremental counters vs full scan [us per call]")
+    print(f"{'size':>4} {'solved':>16} {'scrambled':>16} {'move + check':>22}")
+    for n in range(2, 11):
+        moves = random_moves(n, 200)
+        solved = Cube(n)
+        scrambled = Cube(n).move(" ".join(moves))
+
+        cube = Cube(n)
+
+        def replay(check: Callable[[Cube], bool]):
+            for move in moves:
+                cube.move(move)
+                check(cube)
+
+        row = [
+            (measure(solved.is_solved, 2000), measure(solved._scan_solved, 2000)),
+            (measure(scrambled.is_solved, 2000), measure(scrambled._scan_solved, 2000)),
+            (
+                measure(lambda: replay(Cube.is_solved), 5) / len(moves),
+                measure(lambda: replay(Cube._scan_solved), 5) / len(moves)
+            ),
+        ]
+        print(f"{n:>4}" + "".join(
+            f" {incremental:>7.2f} vs {scan:>6.2f}" for incremental, scan in row
+        ))
+
+
+def with_rotations(moves: List[str], seed: int = 0) -> List[str]:
+    """Inserts a random whole cube rotation after every move."""
+    rng = Random(seed)
+    rotated = []
+    for move in moves:
+        rotated.append(move)
+        rotated.append(rng.choice("xyz") + rng.choice(["", "'", "2"]))
+    return rotated
+
+
+def benchmark_rotations() -> None:
+    """Compares the lazy orientation frame with moving all the stickers
+    on every whole cube rotation (how rotations were performed before the
+    frame was introduced).
+    """
+    def eager(n: int, moves: List[str]) -> Cube:
+        cube = Cube(n)
+        for move in moves:
+            code = encode_move(move)
+            if is_rotation(code):
+                cube._apply_permutation(compile_move(n, code), move_updates(n, code))
+            else:
+                cube.move(move)
+        cube.serialize()
+        return cube
+
+    def lazy(n: int, moves: List[str]) -> Cube:
+        cube = Cube(n)
+        for move in moves:
+            cube.move(move)
+        cube.serialize()
+        return cube
+
+    sequences = [("WR 7x7", 7, (wr7x7scramble + " " + wr7x7solve).split())]
+    for n in [3, 5, 7, 10]:
+        sequences.append((f"{n}x{n} rotations", n, with_rotations(random_moves(n, 200))))
+
+    print("whole cube rotations: lazy frame vs moving stickers [us per move]")
+    for name, n, moves in sequences:
+        rotations = sum(is_rotation(encode_move(move)) for move in moves)
+        assert eager(n, moves) == lazy(n, moves)
+        print(
+            f"{name:>16} ({rotations:>4}/{len(moves):>4} rotations)"
+            f" {measure(lambda: lazy(n, moves), 5) / len(moves):>7.2f}"
+            f" vs {measure(lambda: eager(n, moves), 5) / len(moves):>6.2f}"
+        )
+
+
+def benchmark_tokenize() -> None:
+    """Compares tokenizing a whole move sequence (move codes and the turned
+    layers, checked for the cube size) with parsing the moves into Move
+    objects one by one.
+    """
+    moves = wr7x7scramble + " " + wr7x7solve
+    tokens = moves.split()
+    assert tokenize(moves, 7)["code"].tolist() == [encode_move(move) for move in tokens]
+
+    def parse():
+        for move_str in tokens:
+            move = Move.from_string(move_str)
+            if not move.is_rotation:
+                move.get_layer_indices(7)
+
+    print(f"tokenize: WR 7x7 ({len(tokens)} moves) vs Move objects [us per sequence]")
+    print(f"{measure(lambda: tokenize(moves, 7), 20):>10.0f} vs {measure(parse, 20):>6.0f}")
+
+
+def benchmark_replay() -> None:
+    """Replays the WR 7x7 solve with one Cube.move call per move, as in
+    benchmark.ipynb and as moves arrive from the clients. Compares the table
+    engine with rotating the faces (Engine.VIEWS, how the moves were
+    performed before the tables were introduced).
+    """
+    moves = (wr7x7scramble + " " + wr7x7solve).split()
+
+    def replay(engine: Engine, check: bool, serialize: bool):
+        cube = Cube(7, engine=engine)
+        for move in moves:
+            cube.move(move)
+            if check:
+                cube.is_solved()
+            if serialize:
+                cube.serialize()
+
+    print(f"replay: WR 7x7 ({len(moves)} moves) move by move, table vs views engine [ms per replay]")
+    for name, check, serialize in [("moves", False, False), ("+ is_solved", True, False), ("+ serialize", True, True)]:
+        print(
+            f"{name:>12} {measure(lambda: replay(Engine.TABLE, check, serialize), 5) / 1000:>7.1f}"
+            f" vs {measure(lambda: replay(Engine.VIEWS, check, serialize), 5) / 1000:>6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_replay()
+    print()
+    benchmark_is_solved()
+    print()
+    benchmark_rotations()
+    print()
+    benchmark_tokenize()
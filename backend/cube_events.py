@@ -1,7 +1,15 @@
 from init import socketio, db
 from flask import copy_current_request_context
 from flask_login import login_required, current_user
-from model import SocketConnection, Lobby, CubeEntity, Solve, LobbyUserStatus, Race
+from model import Lobby, Solve, LobbyUserStatus, Race, get_live_cube, make_move
+from connections import connections, Connection
+from cube import Move, tokenize, is_rotation
+from camera_log import camera_log, CameraPosition
+from move_broadcast import move_broadcast
+from protocol import decode_camera
+from rate_limit import rate_limiter
+from live_cubes import live_cubes
+from transaction_hooks import registered
 from flask import request
 from datetime import datetime
 import time
@@ -53,85 +61,113 @@ def handle_lobby_solve_completed(solve: Solve, lobby: Lobby):
     db.session.commit()
 
 
-def handle_completed_solve(connection: SocketConnection, solve: Solve):
+def handle_completed_solve(connection: Connection, solve: Solve):
+    # the last move has to arrive before the end of the solve
+    if connection.together_room:
+        move_broadcast.flush(connection.together_room)
+    if connection.lobby_id:
+        move_broadcast.flush(connection.lobby_id)
+
     socketio.emit( "your_solve_completed",
         { "time": solve.time, "solve_id": solve.id },
         to=request.sid
     )
 
-    if connection.together_lobby:
+    if connection.together_room:
         socketio.emit(
             "together_solve_end",
             { "time": solve.time, "id": solve.id },
-            room=connection.together_lobby.get_room()
+            room=connection.together_room
         )
 
-    if connection.lobby:
-        handle_lobby_solve_completed(solve, connection.lobby)
+    if connection.lobby_id:
+        handle_lobby_solve_completed(solve, db.session.get(Lobby, connection.lobby_id))
 
 
 @socketio.on("move")
 @login_required
 def handle_move(data):
     now = datetime.now()
-    move_str: str = data["move"]
 
-    connection = SocketConnection.get(request.sid)
+    connection = connections.get(request.sid)
     if connection is None:
         return
 
-    solve = connection.cube.current_solve
+    # throttled moves are sent again by the client after the delay
+    limit = rate_limiter.acquire(request.sid, "move", live_cubes.get_size(connection.cube_id))
+    if not limit.allowed:
+        return { "status": "throttled", "retryAfter": limit.delay * 1000 }
+
+    # the cube and its current solve are kept in memory (see live_cubes.py)
+    live = get_live_cube(connection.cube_id)
 
-    if solve and solve.completed:
+    # reject invalid moves before changing anything
+    try:
+        [move] = tokenize(data["move"], live.cube.n)["code"].tolist()
+    except ValueError:
         return
+    move_str = Move.from_code(move).to_string()
+
+    current = live.current
 
-    if solve and now <= solve.solve_startdate and move_str not in ["x", "x'", "y", "y'", "z", "z'"]:
+    if current and current.completed:
         return
 
-    connection.cube.make_move(move_str, now)
+    # only rotations are allowed during inspection
+    if current and now <= current.solve_start and not is_rotation(move):
+        return
 
-    if connection.together_lobby:
-        socketio.emit(
-            "together_move",
-            { "move": move_str, "username": current_user.username},
-            room=connection.together_lobby.get_room()
-        )
-    elif connection.lobby:
-        socketio.emit(
-            "lobby_move",
-            { "username": current_user.username, "move": move_str },
-            room=connection.lobby_id,
-            skip_sid=request.sid
-        )
+    solve = make_move(connection.cube_id, live, move, now)
+    # stores the moves written by the move log (see move_log.py), most moves
+    # are only queued and the transaction ends with the event without a commit
+    if registered():
+        db.session.commit()
+
+    # moves are sent in batches, clients ignore their own lobby moves
+    if connection.together_room:
+        move_broadcast.add("together_moves", connection.together_room, current_user.username, move_str, now)
+    elif connection.lobby_id:
+        move_broadcast.add("lobby_moves", connection.lobby_id, current_user.username, move_str, now)
 
-    if solve and solve.completed:
+    if solve:
         handle_completed_solve(connection, solve)
 
+    # the bucket is running low, the client paces its next moves
+    return { "status": "ok", "delay": limit.delay * 1000 }
+
 
 @socketio.on("camera")
 def handle_camera(data):
-    position = data["position"]
-    connection = SocketConnection.get(request.sid)
+    try:
+        position = decode_camera(data)
+    except ValueError:
+        return
+    connection = connections.get(request.sid)
     if not connection:
         return
 
-    cube_entity: CubeEntity = connection.cube
+    limit = rate_limiter.acquire(request.sid, "camera")
+    if not limit.allowed:
+        # positions are not queued, the client stops sending them for a while
+        if limit.notify:
+            socketio.emit(
+                "rate_limited",
+                { "event": "camera", "retryAfter": limit.delay * 1000 },
+                to=request.sid
+            )
+        return
 
-    solve: Solve = cube_entity.current_solve
-    if solve:
-        solve.add_camera_change(position)
+    # positions are coalesced and broadcast by camera_log
+    camera = CameraPosition(position, datetime.now(), current_user.username)
 
-    if connection.together_lobby:
-        socketio.emit(
-            "together_camera",
-            { "position": position, "username": current_user.username},
-            room=connection.together_lobby.get_room()
-        )
+    # the session is kept with the cube until a solve or a session starts
+    # or ends (see live_cubes.py)
+    current = get_live_cube(connection.cube_id).current
+    if current:
+        camera.session_id = current.session_id
+        camera.session_start = current.session_start
 
-    if connection.lobby:
-        socketio.emit(
-            "lobby_camera",
-            { "username": current_user.username, "position": position },
-            room=connection.lobby.id,
-            skip_sid=request.sid
-        )
\ No newline at end of file
+    camera.together_room = connection.together_room
+    camera.lobby_id = connection.lobby_id
+
+    camera_log.add(request.sid, camera)
\ No newline at end of file
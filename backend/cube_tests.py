@@ -1,5 +1,7 @@
 import unittest
-from cube import Move, Cube, Direction, Face
+import io
+from contextlib import redirect_stdout
+from cube import Move, Cube, Direction, Face, Engine, CubeBatch, compile_move, compile_sequence, state_to_string, encode_move, tokenize, state_size, generate_seeded_scrambles, seeded_scramble
 import numpy as np
 
 # reconstruction of
@@ -216,6 +218,242 @@ class TestClass(unittest.TestCase):
         c.move(wr7x7solve)
         self.assertTrue(c.is_solved())
 
+    def test_engines_equal(self):
+        table = Cube(7).move(wr7x7scramble)
+        views = Cube(7, engine=Engine.VIEWS).move(wr7x7scramble)
+        self.assertTrue(np.array_equal(table.flat, views.flat))
+
+        for n in range(2, 8):
+            for move in ["U", "F'", "R2", "3Bw", "l'", "D2", "M", "e", "x", "y'", "z2"]:
+                if (n < 4 and move == "3Bw") or (n < 3 and move in "Me"):
+                    continue
+                table = Cube(n).move(wr7x7scramble if n == 7 else "").move(move)
+                views = Cube(n, engine=Engine.VIEWS).move(wr7x7scramble if n == 7 else "").move(move)
+                self.assertTrue(np.array_equal(table.flat, views.flat))
+
+    def test_compiled_move(self):
+        perm = compile_move(3, encode_move("R"))
+        self.assertIs(perm, compile_move(3, encode_move("R")))
+        self.assertFalse(perm.flags.writeable)
+        # R is a permutation of order 4
+        self.assertTrue(np.array_equal(perm[perm][perm][perm], np.arange(54)))
+        self.assertTrue(np.array_equal(perm[compile_move(3, encode_move("R'"))], np.arange(54)))
+
+    def test_compiled_sequence(self):
+        perm, inverse = compile_sequence(7, wr7x7scramble)
+        self.assertIs(perm, compile_sequence(7, "  " + wr7x7scramble)[0])
+
+        c = Cube(7).apply_sequence(wr7x7scramble)
+        self.assertTrue(np.array_equal(c.flat, Cube(7).move(wr7x7scramble).flat))
+        self.assertTrue(np.array_equal(perm[inverse], np.arange(294)))
+
+        c.apply_sequence(wr7x7solve)
+        self.assertTrue(c.is_solved())
+
+        c = Cube(7).apply_sequence(wr7x7scramble, inverse=True)
+        c.apply_sequence(wr7x7scramble)
+        self.assertTrue(np.array_equal(c.flat, Cube(7).flat))
+
+    def test_batch(self):
+        scrambled = Cube(7).move(wr7x7scramble).serialize()
+        batch = CubeBatch(7, [None, scrambled, scrambled])
+        self.assertEqual(batch.is_solved().tolist(), [True, False, False])
+
+        batch.move_each(["R U", wr7x7solve, ""])
+        self.assertEqual(batch.is_solved().tolist(), [False, True, False])
+        self.assertEqual(batch.get_cube(0).serialize(), Cube(7).move("R U").serialize())
+        self.assertEqual(batch.serialize()[2], scrambled)
+
+        batch.move_all("x y")
+        self.assertEqual(batch.is_solved().tolist(), [False, True, False])
+        self.assertEqual(batch.serialize()[0], Cube(7).move("R U x y").serialize())
+
+    def test_seeded_scrambles(self):
+        scrambles, batch = generate_seeded_scrambles(9, [0, 1, 2, 1])
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(scrambles[1], scrambles[3])
+        self.assertNotEqual(scrambles[0], scrambles[1])
+        for i, scramble in enumerate(scrambles):
+            self.assertEqual(len(scramble.split()), 120)
+            self.assertEqual(batch.get_cube(i), Cube(9).move(scramble))
+
+        # the same seed gives the same scramble in every call
+        self.assertEqual(seeded_scramble(9, 1, 2), (scrambles[2], batch.serialize()[2]))
+        self.assertNotEqual(seeded_scramble(10, 1, 2)[0], scrambles[2])
+        # stored seeds have to give the same scrambles in future versions
+        self.assertTrue(scrambles[0].startswith("3F' L 3D2 B 2D' R2 3F2 3R F2 4U"))
+        with self.assertRaises(ValueError):
+            generate_seeded_scrambles(9, [0], version=0)
+
+    def test_serialize(self):
+        for n in range(2, 11):
+            c = Cube(n).move("R U' F2")
+            state = c.serialize()
+            # 2 byte header + 3 bits per sticker
+            self.assertEqual(len(state), 2 + (3 * 6 * n * n + 7) // 8)
+            self.assertEqual(len(state), state_size(n))
+            self.assertTrue(np.array_equal(Cube(n, state).flat, c.flat))
+
+        c = Cube(7).move(wr7x7scramble)
+        self.assertTrue(np.array_equal(Cube(7).move(wr7x7scramble).flat, c.flat))
+        c2 = Cube(7)
+        c2.deserialize(c.serialize())
+        self.assertTrue(np.array_equal(c2.flat, c.flat))
+
+        # the kept state is packed again after every change
+        for moves in ["R", "x", "y' Lw", "4Rw2"]:
+            for engine in Engine:
+                c = Cube(7, engine=engine).move(wr7x7scramble)
+                c.serialize()
+                c.move(moves)
+                self.assertEqual(c.serialize(), Cube(7).move(f"{wr7x7scramble} {moves}").serialize())
+        c.serialize()
+        c.deserialize(Cube(7).serialize())
+        self.assertEqual(c.serialize(), Cube(7).serialize())
+        c.apply_sequence("R U")
+        self.assertEqual(c.serialize(), Cube(7).move("R U").serialize())
+
+    def test_legacy_state(self):
+        c = Cube(3).move("R U")
+        legacy = c.to_string().encode("UTF-8")
+        self.assertEqual(c.to_string()[:12], "WWWWWWGGGRRR")
+        self.assertEqual(Cube(3, legacy).serialize(), c.serialize())
+        self.assertEqual(state_to_string(legacy), c.to_string())
+        self.assertEqual(state_to_string(c.serialize()), c.to_string())
+        self.assertEqual(state_to_string(b""), "")
+
+    def test_solved_tracking(self):
+        c = Cube(7)
+        for move in (wr7x7scramble + " " + wr7x7solve).split():
+            c.move(move)
+            self.assertEqual(c.is_solved(), c._scan_solved())
+        self.assertTrue(c.is_solved())
+
+        c = Cube(4).move("x y' z2 Rw U")
+        self.assertFalse(c.is_solved())
+        c.move("U' Rw'")
+        self.assertTrue(c.is_solved())
+
+        c.deserialize(Cube(4).move("R").serialize())
+        self.assertFalse(c.is_solved())
+        c.apply_sequence("R'")
+        self.assertTrue(c.is_solved())
+
+        c = Cube(5).apply_sequence("R U F' 2L Dw B2 x")
+        self.assertTrue(np.array_equal(c.face_colors, Cube(5, c.serialize()).face_colors))
+
+    def test_hash(self):
+        c = Cube(7)
+        for move in wr7x7scramble.split():
+            c.move(move)
+        self.assertEqual(c.state_hash(), Cube(7, c.serialize()).state_hash())
+        self.assertNotEqual(c.state_hash(), Cube(7).state_hash())
+
+        c.apply_sequence(wr7x7solve)
+        self.assertNotEqual(c.state_hash(), Cube(7).state_hash())
+        c.apply_sequence(wr7x7solve, inverse=True)
+        self.assertEqual(c.state_hash(), Cube(7).move(wr7x7scramble).state_hash())
+
+        self.assertEqual(Cube(7).move("4Rw 3Lw'"), Cube(7).move("x"))
+        self.assertEqual(Cube(7).move("4Rw 3Lw'").state_hash(), Cube(7).move("x").state_hash())
+        self.assertNotEqual(Cube(7).move("R"), Cube(7).move("x"))
+
+        # cubes are mutable, sets and dictionaries are keyed by the state hash
+        with self.assertRaises(TypeError):
+            hash(Cube(3))
+        hashes = {cube.state_hash() for cube in [Cube(7).move("4Rw 3Lw'"), Cube(7).move("x"), Cube(7)]}
+        self.assertEqual(len(hashes), 2)
+
+        # the hash stays valid under rotations
+        c = Cube(5).move("R U x y'")
+        for moves in ["F", "z2", "Lw' y", "x'"]:
+            c.move(moves)
+            self.assertEqual(c.state_hash(), Cube(5, c.serialize()).state_hash())
+        c.move("R")
+        self.assertEqual(c.state_hash(), Cube(5, c.serialize()).state_hash())
+
+        batch = CubeBatch(7, [None, Cube(7).move("R").serialize()])
+        self.assertEqual(
+            batch.state_hashes().tolist(),
+            [Cube(7).state_hash(), Cube(7).move("R").state_hash()]
+        )
+
+    def test_orientation_frame(self):
+        table = Cube(7).move(wr7x7scramble)
+        views = Cube(7, engine=Engine.VIEWS).move(wr7x7scramble)
+        for i, move in enumerate(wr7x7solve.split()):
+            table.move(move)
+            views.move(move)
+            self.assertEqual(table.is_solved(), views.is_solved())
+            if i % 10 == 0:
+                self.assertEqual(table.state_hash(), views.state_hash())
+        self.assertTrue(np.array_equal(table.flat, views.flat))
+
+        c = Cube(4).move("x y R z' U2 y")
+        self.assertNotEqual(c._orientation, 0)
+        state = c.serialize()
+        self.assertEqual(c._orientation, 0)
+        self.assertEqual(state, Cube(4, engine=Engine.VIEWS).move("x y R z' U2 y").serialize())
+
+        # rotations do not change whether the cube is solved
+        c = Cube(5).move("x y z")
+        self.assertTrue(c.is_solved())
+        self.assertEqual(c, Cube(5).move("3Rw 2Lw' Uw 3Dw' Fw 3Bw'"))
+
+    def test_pprint_rotation(self):
+        def printed(cube: Cube) -> str:
+            out = io.StringIO()
+            with redirect_stdout(out):
+                cube.pprint()
+            return out.getvalue()
+
+        for moves in ["x", "x y R z' U2 y", wr7x7scramble + " z y2"]:
+            table = Cube(7).move(moves)
+            views = Cube(7, engine=Engine.VIEWS).move(moves)
+            self.assertEqual(printed(table), printed(views))
+        self.assertNotEqual(printed(Cube(3).move("x")), printed(Cube(3)))
+
+    def test_move_codes(self):
+        for move_str in ["R", "U'", "3Rw2", "M'", "2M", "x", "y'", "z2", "Lw"]:
+            code = encode_move(move_str)
+            self.assertEqual(Move.from_code(code).to_string(), move_str)
+            self.assertEqual(Move.from_code(code).to_code(), code)
+        # different spellings of the same move
+        self.assertEqual(encode_move("r"), encode_move("Rw"))
+        self.assertEqual(encode_move("R2'"), encode_move("R2"))
+        self.assertEqual(encode_move("1R"), encode_move("R"))
+
+        for move_str in ["", "Q", "R3", "R'2", "0R", "3x", "xw", "Rw w", "R''"]:
+            with self.assertRaises(ValueError):
+                encode_move(move_str)
+
+    def test_tokenize(self):
+        moves = tokenize("R 3Bw' m E2 x", 5)
+        self.assertEqual(list(moves["face"]), [2, 3, 6, 8, 9])
+        self.assertEqual(list(moves["dir"]), [1, -1, 1, 2, 1])
+        self.assertEqual(list(moves["wide"]), [False, True, True, False, False])
+        self.assertEqual(list(moves["first"]), [0, 2, 1, 2, 0])
+        self.assertEqual(list(moves["last"]), [0, 4, 3, 2, 4])
+
+        # layer ranges agree with Move.get_layer_indices
+        for n in [3, 4, 7]:
+            moves = wr7x7solve.split() if n == 7 else ["U", "2F'", "Rw", "3Bw2", "l", "D", "M", "e"]
+            for move_str, token in zip(moves, tokenize(" ".join(moves), n)):
+                if move_str[0] in "xyz":
+                    continue
+                indices = Move.from_string(move_str).get_layer_indices(n)
+                self.assertEqual((token["first"], token["last"]), (min(indices), max(indices)))
+
+        self.assertEqual(len(tokenize("  ", 3)), 0)
+
+    def test_invalid_moves(self):
+        for n, moves in [(3, "R U 4R"), (2, "R M"), (3, "R U F?"), (4, "5Rw"), (3, "4R"), (2, "M"), (3, "F?")]:
+            c = Cube(n)
+            with self.assertRaises(ValueError):
+                c.move(moves)
+            # no move was performed
+            self.assertEqual(c, Cube(n))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,39 @@
+"""Database of the tests.
+
+Test modules import DatabaseTestCase from here instead of setting up the
+database themselves. All of them share one in-memory sqlite database, the
+app is configured for it before the first test module imports the model.
+"""
+import unittest
+from sqlalchemy import event
+from init import app, db
+
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+app.config["SECRET_KEY"] = "test"
+
+db.init_app(app)
+
+# pysqlite starts transactions only before writes, so a savepoint opened
+# first would commit on release. Transactions are started here instead, as
+# on postgres.
+with app.app_context():
+    @event.listens_for(db.engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(db.engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+class DatabaseTestCase(unittest.TestCase):
+    # every test runs in an app context with the tables created
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
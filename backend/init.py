@@ -29,6 +29,64 @@ app.config['MAIL_USE_SSL'] = os.environ.get("MAIL_USE_SSL")
 app.config['MAIL_USERNAME'] = os.environ.get("MAIL_USERNAME")
 app.config['MAIL_PASSWORD'] = os.environ.get("MAIL_PASSWORD")
 
+# number of ready scrambles kept for each size, sizes that are pooled and
+# number of worker processes generating them (see scramble_pool.py)
+app.config['SCRAMBLE_POOL_DEPTH'] = int(os.environ.get("SCRAMBLE_POOL_DEPTH", 5))
+app.config['SCRAMBLE_POOL_SIZES'] = [
+    int(size) for size in os.environ.get("SCRAMBLE_POOL_SIZES", "2,3,4,5,6,7").split(",")
+]
+app.config['SCRAMBLE_POOL_WORKERS'] = int(os.environ.get("SCRAMBLE_POOL_WORKERS", 2))
+
+# seconds between writes of in-memory cube states to the database
+# (see live_cubes.py)
+app.config['LIVE_CUBE_FLUSH_INTERVAL'] = float(os.environ.get("LIVE_CUBE_FLUSH_INTERVAL", 2))
+
+# seconds between writes of queued solve moves (0 writes every move right
+# away) and the number of queued moves that triggers a write
+# (see move_log.py)
+app.config['MOVE_LOG_FLUSH_INTERVAL'] = float(os.environ.get("MOVE_LOG_FLUSH_INTERVAL", 1))
+app.config['MOVE_LOG_MAX_PENDING'] = int(os.environ.get("MOVE_LOG_MAX_PENDING", 500))
+# "rows" stores a solve_move row for every move, "blob" packs the moves of
+# each solving session into one value
+app.config['MOVE_LOG_FORMAT'] = os.environ.get("MOVE_LOG_FORMAT", "rows")
+app.config['MOVE_LOG_COMPRESS'] = os.environ.get("MOVE_LOG_COMPRESS", "True") == "True"
+
+# camera positions broadcast per second (0 broadcasts every position right
+# away), seconds between writes of camera paths and the distance tolerance
+# of path simplification (see camera_log.py)
+app.config['CAMERA_BROADCAST_RATE'] = float(os.environ.get("CAMERA_BROADCAST_RATE", 10))
+app.config['CAMERA_WRITE_INTERVAL'] = float(os.environ.get("CAMERA_WRITE_INTERVAL", 5))
+app.config['CAMERA_PATH_TOLERANCE'] = float(os.environ.get("CAMERA_PATH_TOLERANCE", 0.05))
+
+# maximum size of the cached replays of completed solves in bytes
+# (see replay_cache.py)
+app.config['REPLAY_CACHE_SIZE'] = int(os.environ.get("REPLAY_CACHE_SIZE", 64 * 1024 * 1024))
+
+# seconds a logged in user is cached for and the maximum number of cached
+# users (see user_cache.py)
+app.config['USER_CACHE_TTL'] = float(os.environ.get("USER_CACHE_TTL", 60))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get("USER_CACHE_SIZE", 10000))
+
+# frames of moves sent to each lobby room per second, 0 sends every move
+# right away (see move_broadcast.py)
+app.config['MOVE_BROADCAST_RATE'] = float(os.environ.get("MOVE_BROADCAST_RATE", 30))
+
+# rate limits of socket events of each connection as "tokens per second:bucket
+# size", moves can be limited for each cube size as "size=rate:burst,..."
+# (see rate_limit.py)
+def parse_rate_limit(limit: str):
+    rate, burst = limit.split(":")
+    return float(rate), float(burst)
+
+app.config['MOVE_RATE_LIMIT'] = parse_rate_limit(os.environ.get("MOVE_RATE_LIMIT", "25:50"))
+app.config['MOVE_RATE_LIMIT_SIZES'] = {
+    int(size): parse_rate_limit(limit)
+    for size, limit in (
+        entry.split("=") for entry in os.environ.get("MOVE_RATE_LIMIT_SIZES", "").split(",") if entry
+    )
+}
+app.config['CAMERA_RATE_LIMIT'] = parse_rate_limit(os.environ.get("CAMERA_RATE_LIMIT", "30:60"))
+
 mail = Mail(app)
 
 login_manager = LoginManager()
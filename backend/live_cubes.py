@@ -0,0 +1,209 @@
+"""In-memory states of the cubes that are being moved.
+
+Moves are performed on Cube objects kept in memory, the states are written
+to the database (CubeEntity.state and Solve.state) by a background task in
+regular intervals, when a solve is completed and when a user disconnects.
+If the server stops before the states are flushed, the state of a solve can
+be recovered from the move log (see Solve.get_current_state).
+
+The current solve of a cube and its ongoing session are kept with the cube,
+so the moves do not read the database. They are loaded again when a solve
+or a session starts or ends (see forget_solve).
+"""
+from init import app, socketio, logger
+from cube import Cube
+from transaction_hooks import after_transaction
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+
+@dataclass
+class CurrentSolve:
+    solve_id: int
+    # session that the moves and the camera are logged with
+    session_id: int
+    session_start: datetime
+    # end of the inspection, only rotations are allowed before it
+    solve_start: datetime
+    # number of written moves when the solve was loaded (see
+    # MoveLog.get_move_count)
+    move_count: int
+    completed: bool
+
+
+@dataclass
+class LiveCube:
+    cube: Cube
+    # whether the state changed since it was last flushed
+    dirty: bool = False
+    # solve that the moves belong to and its number of moves
+    solve_id: Optional[int] = None
+    solve_move_count: Optional[int] = None
+    # current solve of the cube (None if it has none), valid if loaded is set
+    current: Optional[CurrentSolve] = None
+    loaded: bool = False
+
+
+class LiveCubes:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.cubes: Dict[int, LiveCube] = {}
+        self.running = False
+
+    def get(self, cube_id: int, size: int, stored_state: bytes) -> Cube:
+        # load the cube from its stored state on first use
+        live = self.cubes.get(cube_id)
+        if live is None or live.cube.n != size:
+            live = self.cubes[cube_id] = LiveCube(Cube(size, stored_state))
+        return live.cube
+
+    def get_loaded(self, cube_id: int) -> Optional[LiveCube]:
+        # the cube with its current solve, None if they have to be loaded
+        # (see CubeEntity.load_live)
+        live = self.cubes.get(cube_id)
+        return live if live is not None and live.loaded else None
+
+    def load(
+        self,
+        cube_id: int,
+        size: int,
+        stored_state: bytes,
+        current: Optional[CurrentSolve]
+    ) -> LiveCube:
+        self.get(cube_id, size, stored_state)
+        live = self.cubes[cube_id]
+        live.current = current
+        live.loaded = True
+        return live
+
+    def forget_solve(self, cube_id: int) -> None:
+        # the current solve of the cube changed, it is loaded with the next
+        # move - again after the change is committed, a move could load the
+        # old one in the meantime
+        self._forget(cube_id)
+        after_transaction(
+            committed=lambda: self._forget(cube_id),
+            rolled_back=lambda: self._forget(cube_id)
+        )
+
+    def forget_sessions(self, solve_id: int) -> None:
+        # a session of the solve started or ended
+        for cube_id, live in list(self.cubes.items()):
+            if live.current is not None and live.current.solve_id == solve_id:
+                self.forget_solve(cube_id)
+
+    def _forget(self, cube_id: int) -> None:
+        live = self.cubes.get(cube_id)
+        if live is not None:
+            live.loaded = False
+
+    def get_state(self, cube_id: Optional[int]) -> Optional[bytes]:
+        live = self.cubes.get(cube_id)
+        return None if live is None else live.cube.serialize()
+
+    def get_size(self, cube_id: Optional[int]) -> Optional[int]:
+        live = self.cubes.get(cube_id)
+        return None if live is None else live.cube.n
+
+    def mark_dirty(
+        self,
+        cube_id: int,
+        solve_id: Optional[int] = None,
+        solve_move_count: Optional[int] = None
+    ) -> None:
+        live = self.cubes[cube_id]
+        # the state of the previous solve has to be stored first
+        if live.dirty and live.solve_id is not None and live.solve_id != solve_id:
+            self.flush(cube_id)
+
+        live.dirty = True
+        live.solve_id = solve_id
+        live.solve_move_count = solve_move_count
+
+    def flush(self, cube_id: int) -> None:
+        # store the state of one cube
+        self._persist([cube_id])
+
+    def flush_all(self) -> None:
+        self._persist(list(self.cubes))
+
+    def set(self, cube_id: int, size: int, state: bytes) -> None:
+        # the caller stores the new state in CubeEntity.stored_state, it is
+        # written with the caller's commit
+        live = self.cubes.get(cube_id)
+        if live is not None and live.dirty and live.solve_id is not None:
+            # the state of the previous solve is written with it
+            self._update_solve(live, live.cube.serialize())
+        self.cubes[cube_id] = LiveCube(Cube(size, state))
+
+    def discard(self, cube_id: int) -> None:
+        # forget the cube, it will be loaded from the database next time
+        self.flush(cube_id)
+        # keep it if it was moved while the state was stored
+        live = self.cubes.get(cube_id)
+        if live is not None and not live.dirty:
+            del self.cubes[cube_id]
+
+    def _persist(self, cube_ids) -> None:
+        # the model imports this module
+        from model import db, CubeEntity
+        from sqlalchemy import update
+
+        flushed = []
+        for cube_id in cube_ids:
+            live = self.cubes.get(cube_id)
+            if live is None or not live.dirty:
+                continue
+
+            # moves made while waiting for the database mark the cube dirty again
+            live.dirty = False
+            flushed.append(live)
+            state = live.cube.serialize()
+
+            db.session.execute(
+                update(CubeEntity)
+                .where(CubeEntity.id == cube_id)
+                .values({CubeEntity.stored_state: state})
+            )
+            if live.solve_id is not None:
+                self._update_solve(live, state)
+
+        if not flushed:
+            return
+        try:
+            db.session.commit()
+        except Exception:
+            # the states are stored with the next flush
+            db.session.rollback()
+            for live in flushed:
+                live.dirty = True
+            raise
+
+    def _update_solve(self, live: LiveCube, state: bytes) -> None:
+        from model import db, Solve
+        from sqlalchemy import update
+
+        db.session.execute(
+            update(Solve)
+            .where(Solve.id == live.solve_id)
+            .values({Solve.state: state, Solve.state_move_count: live.solve_move_count})
+        )
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self) -> None:
+        while True:
+            socketio.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    self.flush_all()
+            except Exception:
+                logger.exception("Flushing live cube states failed")
+
+
+live_cubes = LiveCubes(flush_interval=app.config["LIVE_CUBE_FLUSH_INTERVAL"])
@@ -0,0 +1,197 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+from database_testing import DatabaseTestCase
+from init import db
+from cube import Cube, encode_move
+from model import Scramble, Solve, CubeEntity, get_live_cube, make_move
+from live_cubes import live_cubes
+from move_log import move_log
+
+
+class TestClass(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        live_cubes.cubes.clear()
+        cube = CubeEntity(size=3, stored_state=Cube(3).serialize())
+        db.session.add(cube)
+        db.session.commit()
+        self.cube_id = cube.id
+
+    def tearDown(self):
+        live_cubes.cubes.clear()
+        super().tearDown()
+
+    def get_cube(self) -> CubeEntity:
+        return db.session.get(CubeEntity, self.cube_id)
+
+    def stored_state(self) -> bytes:
+        return db.session.scalar(select(CubeEntity.stored_state).where(CubeEntity.id == self.cube_id))
+
+    def start_solve(self, scramble: str) -> Solve:
+        state = Cube(3).move(scramble).serialize()
+        scramble = Scramble(cube_size=3, stored_scramble_string=scramble, stored_cube_state=state)
+        db.session.add(scramble)
+        db.session.commit()
+
+        start = datetime(2024, 1, 1)
+        solve = Solve(scramble_id=scramble.id, inspection_startdate=start, solve_startdate=start)
+        db.session.add(solve)
+        db.session.commit()
+        solve.start_session(start)
+
+        cube = self.get_cube()
+        cube.state = state
+        cube.current_solve = solve
+        db.session.commit()
+        return solve
+
+    def make_moves(self, moves: str) -> None:
+        start = datetime(2024, 1, 1)
+        for i, move in enumerate(moves.split()):
+            self.get_cube().make_move(encode_move(move), start + timedelta(seconds=i + 1))
+
+    def test_write_behind(self):
+        self.make_moves("R U")
+        moved = Cube(3).move("R U").serialize()
+
+        # the state is written later, reads see the moves right away
+        self.assertEqual(self.stored_state(), Cube(3).serialize())
+        self.assertEqual(self.get_cube().state, moved)
+
+        live_cubes.flush_all()
+        self.assertEqual(self.stored_state(), moved)
+        self.assertFalse(live_cubes.cubes[self.cube_id].dirty)
+
+    def test_flush_on_complete(self):
+        solve = self.start_solve("R U")
+        solve_id = solve.id
+        self.make_moves("U'")
+        self.assertEqual(self.stored_state(), Cube(3).move("R U").serialize())
+
+        # the solved state is stored without waiting for the flush
+        self.make_moves("R'")
+        move_log.flush()
+        self.assertEqual(self.stored_state(), Cube(3).serialize())
+        db.session.expire_all()
+        solve = db.session.get(Solve, solve_id)
+        self.assertTrue(solve.completed)
+        self.assertEqual(solve.state, Cube(3).serialize())
+        self.assertEqual(solve.state_move_count, 2)
+        self.assertIsNone(self.get_cube().current_solve)
+
+    def test_recovery(self):
+        solve = self.start_solve("R U F")
+        solve_id = solve.id
+        self.make_moves("F' D L2")
+        live_cubes.flush_all()
+        self.make_moves("B")
+        move_log.flush()
+
+        # the server stops before the last move is flushed
+        live_cubes.cubes.clear()
+        db.session.expire_all()
+        solve = db.session.get(Solve, solve_id)
+        self.assertEqual(solve.state_move_count, 3)
+        self.assertEqual(solve.get_current_state(), Cube(3).move("R U F F' D L2 B").serialize())
+
+    def test_failed_flush(self):
+        self.make_moves("R")
+        error = OperationalError("commit", {}, Exception("connection lost"))
+        with mock.patch.object(db.session, "commit", side_effect=error):
+            with self.assertRaises(OperationalError):
+                live_cubes.flush_all()
+
+        # the state is stored with the next flush
+        self.assertTrue(live_cubes.cubes[self.cube_id].dirty)
+        live_cubes.flush_all()
+        self.assertEqual(self.stored_state(), Cube(3).move("R").serialize())
+
+    def test_discard(self):
+        self.make_moves("R")
+        live_cubes.discard(self.cube_id)
+        self.assertNotIn(self.cube_id, live_cubes.cubes)
+        self.assertEqual(self.stored_state(), Cube(3).move("R").serialize())
+
+        # a move made while the state is stored keeps the cube
+        self.make_moves("U")
+        commit = db.session.commit
+
+        def commit_after_move():
+            live_cubes.mark_dirty(self.cube_id)
+            commit()
+
+        with mock.patch.object(db.session, "commit", side_effect=commit_after_move):
+            live_cubes.discard(self.cube_id)
+        self.assertTrue(live_cubes.cubes[self.cube_id].dirty)
+
+    def test_set_state(self):
+        solve = self.start_solve("R U")
+        solve_id = solve.id
+        self.make_moves("U'")
+        self.assertTrue(live_cubes.cubes[self.cube_id].dirty)
+
+        # the new state replaces the moved one right away, it is stored with
+        # the caller's commit
+        scrambled = Cube(3).move("F").serialize()
+        cube = self.get_cube()
+        with mock.patch.object(db.session, "commit") as commit:
+            cube.state = scrambled
+            self.assertEqual(cube.state, scrambled)
+            self.assertFalse(live_cubes.cubes[self.cube_id].dirty)
+            commit.assert_not_called()
+        db.session.commit()
+        move_log.flush()
+
+        self.assertEqual(self.stored_state(), scrambled)
+        db.session.expire_all()
+        solve = db.session.get(Solve, solve_id)
+        self.assertEqual(solve.state, Cube(3).move("R U U'").serialize())
+        self.assertEqual(solve.state_move_count, 1)
+
+        # moves are performed on the new state
+        self.get_cube().current_solve = None
+        db.session.commit()
+        self.make_moves("F'")
+        self.assertEqual(self.get_cube().state, Cube(3).serialize())
+
+    def test_current_solve(self):
+        solve = self.start_solve("R U")
+        solve_id = solve.id
+        self.make_moves("U'")
+
+        # the moves do not read the database once the solve is loaded
+        queries = []
+        listener = lambda *args: queries.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            for move in ["F", "F'"]:
+                make_move(self.cube_id, get_live_cube(self.cube_id), encode_move(move), datetime(2024, 1, 1, 1))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        self.assertEqual(queries, [])
+        self.assertEqual(live_cubes.cubes[self.cube_id].solve_move_count, 3)
+
+        # a new session is loaded with the next move
+        solve = db.session.get(Solve, solve_id)
+        solve.end_current_session(datetime(2024, 1, 1, 1))
+        solve.start_session(datetime(2024, 1, 1, 2))
+        self.make_moves("B")
+        self.assertEqual(live_cubes.cubes[self.cube_id].current.session_id, solve.solving_sessions[-1].id)
+        self.assertEqual(live_cubes.cubes[self.cube_id].current.session_start, datetime(2024, 1, 1, 2))
+        self.assertEqual(move_log.get_pending(solve_id).moves[-1]["solving_session_id"], solve.solving_sessions[-1].id)
+
+        # and the cube without a solve
+        self.get_cube().current_solve = None
+        db.session.commit()
+        self.make_moves("B'")
+        self.assertIsNone(live_cubes.cubes[self.cube_id].current)
+        self.assertEqual(len(move_log.get_pending(solve_id).moves), 1)
+        move_log.flush()
+        db.session.commit()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,13 @@
 from datetime import datetime, timedelta
 
 from flask import request
-from flask_socketio import join_room
 from api import create_connection
+from connections import connections
+from move_broadcast import move_broadcast
+from protocol import protocols
 from init import app, db, socketio, logger
-from model import DEFAULT_INSPECTION_TIME, Lobby, LobbyRole, LobbyStatus, LobbyUser, LobbyUserStatus, Race, Scramble, SocketConnection, Solve, User
+from model import DEFAULT_INSPECTION_TIME, Lobby, LobbyRole, LobbyStatus, LobbyUser, LobbyUserStatus, Race, Scramble, Solve, User
+from cube import state_to_string
 import json
 
 from flask_login import current_user, login_required
@@ -55,10 +58,12 @@ def lobby_start_race(lobby: Lobby, users: List[LobbyUser], racers_count: int):
 
     db.session.commit()
 
-    socketio.emit(
+    # moves of the previous race must not be applied to the new scramble
+    move_broadcast.flush(lobby.id)
+    protocols.emit(
         "match_start",
         {
-            "state": scramble.cube_state.decode("UTF-8"),
+            "state": state_to_string(scramble.cube_state),
             "startTime": solve_startdate.isoformat()
         },
         room=lobby.id
@@ -99,7 +104,7 @@ def lobby_start_request(data):
 @socketio.on("lobby_kick")
 @login_required
 def lobby_kick(data):
-    connection = SocketConnection.get(request.sid)
+    connection = connections.get(request.sid)
     lobby_user = LobbyUser.get(current_user.id, connection.lobby_id)
     if not lobby_user or lobby_user.role != LobbyRole.ADMIN:
         return
@@ -149,7 +154,7 @@ def send_ready_status(data):
 
 def join_lobby(lobby: Lobby, lobby_user: Optional[LobbyUser], is_creator: bool):
     # add user to the lobby room
-    join_room(lobby.id)
+    protocols.join(lobby.id)
 
     # add connection to the database
     if not lobby_user:
@@ -188,7 +193,7 @@ def get_lobby_data(lobby: Lobby, is_creator: bool):
             lobbyuser.user.username,
             lobbyuser.status == LobbyUserStatus.READY,
             lobbyuser.role == LobbyRole.ADMIN,
-            lobbyuser.current_connection.cube.state.decode("UTF-8")
+            state_to_string(lobbyuser.current_connection.cube.state)
         ) for lobbyuser in users
     ]
 
@@ -294,7 +299,7 @@ def get_lobbies():
 
 @socketio.on("lobby_make_admin")
 def make_admin(data):
-    connection = SocketConnection.get(request.sid)
+    connection = connections.get(request.sid)
     lobby_user = LobbyUser.get(current_user.id, connection.lobby_id)
     if not lobby_user or lobby_user.role != LobbyRole.ADMIN:
         return
@@ -1,25 +1,89 @@
 from init import app, socketio, logger, db
+from startup import startup
+from werkzeug.serving import is_running_from_reloader
+from eventlet import tpool
 import logging
-from model import setup_admin, tidy_db
+
+with startup.phase("import model"):
+    from model import setup_admin, tidy_db, pack_move_logs, upgrade_schema
+    from scramble_pool import scramble_pool
+    from live_cubes import live_cubes
+    from move_log import move_log
+    from camera_log import camera_log
+    from move_broadcast import move_broadcast
+    from cube import get_scrambler, scrambler_dispatch
 
 db.init_app(app)
 
-with app.app_context():
-    db.create_all()
+with startup.phase("import routes"):
+    # although unused, those imports are needed to register routes and socket events
+    import api
+    import cube_events
+    import together_lobby
+    import auth
+    import lobby
+    import solo
+
+
+@app.cli.command("pack-move-logs")
+def pack_move_logs_command():
+    # flask --app main pack-move-logs
+    with app.app_context():
+        print(f"Packed move logs of {pack_move_logs()} sessions")
+
+
+def set_up_database():
+    # only the server process sets up the database, the spawned scramble pool
+    # workers import this module as well (as __mp_main__)
+    with startup.phase("create_all"), app.app_context():
+        db.create_all()
+
+    with startup.phase("upgrade_schema"), app.app_context(), db.engine.begin() as connection:
+        upgrade_schema(connection)
+
+    with startup.phase("setup_admin, tidy_db"), app.app_context():
+        setup_admin()
+        tidy_db()
 
-with app.app_context():
-    setup_admin()
-    tidy_db()
 
-# although unused, those imports are needed to register routes and socket events
-import api
-import cube_events
-import together_lobby
-import auth
-import lobby
-import solo
+def warm_up():
+    # runs once the server is listening, /api/ready reports 503 until the
+    # warm-up is done
+    # the scramblers are used directly when the pool is empty
+    sizes = [size for size in scramble_pool.sizes if size in scrambler_dispatch]
+
+    startup.warmup["scramble pool"] = False
+    for size in sizes:
+        startup.warmup[f"scrambler {size}"] = False
+
+    live_cubes.start()
+    move_log.start()
+    camera_log.start()
+    move_broadcast.start()
+
+    # start generating scrambles in the background
+    scramble_pool.start()
+    startup.warmup["scramble pool"] = True
+
+    for size in sizes:
+        # the import runs the JavaScript scrambler, in a native thread it
+        # does not block the socket server
+        with startup.phase(f"load scrambler {size}"):
+            tpool.execute(get_scrambler, size)
+        startup.warmup[f"scrambler {size}"] = True
+
+    startup.set_ready()
+
 
 if __name__ == '__main__':
+    debug = True
+    # in debug mode, this block runs in the parent process of the reloader
+    # as well, it only restarts the server process when the code changes
+    if not debug or is_running_from_reloader():
+        set_up_database()
+        # the warm-up starts once the server is listening
+        socketio.start_background_task(warm_up)
+
     handler = logging.FileHandler("app.log")
     app.logger.addHandler(handler)
     app.logger.setLevel(logging.DEBUG)
@@ -34,4 +98,5 @@ if __name__ == '__main__':
     logger.addHandler(handler)
     logger.setLevel(logging.DEBUG)
 
-    socketio.run(app, host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    socketio.run(app, host="0.0.0.0", port=8080, debug=debug)
+    scramble_pool.stop()
@@ -1,17 +1,21 @@
 from init import socketio, db
-from cube import generate_scramble
+from scramble_pool import scramble_pool
+from live_cubes import live_cubes, LiveCube, CurrentSolve
+from move_log import move_log, decode_moves, encode_moves
+from camera_log import camera_log, decode_path
 from uuid import uuid4, UUID
 import os
 from flask_login import UserMixin
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey, select, update
+from sqlalchemy.orm import Mapped, mapped_column, relationship, joinedload, selectinload
+from sqlalchemy import BigInteger, ForeignKey, Index, delete, event, select, update, inspect, text
 from enum import Enum
 from datetime import datetime, timedelta
 from sqlalchemy import func
-from typing import Optional, List, TypedDict, Union
-from cube import Cube
+from typing import Dict, Optional, List, Tuple, TypedDict, Union
+from cube import Cube, Move, encode_move, state_size, scrambler_dispatch, random_seed, seeded_scramble, SEEDED_SCRAMBLE_VERSION
 from werkzeug.security import generate_password_hash
 import jwt
+import numpy as np
 
 
 DEFAULT_INSPECTION_TIME=3
@@ -171,20 +175,62 @@ class Scramble(db.Model):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     cube_size: Mapped[int]
-    scramble_string: Mapped[str]
-    cube_state: Mapped[bytes]
+    # empty for seeded scrambles, use .scramble_string and .cube_state
+    stored_scramble_string: Mapped[str] = mapped_column("scramble_string")
+    stored_cube_state: Mapped[bytes] = mapped_column("cube_state")
+    # Cube.state_hash of the scrambled state, used to find identical scrambles
+    state_hash: Mapped[Optional[int]] = mapped_column(BigInteger, index=True)
+
+    # big cube scrambles only store the seed of the generator, the scramble
+    # and the state are generated again when needed
+    generator_version: Mapped[Optional[int]]
+    seed: Mapped[Optional[int]] = mapped_column(BigInteger)
+
+    @property
+    def scramble_string(self) -> str:
+        if self.seed is None:
+            return self.stored_scramble_string
+        return seeded_scramble(self.cube_size, self.generator_version, self.seed)[0]
+
+    @property
+    def cube_state(self) -> bytes:
+        if self.seed is None:
+            return self.stored_cube_state
+        return seeded_scramble(self.cube_size, self.generator_version, self.seed)[1]
 
     @staticmethod
     def new(size: int):
-        scramble_string = generate_scramble(size)
-
-        cube = Cube(size)
-        cube.move(scramble_string)
+        seed = None
+        if size in scrambler_dispatch:
+            # pre-generated scramble if there is one ready
+            scramble_string, cube_state, state_hash = scramble_pool.get(size)
+        else:
+            # big cube scrambles are cheap to generate
+            seed = random_seed()
+            scramble_string, cube_state = seeded_scramble(size, SEEDED_SCRAMBLE_VERSION, seed)
+            state_hash = Cube(size, cube_state).state_hash()
+
+        # reuse the scramble if the same state has already been stored
+        # the hash only narrows down the candidates, states are compared
+        # to rule out collisions
+        existing = db.session.scalars(
+            select(Scramble).where(
+                Scramble.cube_size == size,
+                Scramble.state_hash == state_hash
+            )
+        ).all()
+        cube = Cube(size, cube_state)
+        for scramble in existing:
+            if Cube(size, scramble.cube_state) == cube:
+                return scramble
 
         scramble = Scramble(
             cube_size=size,
-            scramble_string=scramble_string,
-            cube_state=cube.serialize()
+            stored_scramble_string=scramble_string if seed is None else "",
+            stored_cube_state=cube_state if seed is None else bytes(),
+            state_hash=state_hash,
+            generator_version=None if seed is None else SEEDED_SCRAMBLE_VERSION,
+            seed=seed
         )
 
         db.session.add(scramble)
@@ -193,8 +239,18 @@ class Scramble(db.Model):
         return scramble
 
 
+# a keyframe (cube state) is stored after every KEYFRAME_INTERVAL moves of
+# a solve, so a state at any point of the solve can be computed by
+# performing at most KEYFRAME_INTERVAL - 1 moves
+KEYFRAME_INTERVAL = 32
+
+
 class Solve(db.Model):
     __tablename__ = "solve"
+    __table_args__ = (
+        # keyset pagination of solve lists (see api.iter_solves)
+        Index("ix_solve_end_timestamp_id", "end_timestamp", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     scramble_id: Mapped[int] = mapped_column(ForeignKey("scramble.id"))
@@ -219,11 +275,23 @@ class Solve(db.Model):
     lobby_together_id: Mapped[Optional[int]] = mapped_column(ForeignKey("together_lobby.id"))
     lobby_together: Mapped[Optional["TogetherLobby"]] = relationship()
 
-    solving_sessions: Mapped[List["SolvingSession"]] = relationship()
+    solving_sessions: Mapped[List["SolvingSession"]] = relationship(order_by="SolvingSession.id")
 
     manually_saved: Mapped[bool] = mapped_column(default=False)
     deleted: Mapped[bool] = mapped_column(default=False)
 
+    move_count: Mapped[int] = mapped_column(default=0)
+    # number of moves included in .state - the state is stored in intervals
+    # (see live_cubes.py), None for solves stored before that
+    state_move_count: Mapped[Optional[int]] = mapped_column(default=0)
+    # serialized states after KEYFRAME_INTERVAL, 2 * KEYFRAME_INTERVAL, ...
+    # moves, concatenated (all of them have the same length)
+    keyframes: Mapped[bytes] = mapped_column(default=bytes())
+    # number of keyframes missing before the first stored one - solves
+    # stored before keyframes were added only have the keyframes of the
+    # moves made later (see upgrade_schema)
+    keyframe_offset: Mapped[int] = mapped_column(default=0)
+
     def is_ongoing(self) -> bool:
         return self.solving_sessions[-1].end is None
 
@@ -234,47 +302,178 @@ class Solve(db.Model):
         session_time = (datetime.now() - current_session.start) / timedelta(milliseconds=1)
         return self.time + session_time
 
-    def add_move(self, move_str: str, timestamp: datetime) -> None:
-        move = SolveMove(
-            move=move_str,
-            timestamp=timestamp,
-            solving_session_id=self.solving_sessions[-1].id
-        )
-        db.session.add(move)
-        db.session.commit()
+    def get_move_count(self) -> int:
+        # including the moves that were not written yet
+        return move_log.get_move_count(self.id, self.move_count)
 
-    def add_camera_change(self, position) -> None:
-        camera_change = CameraChange(
-            x=position["x"],
-            y=position["y"],
-            z=position["z"],
-            timestamp=datetime.now(),
-            solving_session_id=self.solving_sessions[-1].id
+    @staticmethod
+    def add_move(current: CurrentSolve, move: int, timestamp: datetime, cube: Cube) -> int:
+        # cube - the cube after the move, returns the new number of moves
+        # the move is written to the database later (see move_log.py), the
+        # solve is not loaded
+        move_count = move_log.get_move_count(current.solve_id, current.move_count)
+        keyframe = bytes()
+        if (move_count + 1) % KEYFRAME_INTERVAL == 0:
+            keyframe = cube.serialize()
+
+        move_log.add(
+            current.solve_id,
+            {
+                "move": Move.from_code(move).to_string(),
+                "timestamp": timestamp,
+                "solving_session_id": current.session_id
+            },
+            keyframe
         )
-        db.session.add(camera_change)
-        db.session.commit()
+        return move_count + 1
 
     class MoveType(TypedDict):
         move: str
         sinceStart: int
 
+    def get_session_offsets(self) -> np.ndarray:
+        # ms of the solve before the start of each session
+        durations = [
+            (session.end - session.start) / timedelta(milliseconds=1) if session.end else 0
+            for session in self.solving_sessions
+        ]
+        return np.cumsum(durations) - durations
+
+    def get_pending_moves(self) -> Dict[int, List[Tuple[str, float]]]:
+        # moves of each session that are not written yet (see
+        # MoveLog.get_pending), in the format of SolvingSession.get_moves
+        starts = {session.id: session.start for session in self.solving_sessions}
+        pending = {}
+        for move in move_log.get_pending(self.id).moves:
+            session_id = move["solving_session_id"]
+            time = (move["timestamp"] - starts[session_id]) / timedelta(milliseconds=1)
+            pending.setdefault(session_id, []).append((move["move"], time))
+        return pending
+
     def get_moves(self) -> List[MoveType]:
-        moves = []
+        pending = self.get_pending_moves()
+        session_moves = [
+            session.get_moves() + pending.get(session.id, [])
+            for session in self.solving_sessions
+        ]
+        moves = [move for session in session_moves for move, _ in session]
+
+        # time before the session + time since the session start
+        times = np.array([time for session in session_moves for _, time in session], dtype=float)
+        times += np.repeat(self.get_session_offsets(), [len(session) for session in session_moves])
+        order = np.argsort(times, kind="stable")
+
+        return [
+            { "sinceStart": time, "move": moves[i] }
+            for i, time in zip(order.tolist(), times[order].tolist())
+        ]
+
+    def count_moves_until(self, since_start: float) -> int:
+        # number of moves with sinceStart <= since_start (see get_moves)
+        pending = self.get_pending_moves()
+        count = 0
         total_time = 0
         for session in self.solving_sessions:
-            for move in session.moves:
-                moves.append({
-                    # time before this session + time since this session start
-                    "sinceStart": total_time + (move.timestamp - session.start) / timedelta(milliseconds=1),
-                    "move": move.move
-                })
-            if session.end:
-                c = ((session.end - session.start) / timedelta(milliseconds=1))
-                total_time += c
-
-        moves.sort(key=lambda move: move["sinceStart"])
+            duration = (session.end - session.start) / timedelta(milliseconds=1) if session.end else None
+
+            if duration is not None and total_time + duration <= since_start:
+                # all moves of the session were made before since_start
+                count += session.get_move_count()
+            elif session.packed_moves is not None:
+                count += sum(1 for _, time in session.get_moves() if time <= since_start - total_time)
+            else:
+                until = session.start + timedelta(milliseconds=since_start - total_time)
+                count += db.session.scalar(
+                    select(func.count())
+                    .select_from(SolveMove)
+                    .where(
+                        SolveMove.solving_session_id == session.id,
+                        SolveMove.timestamp <= until
+                    )
+                )
+            count += sum(1 for _, time in pending.get(session.id, []) if time <= since_start - total_time)
+
+            # moves of the later sessions are made after since_start
+            if duration is None or total_time + duration > since_start:
+                break
+            total_time += duration
+
+        return count
+
+    def get_state_after(self, move_count: int) -> bytes:
+        # cube state after the first move_count moves of the solve
+        # start from the last keyframe before the move and perform the rest
+        size = self.scramble.cube_size
+        keyframe_size = state_size(size)
+        keyframes = self.keyframes + move_log.get_pending(self.id).keyframes
+        keyframe = min(move_count // KEYFRAME_INTERVAL, self.keyframe_offset + len(keyframes) // keyframe_size)
+
+        if keyframe <= self.keyframe_offset:
+            start = 0
+            state = self.scramble.cube_state
+        else:
+            start = keyframe * KEYFRAME_INTERVAL
+            index = keyframe - self.keyframe_offset - 1
+            state = keyframes[index * keyframe_size: (index + 1) * keyframe_size]
+
+        # the last stored state can be closer
+        if self.state_move_count is not None and start < self.state_move_count <= move_count:
+            start = self.state_move_count
+            state = self.state
+
+        moves = self.get_move_range(start, move_count)
+        return Cube(size, state).move(" ".join(moves)).serialize()
+
+    def get_move_range(self, start: int, stop: int) -> List[str]:
+        # moves start, ..., stop - 1 of the solve in the order they were made
+        # the queued moves follow the self.move_count written ones
+        pending = [move["move"] for move in move_log.get_pending(self.id).moves]
+        pending = pending[max(start - self.move_count, 0):max(stop - self.move_count, 0)]
+        return self.get_stored_move_range(start, min(stop, self.move_count)) + pending
+
+    def get_stored_move_range(self, start: int, stop: int) -> List[str]:
+        if stop <= start:
+            return []
+        if all(session.packed_moves is None for session in self.solving_sessions):
+            return db.session.scalars(
+                select(SolveMove.move)
+                .join(SolvingSession)
+                .where(SolvingSession.solve_id == self.id)
+                .order_by(SolveMove.id)
+                .offset(start)
+                .limit(stop - start)
+            ).all()
+
+        moves = []
+        # index of the first move of the session
+        position = 0
+        for session in self.solving_sessions:
+            if position >= stop:
+                break
+            count = session.move_count
+            if count is not None and position + count <= start:
+                # the session ends before the range, skip it without
+                # unpacking its moves
+                position += count
+                continue
+
+            session_moves = [move for move, _ in session.get_moves()]
+            moves += session_moves[max(start - position, 0):max(stop - position, 0)]
+            position += len(session_moves)
         return moves
 
+    def get_current_state(self) -> bytes:
+        # cube state after all the moves of the solve
+        # the stored state is behind the move log if the server stopped
+        # before the state was flushed
+        if self.state_move_count is None or self.state_move_count == self.move_count:
+            return self.state
+        return self.get_state_after(self.move_count)
+
+    def get_state_at(self, since_start: float) -> bytes:
+        # cube state since_start ms after the start of the solve
+        return self.get_state_after(self.count_moves_until(since_start))
+
     class CameraChangeType(TypedDict):
         x: float
         y: float
@@ -282,29 +481,27 @@ class Solve(db.Model):
         sinceStart: int
 
     def get_camera_changes(self) -> List[CameraChangeType]:
-        camera_changes = []
-        total_time = 0
-        for session in self.solving_sessions:
-            for camera_change in session.camera_changes:
-                camera_changes.append({
-                    "x": camera_change.x,
-                    "y": camera_change.y,
-                    "z": camera_change.z,
-                    # sinceStart has to be bigger than zero - this can happen for inspection moves
-                    "sinceStart": max(total_time + (camera_change.timestamp - session.start) / timedelta(milliseconds=1), 0)
-                })
-            if session.end:
-                total_time += ((session.end - session.start) / timedelta(milliseconds=1))
-
-        return camera_changes
+        paths = [session.get_camera_path() for session in self.solving_sessions]
+        path = np.array([row for session in paths for row in session], dtype=float).reshape(-1, 4)
+
+        # sinceStart has to be bigger than zero - this can happen for inspection moves
+        path[:, 0] += np.repeat(self.get_session_offsets(), [len(session) for session in paths])
+        path[:, 0] = np.maximum(path[:, 0], 0)
+
+        return [
+            { "x": x, "y": y, "z": z, "sinceStart": time }
+            for time, x, y, z in path.tolist()
+        ]
 
     def start_session(self, timestamp: datetime):
         session = SolvingSession(
             solve_id=self.id,
-            start=timestamp
+            start=timestamp,
+            move_count=0
         )
         db.session.add(session)
         db.session.commit()
+        live_cubes.forget_sessions(self.id)
 
     def end_current_session(self, timestamp: datetime):
         current_session = self.solving_sessions[-1]
@@ -313,7 +510,28 @@ class Solve(db.Model):
         # convert time delta to ms
         # https://stackoverflow.com/a/74798645
         self.time += (current_session.end - current_session.start) / timedelta(milliseconds=1)
+        move_log.end_solve(self.id)
+        move_log.pack(current_session)
+        camera_log.end_session(current_session)
         db.session.commit()
+        live_cubes.forget_sessions(self.id)
+
+
+def load_replay(solve_id: int) -> Optional[Solve]:
+    # solve with everything its replay needs (see api.solve), loaded in the
+    # same number of queries no matter how many sessions the solve has
+    return db.session.scalar(
+        select(Solve)
+        .where(Solve.id == solve_id)
+        .options(
+            joinedload(Solve.scramble),
+            joinedload(Solve.user),
+            selectinload(Solve.solving_sessions).options(
+                selectinload(SolvingSession.moves),
+                selectinload(SolvingSession.camera_changes)
+            )
+        )
+    )
 
 
 class SolvingSession(db.Model):
@@ -326,9 +544,55 @@ class SolvingSession(db.Model):
     start: Mapped[datetime]
     end: Mapped[Optional[datetime]]
 
-    moves: Mapped[List["SolveMove"]] = relationship()
+    # moves packed by move_log.encode_moves, None if the moves of the
+    # session are stored as solve_move rows
+    packed_moves: Mapped[Optional[bytes]]
+    # number of written moves, None for sessions stored before it was kept
+    move_count: Mapped[Optional[int]]
+
+    moves: Mapped[List["SolveMove"]] = relationship(order_by="SolveMove.id")
+    # camera path packed by camera_log.encode_path, older sessions store
+    # camera positions as camera_change rows
+    packed_camera: Mapped[Optional[bytes]]
     camera_changes: Mapped[List["CameraChange"]] = relationship()
 
+    def get_moves(self) -> List[Tuple[str, float]]:
+        # moves of the session and their times in ms since the session start
+        if self.packed_moves is not None:
+            return [
+                (Move.from_code(code).to_string(), time)
+                for code, time in decode_moves(self.packed_moves)
+            ]
+
+        return [
+            (move.move, (move.timestamp - self.start) / timedelta(milliseconds=1))
+            for move in self.moves
+        ]
+
+    def get_move_count(self) -> int:
+        if self.move_count is not None:
+            return self.move_count
+        if self.packed_moves is not None:
+            return len(decode_moves(self.packed_moves))
+        return db.session.scalar(
+            select(func.count())
+            .select_from(SolveMove)
+            .where(SolveMove.solving_session_id == self.id)
+        )
+
+    def get_camera_path(self) -> List[Tuple[float, float, float, float]]:
+        # camera positions (ms since the session start, x, y, z)
+        if self.packed_camera is not None:
+            return [tuple(row) for row in decode_path(self.packed_camera).tolist()]
+
+        return [
+            (
+                (change.timestamp - self.start) / timedelta(milliseconds=1),
+                change.x, change.y, change.z
+            )
+            for change in self.camera_changes
+        ]
+
 
 class Race(db.Model):
     __tablename__ = "race"
@@ -418,7 +682,9 @@ class TogetherLobby(db.Model):
 class SocketConnection(db.Model):
     __tablename__ = "socket_connection"
     id: Mapped[int] = mapped_column(primary_key=True)
-    socket_id: Mapped[str]
+    # connections are looked up by socket id when they are not registered
+    # in connections.py
+    socket_id: Mapped[str] = mapped_column(index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     user: Mapped[User] = relationship()
 
@@ -447,29 +713,41 @@ class CubeEntity(db.Model):
     __tablename__ = "cube"
     id: Mapped[int] = mapped_column(primary_key=True)
     size: Mapped[int]
-    state: Mapped[bytes]
+    # the state of a cube that is being moved is kept in memory, the stored
+    # state is only updated when it is flushed (see live_cubes.py)
+    stored_state: Mapped[bytes] = mapped_column("state")
     current_solve_id: Mapped[Optional[int]] = mapped_column(ForeignKey("solve.id"))
     current_solve: Mapped[Optional[Solve]] = relationship()
 
-    def make_move(self, move_str: str, timestamp: datetime):
-        # get new cube state after the move
-        cube = Cube(self.size, self.state)
-        cube.move(move_str)
-        new_state = cube.serialize()
-        is_solved = cube.is_solved()
-
-        self.state = new_state
-
-        # if there is a solve, add the move to the solve
-        if self.current_solve:
-            self.current_solve.add_move(move_str, timestamp)
-            self.current_solve.state = new_state
-            if (is_solved):
-                self.current_solve.completed = True
-                self.current_solve.end_current_session(timestamp)
-                self.current_solve = None
+    @property
+    def state(self) -> bytes:
+        live_state = live_cubes.get_state(self.id)
+        return self.stored_state if live_state is None else live_state
+
+    @state.setter
+    def state(self, state: bytes) -> None:
+        # moves made before the caller commits are performed on the new state
+        if self.id is not None:
+            live_cubes.set(self.id, self.size, state)
+        self.stored_state = state
+
+    def load_live(self) -> LiveCube:
+        # the in-memory cube with its current solve (see live_cubes.py)
+        current = None
+        solve = self.current_solve
+        if solve is not None:
+            current = CurrentSolve(
+                solve_id=solve.id,
+                session_id=solve.solving_sessions[-1].id,
+                session_start=solve.solving_sessions[-1].start,
+                solve_start=solve.solve_startdate,
+                move_count=solve.move_count,
+                completed=solve.completed
+            )
+        return live_cubes.load(self.id, self.size, self.stored_state, current)
 
-        db.session.commit()
+    def make_move(self, move: int, timestamp: datetime) -> Optional[Solve]:
+        return make_move(self.id, get_live_cube(self.id), move, timestamp)
 
     def change_layers(self, new_size: int):
         if (self.current_solve):
@@ -486,6 +764,50 @@ class CubeEntity(db.Model):
         self.state = c.serialize()
         db.session.commit()
 
+@event.listens_for(CubeEntity.current_solve_id, "set")
+@event.listens_for(CubeEntity.current_solve, "set")
+def _current_solve_set(cube: CubeEntity, value, oldvalue, initiator) -> None:
+    if cube.id is not None:
+        live_cubes.forget_solve(cube.id)
+
+
+def get_live_cube(cube_id: int) -> LiveCube:
+    # the database is only read if the cube or its current solve are not
+    # loaded
+    live = live_cubes.get_loaded(cube_id)
+    if live is None:
+        live = db.session.get(CubeEntity, cube_id).load_live()
+    return live
+
+
+def make_move(cube_id: int, live: LiveCube, move: int, timestamp: datetime) -> Optional[Solve]:
+    # perform the move on the in-memory cube, returns the solve completed
+    # by the move
+    # the move code has to be valid for the cube size (see cube.tokenize)
+    cube = live.cube
+    cube.move_codes([move])
+
+    # if there is a solve, add the move to the solve
+    current = live.current
+    if current is None:
+        live_cubes.mark_dirty(cube_id)
+        return None
+
+    move_count = Solve.add_move(current, move, timestamp, cube)
+    live_cubes.mark_dirty(cube_id, current.solve_id, move_count)
+
+    if not cube.is_solved():
+        return None
+
+    live_cubes.flush(cube_id)
+    solve = db.session.get(Solve, current.solve_id)
+    solve.completed = True
+    solve.end_current_session(timestamp)
+    db.session.get(CubeEntity, cube_id).current_solve = None
+    db.session.commit()
+    return solve
+
+
 # i dont want to use insert_defaulf=func.now as it does not contain ms
 class SolveMove(db.Model):
     __tablename__ = "solve_move"
@@ -589,6 +911,104 @@ def setup_admin():
         db.session.add(user)
         db.session.commit()
 
+def pack_move_logs(batch_size: int = 100) -> int:
+    # move solve_move rows of ended sessions into packed move logs
+    # returns the number of packed sessions
+    packed = 0
+    while True:
+        sessions = db.session.scalars(
+            select(SolvingSession)
+            .where(
+                SolvingSession.packed_moves.is_(None),
+                SolvingSession.end.is_not(None),
+                select(SolveMove.id).where(SolveMove.solving_session_id == SolvingSession.id).exists()
+            )
+            .limit(batch_size)
+        ).all()
+        if not sessions:
+            return packed
+
+        for session in sessions:
+            session.packed_moves = encode_moves([
+                (encode_move(move.move), round((move.timestamp - session.start) / timedelta(milliseconds=1)))
+                for move in session.moves
+            ], compress=move_log.compress)
+            session.move_count = len(session.moves)
+            db.session.execute(
+                delete(SolveMove).where(SolveMove.solving_session_id == session.id)
+            )
+
+        db.session.commit()
+        packed += len(sessions)
+
+
+def upgrade_schema(connection) -> None:
+    # create_all only creates missing tables, columns and indexes added to
+    # existing tables are created here
+    inspector = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    added = []
+    for table in db.metadata.tables.values():
+        if not inspector.has_table(table.name):
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            # nullable until the existing rows are filled
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"
+            ))
+            added.append(column)
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+
+    for column in added:
+        if column is Solve.__table__.c.move_count:
+            # moves of older solves are stored as solve_move rows
+            connection.execute(
+                update(Solve.__table__)
+                .values(move_count=(
+                    select(func.count())
+                    .select_from(SolveMove.__table__.join(SolvingSession.__table__))
+                    .where(SolvingSession.solve_id == Solve.id)
+                    .scalar_subquery()
+                ))
+            )
+        elif column is Solve.__table__.c.keyframe_offset:
+            # keyframes are stored for the moves made after the upgrade that
+            # added them, the missing ones are the first ones
+            connection.execute(update(Solve.__table__).values(keyframe_offset=0))
+            solves = connection.execute(
+                select(Solve.id, Solve.move_count, func.length(Solve.keyframes), Scramble.cube_size)
+                .join(Scramble, Solve.scramble_id == Scramble.id)
+                .where(Solve.move_count >= KEYFRAME_INTERVAL)
+            ).all()
+            for solve_id, move_count, keyframes_length, cube_size in solves:
+                offset = move_count // KEYFRAME_INTERVAL - keyframes_length // state_size(cube_size)
+                if offset:
+                    connection.execute(
+                        update(Solve.__table__)
+                        .where(Solve.id == solve_id)
+                        .values(keyframe_offset=offset)
+                    )
+        elif not column.nullable and column.default is not None and column.default.is_scalar:
+            connection.execute(
+                update(column.table).values({column.name: column.default.arg})
+            )
+
+        # sqlite can not change existing columns
+        if not column.nullable and connection.dialect.name != "sqlite":
+            connection.execute(text(
+                f"ALTER TABLE {quote(column.table.name)} ALTER COLUMN {quote(column.name)} SET NOT NULL"
+            ))
+
+
 def tidy_db():
     db.session.execute(
         update(Lobby).where(Lobby.status != LobbyStatus.ENDED).values(status = LobbyStatus.ENDED)
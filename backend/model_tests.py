@@ -0,0 +1,94 @@
+import unittest
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text
+from database_testing import db
+from model import upgrade_schema
+from cube import Cube
+
+
+class TestUpgradeSchema(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        db.metadata.create_all(self.engine)
+
+        # tables of a database created before the new columns and indexes
+        with self.engine.begin() as connection:
+            for index in ["ix_scramble_state_hash", "ix_solve_end_timestamp_id", "ix_socket_connection_socket_id"]:
+                connection.execute(text(f"DROP INDEX {index}"))
+            for table, columns in [
+                ("solving_session", ["packed_moves", "move_count", "packed_camera"]),
+                ("solve", ["move_count", "state_move_count", "keyframes", "keyframe_offset"]),
+                ("scramble", ["state_hash", "generator_version", "seed"])
+            ]:
+                for column in columns:
+                    connection.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+
+            start = datetime(2024, 1, 1)
+            connection.execute(text(
+                "INSERT INTO scramble (id, scramble_string, cube_state, cube_size) VALUES (1, '', x'00', 3)"
+            ))
+            connection.execute(text(
+                "INSERT INTO solve (id, scramble_id, state, time, completed, inspection_startdate, solve_startdate, "
+                "reattempt, manually_saved, deleted) VALUES (1, 1, x'00', 0, 0, :start, :start, 0, 0, 0)"
+            ), { "start": start })
+            connection.execute(text(
+                "INSERT INTO solving_session (id, solve_id, start) VALUES (1, 1, :start)"
+            ), { "start": start })
+            for move in 10 * ["R", "U", "F", "D"]:
+                connection.execute(text(
+                    "INSERT INTO solve_move (timestamp, solving_session_id, move) VALUES (:start, 1, :move)"
+                ), { "start": start, "move": move })
+
+    def test_upgrade(self):
+        for _ in range(2):
+            # upgrading an upgraded database does nothing
+            with self.engine.begin() as connection:
+                upgrade_schema(connection)
+
+            inspector = inspect(self.engine)
+            for table in db.metadata.tables.values():
+                self.assertEqual(
+                    {column["name"] for column in inspector.get_columns(table.name)},
+                    {column.name for column in table.columns}
+                )
+                self.assertLessEqual(
+                    {index.name for index in table.indexes},
+                    {index["name"] for index in inspector.get_indexes(table.name)}
+                )
+
+        with self.engine.connect() as connection:
+            solve = connection.execute(text(
+                "SELECT move_count, state_move_count, keyframes, keyframe_offset FROM solve"
+            )).one()
+            # the first keyframe is missing
+            self.assertEqual(tuple(solve), (40, None, bytes(), 1))
+            self.assertIsNone(connection.execute(text("SELECT move_count FROM solving_session")).scalar())
+
+
+class TestKeyframeOffset(unittest.TestCase):
+    def test_upgrade(self):
+        # a database upgraded before keyframe_offset was added, keyframes of
+        # continued older solves start later
+        engine = create_engine("sqlite://")
+        db.metadata.create_all(engine)
+        start = datetime(2024, 1, 1)
+        keyframe = Cube(3).serialize()
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE solve DROP COLUMN keyframe_offset"))
+            connection.execute(text(
+                "INSERT INTO scramble (id, scramble_string, cube_state, cube_size, generator_version) VALUES (1, '', x'00', 3, 0)"
+            ))
+            for solve_id, move_count, keyframes in [(1, 70, 2), (2, 100, 2), (3, 10, 0)]:
+                connection.execute(text(
+                    "INSERT INTO solve (id, scramble_id, state, time, completed, inspection_startdate, solve_startdate, "
+                    "reattempt, manually_saved, deleted, move_count, keyframes) "
+                    "VALUES (:id, 1, x'00', 0, 0, :start, :start, 0, 0, 0, :move_count, :keyframes)"
+                ), { "id": solve_id, "start": start, "move_count": move_count, "keyframes": keyframes * keyframe })
+
+            upgrade_schema(connection)
+            offsets = connection.execute(text("SELECT keyframe_offset FROM solve ORDER BY id")).scalars().all()
+        self.assertEqual(offsets, [0, 1, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Batched broadcast of moves to lobby and together lobby rooms.
+
+Instead of one packet per move, the moves made in a room are collected and
+sent as one frame per room MOVE_BROADCAST_RATE times per second, so a move
+reaches the other users at most one tick later. Every move of a frame
+carries its server timestamp (ms since epoch), clients can replay the moves
+with their original timing.
+
+Pending moves of a room have to be flushed before an event that changes
+the state of the cubes in the room (e.g. a new scramble) is emitted.
+"""
+from init import app, socketio, logger
+from protocol import protocols
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple, Union
+
+Room = Union[int, str]
+
+
+class MoveBroadcast:
+    def __init__(self, tick_rate: float, emit: Callable = protocols.emit):
+        # 0 sends every move right away
+        self.tick_rate = tick_rate
+        self.emit = emit
+        # (event, room) -> moves
+        self.pending: Dict[Tuple[str, Room], List[dict]] = {}
+        self.moves = 0
+        self.frames = 0
+        self.running = False
+
+    def add(self, event: str, room: Room, username: str, move: str, timestamp: datetime) -> None:
+        self.pending.setdefault((event, room), []).append({
+            "username": username,
+            "move": move,
+            "time": timestamp.timestamp() * 1000
+        })
+        self.moves += 1
+        if self.tick_rate <= 0:
+            self.flush(room)
+
+    def flush(self, room: Room = None) -> None:
+        # send pending moves of the room, or of all rooms if room is None
+        if room is None:
+            pending, self.pending = self.pending, {}
+        else:
+            pending = {
+                key: self.pending.pop(key) for key in list(self.pending) if key[1] == room
+            }
+
+        for (event, frame_room), moves in pending.items():
+            self.frames += 1
+            self.emit(event, { "moves": moves }, room=frame_room)
+
+    def metrics(self) -> dict:
+        return { "moves": self.moves, "frames": self.frames }
+
+    def start(self) -> None:
+        if self.running or self.tick_rate <= 0:
+            return
+        self.running = True
+        socketio.start_background_task(self._loop)
+
+    def _loop(self) -> None:
+        while True:
+            socketio.sleep(1 / self.tick_rate)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Move broadcast failed")
+
+
+move_broadcast = MoveBroadcast(tick_rate=app.config["MOVE_BROADCAST_RATE"])
@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, timedelta
+from random import Random
+from move_broadcast import MoveBroadcast
+
+
+class TestClass(unittest.TestCase):
+    def test_frames(self):
+        frames = []
+        broadcast = MoveBroadcast(30, emit=lambda event, data, room: frames.append((event, data, room)))
+        now = datetime(2024, 1, 1)
+        broadcast.add("lobby_moves", 1, "a", "R", now)
+        broadcast.add("lobby_moves", 1, "b", "U'", now + timedelta(milliseconds=5))
+        broadcast.add("together_moves", "together/1", "a", "F", now)
+        broadcast.add("lobby_moves", 2, "c", "x", now)
+
+        broadcast.flush(1)
+        self.assertEqual(frames, [("lobby_moves", { "moves": [
+            { "username": "a", "move": "R", "time": now.timestamp() * 1000 },
+            { "username": "b", "move": "U'", "time": now.timestamp() * 1000 + 5 },
+        ]}, 1)])
+
+        broadcast.flush()
+        self.assertEqual([(event, room) for event, _, room in frames[1:]], [("together_moves", "together/1"), ("lobby_moves", 2)])
+        self.assertEqual(broadcast.pending, {})
+
+        # without ticks, every move is sent right away
+        frames.clear()
+        broadcast.tick_rate = 0
+        broadcast.add("lobby_moves", 1, "a", "R", now)
+        self.assertEqual(len(frames), 1)
+
+    def test_load(self):
+        # 8 racers at 10 turns per second for 10 seconds
+        racers, tps, seconds, tick_rate = 8, 10, 10, 30
+        frames = []
+        broadcast = MoveBroadcast(tick_rate, emit=lambda event, data, room: frames.append((data, tick)))
+
+        rng = Random(0)
+        start = datetime(2024, 1, 1)
+        moves = sorted(
+            (rng.uniform(0, seconds), f"racer{racer}")
+            for racer in range(racers) for _ in range(tps * seconds)
+        )
+
+        tick = 0
+        for time, username in moves:
+            while time >= (tick + 1) / tick_rate:
+                tick += 1
+                broadcast.flush()
+            broadcast.add("lobby_moves", 1, username, "R", start + timedelta(seconds=time))
+        broadcast.flush()
+
+        # one emit per tick with moves instead of one per move
+        self.assertEqual(sum(len(data["moves"]) for data, _ in frames), len(moves))
+        self.assertLessEqual(len(frames), tick_rate * seconds + 1)
+        self.assertLess(len(frames), len(moves) / 2)
+
+        # moves are sent by the end of the tick they were made in
+        for data, flush_tick in frames:
+            for move in data["moves"]:
+                delay = start.timestamp() + flush_tick / tick_rate - move["time"] / 1000
+                self.assertLessEqual(delay, 1 / tick_rate + 1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
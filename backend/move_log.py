@@ -0,0 +1,348 @@
+"""Buffered writer of the solve move log.
+
+Moves of solves are queued in memory and written to the database with one
+bulk insert (executemany) in regular intervals, when too many moves are
+queued and when a solving session ends. Moves that are queued when the
+server stops are lost, MOVE_LOG_FLUSH_INTERVAL limits how many of them
+there can be (0 writes every move right away).
+
+With MOVE_LOG_FORMAT=blob, the moves of a solving session are not stored as
+solve_move rows, but packed into SolvingSession.packed_moves (see encode_moves).
+The blob of an ongoing session is uncompressed, new moves are appended to it
+in the database without reading it back.
+
+Moves are written in a savepoint of the session of the caller and stored
+with the caller's commit. If the transaction ends without a commit, they
+are queued again (see transaction_hooks.py). Until then, the moves of the
+same solves are not written by other sessions. Reading the moves does not
+write them, the queued moves are merged with the stored ones (see
+get_pending).
+"""
+from init import app, socketio, logger, db
+from cube import encode_move
+from transaction_hooks import after_transaction
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy import func, cast, literal, LargeBinary
+from sqlalchemy.orm import Session
+import zlib
+
+# packed move log starts with a byte with the format version in the lower
+# bits, the highest bit is set if the rest is zlib compressed
+# the rest is a sequence of varints - move code and zigzag encoded
+# difference from the previous move time in ms, for every move
+MOVE_LOG_VERSION = 1
+COMPRESSED = 0x80
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _encode_payload(moves: List[Tuple[int, int]], previous: int) -> bytearray:
+    # varints of the moves, previous - time of the move before the first one
+    payload = bytearray()
+    for code, time in moves:
+        delta = time - previous
+        previous = time
+        _write_varint(payload, code)
+        # zigzag - small negative numbers are small as well
+        _write_varint(payload, delta << 1 if delta >= 0 else (-delta << 1) - 1)
+    return payload
+
+
+def encode_moves(moves: List[Tuple[int, int]], compress: bool = False) -> bytes:
+    """Packs moves into the move log format.
+
+    Args:
+        moves (List[Tuple[int, int]]): Move codes (see cube.encode_move) and
+            move times in ms since the session start, which can be negative
+            (moves during inspection).
+        compress (bool, optional): Whether to compress the moves with zlib.
+            Defaults to False.
+
+    Returns:
+        bytes: Packed moves.
+    """
+    payload = _encode_payload(moves, 0)
+    if compress:
+        return bytes([MOVE_LOG_VERSION | COMPRESSED]) + zlib.compress(payload)
+    return bytes([MOVE_LOG_VERSION]) + payload
+
+
+def append_bytes(column, data: bytes, initial: bytes = bytes()):
+    """SQL expression that appends bytes to a binary column.
+
+    The column is not read back, so concurrent appends to the same row do
+    not overwrite each other.
+
+    Args:
+        column: Binary column to append to.
+        data (bytes): Bytes to append.
+        initial (bytes, optional): Value the data is appended to if the
+            column is NULL. Defaults to empty bytes.
+
+    Returns:
+        SQL expression of the new value of the column.
+    """
+    return cast(
+        func.coalesce(column, literal(initial, LargeBinary)).op("||")(literal(data, LargeBinary)),
+        LargeBinary
+    )
+
+
+def decode_moves(buffer: bytes) -> List[Tuple[int, int]]:
+    """Unpacks moves packed by encode_moves.
+
+    Args:
+        buffer (bytes): Packed moves.
+
+    Returns:
+        List[Tuple[int, int]]: Move codes and move times in ms since the
+            session start.
+    """
+    assert buffer[0] & ~COMPRESSED == MOVE_LOG_VERSION
+    payload = buffer[1:]
+    if buffer[0] & COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    values = []
+    value = shift = 0
+    for byte in payload:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            values.append(value)
+            value = shift = 0
+
+    moves = []
+    time = 0
+    for code, zigzag in zip(values[::2], values[1::2]):
+        time += zigzag >> 1 if zigzag & 1 == 0 else -((zigzag + 1) >> 1)
+        moves.append((code, time))
+    return moves
+
+
+@dataclass
+class PendingMoves:
+    # SolveMove rows
+    moves: List[dict] = field(default_factory=list)
+    # keyframes of the moves, see Solve.add_move
+    keyframes: bytes = bytes()
+
+
+class MoveLog:
+    def __init__(self, flush_interval: float, max_pending: int, format: str, compress: bool):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # "rows" or "blob"
+        self.format = format
+        self.compress = compress
+        self.pending: Dict[int, PendingMoves] = {}
+        self.pending_count = 0
+        # number of moves (including the queued ones) of the solves with
+        # queued moves or ongoing sessions
+        self.move_counts: Dict[int, int] = {}
+        # start and the time of the last packed move (ms since the start)
+        # of the sessions with packed moves
+        self.sessions: Dict[int, Tuple[datetime, int]] = {}
+        # session of the transaction that wrote the moves of a solve, until
+        # it ends
+        self.writers: Dict[int, Session] = {}
+        self.running = False
+
+    def get_move_count(self, solve_id: int, stored_move_count: int) -> int:
+        if solve_id not in self.move_counts:
+            self.move_counts[solve_id] = stored_move_count
+        return self.move_counts[solve_id]
+
+    def add(self, solve_id: int, move: dict, keyframe: bytes) -> None:
+        # move - SolveMove row, get_move_count has to be called first
+        pending = self.pending.setdefault(solve_id, PendingMoves())
+        pending.moves.append(move)
+        pending.keyframes += keyframe
+        self.pending_count += 1
+        self.move_counts[solve_id] += 1
+
+        if self.flush_interval == 0 or self.pending_count >= self.max_pending:
+            self.flush()
+
+    def get_pending(self, solve_id: int) -> PendingMoves:
+        # moves of a solve that are queued, they were made after the stored
+        # ones
+        return self.pending.get(solve_id, PendingMoves())
+
+    def end_solve(self, solve_id: int) -> None:
+        # write the moves of a solve, whose session ended
+        self.flush()
+        self.move_counts.pop(solve_id, None)
+
+    def pack(self, session) -> None:
+        # compress the move log of an ended session
+        self.sessions.pop(session.id, None)
+        if session.packed_moves is not None and self.compress:
+            session.packed_moves = encode_moves(decode_moves(session.packed_moves), compress=True)
+
+    def flush(self) -> None:
+        # runs in request handlers as well, errors are logged and the moves
+        # stay queued - the moves are stored with the commit of the caller
+        if not self.pending:
+            return
+
+        session = db.session()
+        # moves written by a transaction that has not ended yet go first
+        pending = {
+            solve_id: solve_moves for solve_id, solve_moves in self.pending.items()
+            if self.writers.get(solve_id, session) is session
+        }
+        if not pending:
+            return
+
+        # moves added while waiting for the database are queued again
+        for solve_id in pending:
+            del self.pending[solve_id]
+        pending_count = sum(len(solve_moves.moves) for solve_moves in pending.values())
+        self.pending_count -= pending_count
+
+        try:
+            # a failed write rolls back to the savepoint, the changes of the
+            # caller stay in the session
+            with session.begin_nested():
+                sessions = self._write(pending)
+        except Exception:
+            self._requeue(pending, pending_count)
+            logger.exception("Writing the move log failed")
+            return
+
+        self.sessions.update(sessions)
+        for solve_id in pending:
+            self.writers[solve_id] = session
+        after_transaction(
+            committed=lambda: self._committed(pending),
+            rolled_back=lambda: self._rolled_back(pending, pending_count)
+        )
+
+    def _committed(self, pending: Dict[int, PendingMoves]) -> None:
+        for solve_id in pending:
+            self.writers.pop(solve_id, None)
+
+    def _rolled_back(self, pending: Dict[int, PendingMoves], pending_count: int) -> None:
+        self._committed(pending)
+        # the blobs are read again before the next append
+        for solve_moves in pending.values():
+            for move in solve_moves.moves:
+                self.sessions.pop(move["solving_session_id"], None)
+        self._requeue(pending, pending_count)
+
+    def _write(self, pending: Dict[int, PendingMoves]) -> Dict[int, Tuple[datetime, int]]:
+        from model import Solve, SolveMove, SolvingSession
+        from sqlalchemy import insert, update
+
+        moves = [move for solve_moves in pending.values() for move in solve_moves.moves]
+        sessions = {}
+        if self.format == "blob":
+            sessions = self._append_blobs(moves)
+        else:
+            db.session.execute(insert(SolveMove), moves)
+
+        session_counts = Counter(move["solving_session_id"] for move in moves)
+        for session_id, count in session_counts.items():
+            db.session.execute(
+                update(SolvingSession)
+                .where(SolvingSession.id == session_id)
+                .values({SolvingSession.move_count: SolvingSession.move_count + count})
+            )
+
+        for solve_id, solve_moves in pending.items():
+            solve = db.session.get(Solve, solve_id)
+            solve.move_count += len(solve_moves.moves)
+            if solve_moves.keyframes:
+                solve.keyframes += solve_moves.keyframes
+        return sessions
+
+    def _requeue(self, pending: Dict[int, PendingMoves], pending_count: int) -> None:
+        # put the moves back in front of the moves queued in the meantime
+        for solve_id, queued in self.pending.items():
+            solve_moves = pending.setdefault(solve_id, PendingMoves())
+            solve_moves.moves += queued.moves
+            solve_moves.keyframes += queued.keyframes
+        self.pending = pending
+        self.pending_count += pending_count
+
+    def _append_blobs(self, moves: List[dict]) -> Dict[int, Tuple[datetime, int]]:
+        # returns the new start and last move time of the sessions, which
+        # are kept once the moves are committed
+        from model import SolvingSession
+        from sqlalchemy import select, update
+
+        sessions: Dict[int, List[dict]] = {}
+        for move in moves:
+            sessions.setdefault(move["solving_session_id"], []).append(move)
+
+        appended = {}
+        for session_id, session_moves in sessions.items():
+            if session_id in self.sessions:
+                start, previous = self.sessions[session_id]
+            else:
+                # the blob is read once, e.g. after a restart
+                start, packed = db.session.execute(
+                    select(SolvingSession.start, SolvingSession.packed_moves)
+                    .where(SolvingSession.id == session_id)
+                ).one()
+                previous = 0
+                if packed is not None:
+                    decoded = decode_moves(packed)
+                    if packed[0] & COMPRESSED:
+                        # appended moves have to be uncompressed
+                        db.session.execute(
+                            update(SolvingSession)
+                            .where(SolvingSession.id == session_id)
+                            .values({SolvingSession.packed_moves: encode_moves(decoded)})
+                        )
+                    previous = decoded[-1][1] if decoded else 0
+
+            packed = []
+            for move in session_moves:
+                time = round((move["timestamp"] - start) / timedelta(milliseconds=1))
+                packed.append((encode_move(move["move"]), time))
+            payload = bytes(_encode_payload(packed, previous))
+
+            # compressed when the session ends
+            db.session.execute(
+                update(SolvingSession)
+                .where(SolvingSession.id == session_id)
+                .values({SolvingSession.packed_moves: append_bytes(
+                    SolvingSession.packed_moves, payload, bytes([MOVE_LOG_VERSION])
+                )})
+            )
+            appended[session_id] = (start, packed[-1][1])
+        return appended
+
+    def start(self) -> None:
+        if self.running or self.flush_interval == 0:
+            return
+        self.running = True
+        socketio.start_background_task(self._flush_loop)
+
+    def _flush_loop(self) -> None:
+        while True:
+            socketio.sleep(self.flush_interval)
+            try:
+                with app.app_context():
+                    self.flush()
+                    db.session.commit()
+            except Exception:
+                logger.exception("Writing the move log failed")
+
+
+move_log = MoveLog(
+    flush_interval=app.config["MOVE_LOG_FLUSH_INTERVAL"],
+    max_pending=app.config["MOVE_LOG_MAX_PENDING"],
+    format=app.config["MOVE_LOG_FORMAT"],
+    compress=app.config["MOVE_LOG_COMPRESS"]
+)
@@ -0,0 +1,161 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from database_testing import DatabaseTestCase
+from init import db
+from cube import Cube
+from model import Scramble, Solve, SolvingSession, SolveMove, User
+from move_log import MoveLog, encode_moves, decode_moves
+from cube import encode_move
+from cube_tests import wr7x7solve
+
+
+class TestClass(unittest.TestCase):
+    def test_roundtrip(self):
+        moves = [(encode_move("R"), -1500), (encode_move("x'"), -1499), (encode_move("3Rw2"), 0), (encode_move("U"), 86400000)]
+        for compress in [False, True]:
+            self.assertEqual(decode_moves(encode_moves(moves, compress)), moves)
+        self.assertEqual(decode_moves(encode_moves([])), [])
+
+    def test_size(self):
+        # a move every 100 ms
+        moves = [(encode_move(move), 100 * i) for i, move in enumerate(wr7x7solve.split())]
+        packed = encode_moves(moves)
+        self.assertEqual(decode_moves(packed), moves)
+        # at most 2 bytes per move code and 2 bytes per time delta
+        self.assertLessEqual(len(packed), 1 + 4 * len(moves))
+        self.assertLess(len(encode_moves(moves, compress=True)), len(packed))
+
+
+class TestFlush(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        scramble = Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).serialize())
+        db.session.add(scramble)
+        db.session.commit()
+
+        self.start = datetime(2024, 1, 1)
+        solve = Solve(scramble_id=scramble.id, inspection_startdate=self.start, solve_startdate=self.start)
+        db.session.add(solve)
+        db.session.commit()
+        session = SolvingSession(solve_id=solve.id, start=self.start)
+        db.session.add(session)
+        db.session.commit()
+        self.solve_id, self.session_id = solve.id, session.id
+
+    def add(self, log: MoveLog, move: str, ms: int) -> None:
+        log.get_move_count(self.solve_id, 0)
+        log.add(self.solve_id, {
+            "move": move,
+            "timestamp": self.start + timedelta(milliseconds=ms),
+            "solving_session_id": self.session_id
+        }, bytes())
+
+    def stored_moves(self, format: str) -> list:
+        db.session.expire_all()
+        if format == "blob":
+            packed = db.session.get(SolvingSession, self.session_id).packed_moves
+            return [time for _, time in decode_moves(packed)] if packed else []
+        return [
+            round((timestamp - self.start) / timedelta(milliseconds=1))
+            for timestamp in db.session.scalars(
+                select(SolveMove.timestamp)
+                .where(SolveMove.solving_session_id == self.session_id)
+                .order_by(SolveMove.id)
+            )
+        ]
+
+    def test_failed_flush(self):
+        for format in ["rows", "blob"]:
+            log = MoveLog(flush_interval=1, max_pending=1000, format=format, compress=False)
+            self.add(log, "R", 100)
+            self.add(log, "U", 200)
+
+            # a change of the request handler that is not committed yet
+            user = User(username=f"pending {format}")
+            db.session.add(user)
+
+            # the moves are written with the transaction of the caller, they
+            # are queued again when it ends without a commit
+            log.flush()
+            self.assertEqual(log.pending_count, 0)
+            self.assertEqual(self.stored_moves(format), [100, 200])
+            db.session.rollback()
+            self.assertEqual(log.pending_count, 2)
+            self.assertEqual(self.stored_moves(format), [])
+            self.assertIsNone(User.get(f"pending {format}"))
+
+            user = User(username=f"pending {format}")
+            db.session.add(user)
+
+            # the write fails after the moves were written
+            error = OperationalError("insert", {}, Exception("connection lost"))
+
+            def failing_write(pending):
+                MoveLog._write(log, pending)
+                raise error
+
+            with mock.patch.object(log, "_write", side_effect=failing_write):
+                log.flush()
+            self.assertEqual(log.pending_count, 2)
+            self.assertIn(user, db.session)
+
+            self.add(log, "F", 300)
+            log.flush()
+            db.session.commit()
+            self.assertEqual(log.pending_count, 0)
+            self.assertEqual(self.stored_moves(format), [100, 200, 300])
+            self.assertEqual(db.session.get(Solve, self.solve_id).move_count, 3)
+            self.assertEqual(log.get_move_count(self.solve_id, 0), 3)
+            self.assertIsNotNone(User.get(f"pending {format}"))
+
+            db.session.get(Solve, self.solve_id).move_count = 0
+            db.session.commit()
+
+    def test_other_writer(self):
+        log = MoveLog(flush_interval=1, max_pending=1000, format="blob", compress=False)
+
+        # the moves of a solve written by another transaction wait until it
+        # ends, so that they are stored in order
+        log.writers[self.solve_id] = Session()
+        self.add(log, "R", 100)
+        log.flush()
+        self.assertEqual(log.pending_count, 1)
+
+        del log.writers[self.solve_id]
+        log.flush()
+        self.assertEqual(log.writers, { self.solve_id: db.session() })
+        db.session.commit()
+        self.assertEqual(log.writers, {})
+        self.assertEqual(self.stored_moves("blob"), [100])
+
+    def test_append(self):
+        log = MoveLog(flush_interval=1, max_pending=1000, format="blob", compress=True)
+        times = []
+        for i in range(5):
+            for j in range(3):
+                times.append(1000 * i + 100 * j - 500)
+                self.add(log, "R", times[-1])
+            log.flush()
+            db.session.commit()
+            self.assertEqual(self.stored_moves("blob"), times)
+
+        # a restarted server reads the blob once, a compressed blob is
+        # unpacked before appending
+        session = db.session.get(SolvingSession, self.session_id)
+        log.pack(session)
+        db.session.commit()
+        log = MoveLog(flush_interval=1, max_pending=1000, format="blob", compress=True)
+        self.add(log, "U", 6000)
+        log.flush()
+        db.session.commit()
+        self.assertEqual(self.stored_moves("blob"), times + [6000])
+        self.assertEqual(log.sessions[self.session_id], (self.start, 6000))
+
+
+if __name__ == '__main__':
+    unittest.main()
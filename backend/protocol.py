@@ -0,0 +1,137 @@
+"""Wire formats of socket events.
+
+JSON is the default. A client can opt in to MessagePack when it connects
+(auth {"protocol": "msgpack"}), then the high-frequency and large events
+are sent to it as binary MessagePack packets:
+
+    lobby_moves, together_moves    [first time, [[username, move code, ms after first], ...]]
+    lobby_camera, together_camera  [username, x y z as float32]
+    match_start                    [packed state, start time]
+    together_set_state,
+    together_solve_start           [packed state]
+
+Move codes are the integer codes of cube.encode_move, packed states are
+serialized cube states (see cube.encode_state). Such a client sends camera
+positions as 3 float32 values too, other events stay JSON.
+
+Every member of a room also joins a room of its format, events with a
+binary format are emitted to both format rooms (see Protocols.emit).
+"""
+from init import socketio
+from cube import encode_move, string_to_state
+from flask import request
+from flask_socketio import join_room
+from typing import Callable, Dict, Optional, Union
+import numpy as np
+import msgpack
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+Room = Union[int, str]
+
+# camera positions are sent as 3 little endian float32 values
+CAMERA_DTYPE = np.dtype("<f4")
+
+
+def encode_moves(data: dict) -> list:
+    moves = data["moves"]
+    if not moves:
+        return [0, []]
+    first = moves[0]["time"]
+    return [first, [
+        [move["username"], encode_move(move["move"]), round(move["time"] - first)]
+        for move in moves
+    ]]
+
+
+def encode_camera(data: dict) -> list:
+    position = data["position"]
+    vector = np.array([position["x"], position["y"], position["z"]], dtype=CAMERA_DTYPE)
+    return [data["username"], vector.tobytes()]
+
+
+# event -> function converting its JSON payload to the MessagePack payload
+ENCODERS: Dict[str, Callable[[dict], list]] = {
+    "lobby_moves": encode_moves,
+    "together_moves": encode_moves,
+    "lobby_camera": encode_camera,
+    "together_camera": encode_camera,
+    "match_start": lambda data: [string_to_state(data["state"]), data["startTime"]],
+    "together_set_state": lambda data: [string_to_state(data["state"])],
+    "together_solve_start": lambda data: [string_to_state(data["state"])],
+}
+
+
+def encode(event: str, data: dict) -> bytes:
+    """Encodes the payload of an event into its MessagePack format.
+
+    Args:
+        event (str): Event name, one of ENCODERS.
+        data (dict): JSON payload of the event.
+
+    Returns:
+        bytes: MessagePack payload.
+    """
+    return msgpack.packb(ENCODERS[event](data), use_bin_type=True)
+
+
+def decode_camera(data: Union[dict, bytes]) -> dict:
+    """Returns the camera position sent by a client in either format.
+
+    Args:
+        data (Union[dict, bytes]): Payload of a camera event.
+
+    Raises:
+        ValueError: The binary payload is not 3 float32 values.
+
+    Returns:
+        dict: Position with x, y and z keys.
+    """
+    if not isinstance(data, bytes):
+        return data["position"]
+
+    x, y, z = np.frombuffer(data, dtype=CAMERA_DTYPE).tolist()
+    return { "x": x, "y": y, "z": z }
+
+
+class Protocols:
+    def __init__(self):
+        # socket id -> protocol, connections that are not here use JSON
+        self.protocols: Dict[str, str] = {}
+
+    def set(self, sid: str, protocol: Optional[str]) -> None:
+        if protocol == MSGPACK:
+            self.protocols[sid] = MSGPACK
+
+    def get(self, sid: str) -> str:
+        return self.protocols.get(sid, JSON)
+
+    def remove(self, sid: str) -> None:
+        self.protocols.pop(sid, None)
+
+    def join(self, room: Room) -> None:
+        # join the room and the room of the protocol of the current socket
+        join_room(room)
+        join_room(format_room(room, self.get(request.sid)))
+
+    def emit(self, event: str, data: dict, room: Room, skip_sid: Optional[str] = None) -> None:
+        # each member of the room gets the event in the format it chose,
+        # payloads are encoded only for formats that have members
+        for protocol in [JSON, MSGPACK]:
+            target = format_room(room, protocol)
+            if not has_members(target):
+                continue
+            payload = data if protocol == JSON else encode(event, data)
+            socketio.emit(event, payload, room=target, skip_sid=skip_sid)
+
+
+def format_room(room: Room, protocol: str) -> str:
+    return f"{room}#{protocol}"
+
+
+def has_members(room: str) -> bool:
+    return next(iter(socketio.server.manager.get_participants("/", room)), None) is not None
+
+
+protocols = Protocols()
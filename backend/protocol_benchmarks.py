@@ -0,0 +1,58 @@
+"""Compares the JSON and MessagePack formats of socket events (see
+protocol.py) - the size of the socket.io packets and the time to build
+them for one emit.
+
+Run with:
+    python protocol_benchmarks.py
+"""
+from socketio.packet import Packet, EVENT
+from cube_benchmarks import random_moves, measure
+from cube import Cube
+from protocol import encode
+
+
+def packet_size(encoded) -> int:
+    # binary payloads are sent as a text packet and binary attachments
+    parts = encoded if isinstance(encoded, list) else [encoded]
+    return sum(len(part.encode() if isinstance(part, str) else part) for part in parts)
+
+
+def benchmark_events() -> None:
+    start = 1717000000000.0
+    events = [
+        ("lobby_moves", "8 moves", {
+            "moves": [
+                { "username": f"racer{i}", "move": move, "time": start + 13.7 * i }
+                for i, move in enumerate(random_moves(7, 8))
+            ]
+        }),
+        ("lobby_moves", "1 move", {
+            "moves": [{ "username": "racer0", "move": "R'", "time": start }]
+        }),
+        ("lobby_camera", "", {
+            "username": "racer0", "position": { "x": 4.123456789, "y": 5.5, "z": -6.25 }
+        }),
+    ]
+    for n in [3, 7, 10]:
+        events.append(("match_start", f"{n}x{n}", {
+            "state": Cube(n).move(" ".join(random_moves(n, 100))).to_string(),
+            "startTime": "2024-06-01T12:00:00.000000"
+        }))
+
+    print("socket.io packet: JSON vs MessagePack [bytes, us per emit]")
+    for event, name, data in events:
+        def json_packet():
+            return Packet(EVENT, namespace="/", data=[event, data]).encode()
+
+        def msgpack_packet():
+            return Packet(EVENT, namespace="/", data=[event, encode(event, data)]).encode()
+
+        print(
+            f"{event + ' ' + name:>24}"
+            f" {packet_size(json_packet()):>5} vs {packet_size(msgpack_packet()):>4} B"
+            f" {measure(json_packet, 2000):>7.2f} vs {measure(msgpack_packet, 2000):>6.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_events()
@@ -0,0 +1,40 @@
+import unittest
+import msgpack
+from cube import Cube, Move, state_to_string, string_to_state
+from protocol import encode, decode_camera
+
+
+class TestClass(unittest.TestCase):
+    def test_states(self):
+        cube = Cube(7).move("R U 3Fw' x 2L2")
+        self.assertEqual(string_to_state(state_to_string(cube.serialize())), cube.serialize())
+
+        [packed] = msgpack.unpackb(encode("together_set_state", { "state": cube.to_string() }))
+        self.assertEqual(packed, cube.serialize())
+        self.assertLess(len(packed), len(cube.to_string()) / 2)
+
+    def test_moves(self):
+        moves = [
+            { "username": "a", "move": "R", "time": 1717000000000.5 },
+            { "username": "b", "move": "3Rw2", "time": 1717000000012.5 },
+            { "username": "a", "move": "x'", "time": 1717000000030.5 },
+        ]
+        first, frame = msgpack.unpackb(encode("lobby_moves", { "moves": moves }))
+        self.assertEqual(first, moves[0]["time"])
+        self.assertEqual(
+            [(username, Move.from_code(code).to_string(), first + delta) for username, code, delta in frame],
+            [(move["username"], move["move"], move["time"]) for move in moves]
+        )
+
+    def test_camera(self):
+        position = { "x": 1.5, "y": -4.25, "z": 6.0 }
+        username, vector = msgpack.unpackb(encode("lobby_camera", { "username": "a", "position": position }))
+        self.assertEqual(username, "a")
+        self.assertEqual(decode_camera(vector), position)
+        self.assertEqual(decode_camera({ "position": position }), position)
+        with self.assertRaises(ValueError):
+            decode_camera(bytes(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
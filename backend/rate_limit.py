@@ -0,0 +1,123 @@
+"""Rate limiting of the move and camera events of each connection.
+
+Every connection gets a token bucket for each limited event. A bucket
+holds at most `burst` tokens and refills at `rate` tokens per second, every
+event takes one token. Limits of moves can be set for each cube size
+(MOVE_RATE_LIMIT_SIZES), other sizes use MOVE_RATE_LIMIT.
+
+Events are not dropped silently. When the bucket runs low, the event is
+accepted and the client is asked to delay its next event by one refill
+interval, so a client that waits is paced at the sustained rate and never
+runs out of tokens. Events that come when the bucket is empty are rejected
+together with the time after which a token is available.
+
+The default limits are well above the turning speed of fast solvers, they
+only stop macros and misbehaving clients.
+"""
+from init import app
+from dataclasses import dataclass
+from time import monotonic
+from typing import Callable, Dict, Optional, Tuple
+
+# (tokens per second, bucket size)
+Limit = Tuple[float, float]
+
+# fraction of the bucket below which clients are asked to slow down
+BACKPRESSURE_LEVEL = 0.25
+
+
+@dataclass
+class Bucket:
+    rate: float
+    burst: float
+    tokens: float
+    updated: float
+    # whether the client was told about the last rejection
+    notified: bool = False
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    # seconds the client should wait before sending the next event
+    delay: float = 0
+    # True for the first rejection of a row of rejected events
+    notify: bool = False
+
+
+@dataclass
+class Counters:
+    allowed: int = 0
+    delayed: int = 0
+    throttled: int = 0
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        limits: Dict[str, Limit],
+        size_limits: Optional[Dict[str, Dict[int, Limit]]] = None,
+        clock: Callable[[], float] = monotonic
+    ):
+        # event -> default limit and event -> cube size -> limit
+        self.limits = limits
+        self.size_limits = size_limits or {}
+        self.clock = clock
+        # sid -> event -> bucket
+        self.buckets: Dict[str, Dict[str, Bucket]] = {}
+        self.counters: Dict[str, Counters] = { event: Counters() for event in limits }
+
+    def get_limit(self, event: str, size: Optional[int] = None) -> Limit:
+        return self.size_limits.get(event, {}).get(size, self.limits[event])
+
+    def acquire(self, sid: str, event: str, size: Optional[int] = None) -> Decision:
+        rate, burst = self.get_limit(event, size)
+        now = self.clock()
+        buckets = self.buckets.setdefault(sid, {})
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = Bucket(rate, burst, burst, now)
+        else:
+            # the limit changes with the size of the cube
+            bucket.rate, bucket.burst = rate, burst
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        counters = self.counters[event]
+        if bucket.tokens < 1:
+            counters.throttled += 1
+            notify = not bucket.notified
+            bucket.notified = True
+            return Decision(False, delay=(1 - bucket.tokens) / rate, notify=notify)
+
+        bucket.tokens -= 1
+        bucket.notified = False
+        counters.allowed += 1
+        if bucket.tokens < burst * BACKPRESSURE_LEVEL:
+            counters.delayed += 1
+            return Decision(True, delay=1 / rate)
+        return Decision(True)
+
+    def remove(self, sid: str) -> None:
+        self.buckets.pop(sid, None)
+
+    def metrics(self) -> dict:
+        metrics = {
+            event: {
+                "allowed": counters.allowed,
+                "delayed": counters.delayed,
+                "throttled": counters.throttled
+            }
+            for event, counters in self.counters.items()
+        }
+        metrics["connections"] = len(self.buckets)
+        return metrics
+
+
+rate_limiter = RateLimiter(
+    limits={
+        "move": app.config["MOVE_RATE_LIMIT"],
+        "camera": app.config["CAMERA_RATE_LIMIT"]
+    },
+    size_limits={ "move": app.config["MOVE_RATE_LIMIT_SIZES"] }
+)
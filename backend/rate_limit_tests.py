@@ -0,0 +1,96 @@
+import unittest
+from random import Random
+from rate_limit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self) -> float:
+        return self.time
+
+
+class TestClass(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = RateLimiter(
+            limits={ "move": (25, 50), "camera": (30, 60) },
+            size_limits={ "move": { 10: (10, 20) } },
+            clock=self.clock
+        )
+
+    def test_bucket(self):
+        decisions = [self.limiter.acquire("a", "move", 3) for _ in range(51)]
+        self.assertTrue(all(decision.allowed for decision in decisions[:50]))
+
+        # clients are asked to slow down before the bucket is empty
+        self.assertEqual(decisions[0].delay, 0)
+        self.assertEqual(decisions[49].delay, 1 / 25)
+
+        rejected = decisions[50]
+        self.assertFalse(rejected.allowed)
+        self.assertAlmostEqual(rejected.delay, 1 / 25)
+        self.assertTrue(rejected.notify)
+        self.assertFalse(self.limiter.acquire("a", "move", 3).notify)
+
+        # other connections and events have their own buckets
+        self.assertTrue(self.limiter.acquire("b", "move", 3).allowed)
+        self.assertTrue(self.limiter.acquire("a", "camera").allowed)
+
+        # one token after the retry delay
+        self.clock.time += rejected.delay
+        self.assertTrue(self.limiter.acquire("a", "move", 3).allowed)
+        self.assertFalse(self.limiter.acquire("a", "move", 3).allowed)
+
+        self.assertEqual(self.limiter.metrics(), {
+            "move": { "allowed": 52, "delayed": 14, "throttled": 3 },
+            "camera": { "allowed": 1, "delayed": 0, "throttled": 0 },
+            "connections": 2
+        })
+
+        self.limiter.remove("a")
+        self.assertEqual(self.limiter.metrics()["connections"], 1)
+
+    def test_size_limits(self):
+        self.assertEqual(self.limiter.get_limit("move", 10), (10, 20))
+        self.assertEqual(self.limiter.get_limit("move", 3), (25, 50))
+        self.assertEqual(self.limiter.get_limit("move"), (25, 50))
+        allowed = sum(self.limiter.acquire("a", "move", 10).allowed for _ in range(30))
+        self.assertEqual(allowed, 20)
+
+    def test_fast_solver(self):
+        # bursts of 20 turns per second for 2 seconds with short pauses in
+        # between, faster than the fastest solvers
+        rng = Random(0)
+        for _ in range(30):
+            for _ in range(40):
+                self.clock.time += rng.uniform(0.03, 0.07)
+                self.assertTrue(self.limiter.acquire("a", "move", 3).allowed)
+            self.clock.time += 0.5
+        self.assertEqual(self.limiter.counters["move"].throttled, 0)
+
+    def test_macro(self):
+        # a macro sending 200 moves per second, waiting as the server asks
+        sent = 0
+        for _ in range(2000):
+            decision = self.limiter.acquire("a", "move", 3)
+            sent += decision.allowed
+            self.clock.time += max(decision.delay, 1 / 200)
+
+        # the client is paced at the sustained rate
+        self.assertLessEqual(sent, 50 + 25 * self.clock.time)
+        self.assertEqual(self.limiter.counters["move"].throttled, 0)
+
+        # ignoring the delays only gets the sustained rate through
+        self.limiter.remove("a")
+        start, sent = self.clock.time, 0
+        for _ in range(2000):
+            sent += self.limiter.acquire("a", "move", 3).allowed
+            self.clock.time += 1 / 200
+        self.assertLessEqual(sent, 50 + 25 * (self.clock.time - start) + 1)
+        self.assertGreater(self.limiter.counters["move"].throttled, 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Cache of the replays of completed solves.
+
+The replay of a completed solve (see api.solve) changes only when the solve
+is deleted or its user is banned, so it is stored serialized and gzip
+compressed, together with its ETag. Entries are removed by the admin
+endpoints that change the flags. Every removal increases the generation of
+the solve, a replay built from the solve read before the change is not
+stored (see ReplayCache.put).
+
+The default backend is an in-process LRU bounded by the total size of the
+stored replays (REPLAY_CACHE_SIZE bytes). A backend shared by several
+processes can be plugged in by implementing ReplayCacheBackend.
+"""
+from init import app
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from hashlib import sha1
+from typing import Dict, Iterable, Optional
+import gzip
+import json
+
+
+@dataclass
+class CachedReplay:
+    etag: str
+    # gzip compressed JSON
+    body: bytes
+
+
+class ReplayCacheBackend(ABC):
+    @abstractmethod
+    def get(self, solve_id: int) -> Optional[CachedReplay]:
+        ...
+
+    @abstractmethod
+    def set(self, solve_id: int, replay: CachedReplay) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, solve_id: int) -> None:
+        ...
+
+
+class MemoryBackend(ReplayCacheBackend):
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.replays: OrderedDict[int, CachedReplay] = OrderedDict()
+
+    def get(self, solve_id: int) -> Optional[CachedReplay]:
+        replay = self.replays.get(solve_id)
+        if replay is not None:
+            self.replays.move_to_end(solve_id)
+        return replay
+
+    def set(self, solve_id: int, replay: CachedReplay) -> None:
+        if len(replay.body) > self.max_bytes:
+            return
+        self.delete(solve_id)
+        self.replays[solve_id] = replay
+        self.size += len(replay.body)
+
+        # evict the least recently used replays
+        while self.size > self.max_bytes:
+            _, evicted = self.replays.popitem(last=False)
+            self.size -= len(evicted.body)
+
+    def delete(self, solve_id: int) -> None:
+        replay = self.replays.pop(solve_id, None)
+        if replay is not None:
+            self.size -= len(replay.body)
+
+
+class ReplayCache:
+    def __init__(self, backend: ReplayCacheBackend):
+        self.backend = backend
+        # number of invalidations of each invalidated solve
+        self.generations: Dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, solve_id: int) -> int:
+        # read before loading the solve, passed to put
+        return self.generations.get(solve_id, 0)
+
+    def get(self, solve_id: int) -> Optional[CachedReplay]:
+        replay = self.backend.get(solve_id)
+        if replay is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return replay
+
+    def put(self, solve_id: int, replay: dict, generation: int) -> CachedReplay:
+        # the replay is stored only if the solve was not invalidated since
+        # generation was read, it can be built from the old solve
+        body = json.dumps(replay, separators=(",", ":")).encode()
+        cached = CachedReplay(
+            etag=sha1(body).hexdigest(),
+            body=gzip.compress(body)
+        )
+        if self.generation(solve_id) == generation:
+            self.backend.set(solve_id, cached)
+        return cached
+
+    def invalidate(self, solve_ids: Iterable[int]) -> None:
+        for solve_id in solve_ids:
+            self.generations[solve_id] = self.generation(solve_id) + 1
+            self.backend.delete(solve_id)
+
+    def metrics(self) -> dict:
+        metrics = { "hits": self.hits, "misses": self.misses }
+        if isinstance(self.backend, MemoryBackend):
+            metrics["replays"] = len(self.backend.replays)
+            metrics["bytes"] = self.backend.size
+        return metrics
+
+
+replay_cache = ReplayCache(MemoryBackend(app.config["REPLAY_CACHE_SIZE"]))
@@ -0,0 +1,120 @@
+import unittest
+import gzip
+import json
+from datetime import datetime
+from database_testing import DatabaseTestCase
+from init import app, db
+from cube import Cube
+from model import Scramble, Solve, User, UserRole
+from replay_cache import ReplayCache, MemoryBackend, CachedReplay, replay_cache
+import api
+
+
+class TestClass(unittest.TestCase):
+    def test_put(self):
+        cache = ReplayCache(MemoryBackend(1024))
+        replay = { "id": 1, "moves": [{ "move": "R", "sinceStart": 100 }] }
+        cached = cache.put(1, replay, 0)
+        self.assertEqual(json.loads(gzip.decompress(cached.body)), replay)
+        self.assertIs(cache.get(1), cached)
+        self.assertEqual(cache.put(2, replay, 0).etag, cached.etag)
+        self.assertNotEqual(cache.put(3, { **replay, "deleted": True }, 0).etag, cached.etag)
+
+        cache.invalidate([1, 4])
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.metrics()["hits"], 1)
+        self.assertEqual(cache.metrics()["misses"], 1)
+
+    def test_invalidated_while_building(self):
+        # the replay was built from the solve read before the invalidation
+        cache = ReplayCache(MemoryBackend(1024))
+        generation = cache.generation(1)
+        cache.invalidate([1])
+        cached = cache.put(1, { "id": 1, "deleted": False }, generation)
+        self.assertEqual(json.loads(gzip.decompress(cached.body))["id"], 1)
+        self.assertIsNone(cache.get(1))
+
+        cache.put(1, { "id": 1, "deleted": True }, cache.generation(1))
+        self.assertIsNotNone(cache.get(1))
+
+    def test_size_bound(self):
+        backend = MemoryBackend(100)
+        for solve_id in range(5):
+            backend.set(solve_id, CachedReplay(str(solve_id), bytes(30)))
+            # keep the first replay recently used
+            backend.get(0)
+        self.assertEqual(list(backend.replays), [3, 4, 0])
+        self.assertEqual(backend.size, 90)
+
+        # replays bigger than the cache are not stored
+        backend.set(5, CachedReplay("5", bytes(101)))
+        self.assertIsNone(backend.get(5))
+
+        backend.delete(0)
+        self.assertEqual(backend.size, 60)
+
+
+
+class TestEndpoint(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User(username=f"admin{datetime.now().timestamp()}", role=UserRole.ADMIN)
+        user = User(username=f"user{datetime.now().timestamp()}")
+        scramble = Scramble(cube_size=3, stored_scramble_string="R", stored_cube_state=Cube(3).move("R").serialize())
+        db.session.add_all([admin, user, scramble])
+        db.session.commit()
+
+        start = datetime(2024, 1, 1)
+        solve = Solve(
+            scramble_id=scramble.id, user_id=user.id, completed=True, time=1000,
+            inspection_startdate=start, solve_startdate=start
+        )
+        db.session.add(solve)
+        db.session.commit()
+        self.solve_id, self.username = solve.id, user.username
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session["_user_id"] = str(admin.id)
+
+    def get(self, **headers):
+        return self.client.get(f"/api/solve/{self.solve_id}", headers=headers)
+
+    def test_etag(self):
+        response = self.get(**{"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.data))["id"], self.solve_id)
+        self.assertIsNotNone(replay_cache.get(self.solve_id))
+
+        etag = response.headers["ETag"]
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+        # clients without gzip get the plain replay
+        self.assertEqual(self.get().json["id"], self.solve_id)
+        self.assertEqual(self.get(**{"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_invalidation(self):
+        etag = self.get().headers["ETag"]
+
+        response = self.client.post("/api/update_solve_deleted_status", data=json.dumps({ "id": self.solve_id, "status": True }))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(replay_cache.get(self.solve_id))
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json["deleted"])
+
+        etag = response.headers["ETag"]
+        response = self.client.post("/api/update_banned_status", data=json.dumps({ "username": self.username, "status": True }))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(replay_cache.get(self.solve_id))
+        response = self.get(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json["banned"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from random import Random
+from sqlalchemy import event, select
+from database_testing import DatabaseTestCase
+from init import app, db
+from cube import Cube
+from model import Scramble, Solve, SolvingSession, SolveMove, CameraChange, CubeEntity, load_replay, KEYFRAME_INTERVAL
+from move_log import move_log, encode_moves, decode_moves
+from camera_log import encode_path
+from cube import encode_move, state_to_string, state_size
+import numpy as np
+import model
+import api
+
+
+class TestClass(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.queries = 0
+        event.listen(db.engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.count_query)
+        super().tearDown()
+
+    def count_query(self, *args):
+        self.queries += 1
+
+    def add_solve(self, sessions: int) -> int:
+        # sessions of 10 seconds, half of them stored as rows
+        scramble = Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).serialize())
+        db.session.add(scramble)
+        db.session.commit()
+
+        start = datetime(2024, 1, 1)
+        solve = Solve(scramble_id=scramble.id, inspection_startdate=start, solve_startdate=start)
+        db.session.add(solve)
+        db.session.commit()
+
+        for i in range(sessions):
+            session_start = start + timedelta(minutes=i)
+            session = SolvingSession(
+                solve_id=solve.id,
+                start=session_start,
+                end=session_start + timedelta(seconds=10)
+            )
+            db.session.add(session)
+            db.session.commit()
+
+            if i % 2:
+                session.packed_moves = encode_moves([(encode_move("R"), 1000), (encode_move("U"), 2000)])
+                session.packed_camera = encode_path(np.array([[500, 1, 2, 3], [1500, 4, 5, 6]]))
+            else:
+                for second, move in [(1, "R"), (2, "U")]:
+                    db.session.add(SolveMove(
+                        move=move,
+                        timestamp=session_start + timedelta(seconds=second),
+                        solving_session_id=session.id
+                    ))
+                db.session.add(CameraChange(
+                    x=1, y=2, z=3,
+                    timestamp=session_start + timedelta(milliseconds=500),
+                    solving_session_id=session.id
+                ))
+        db.session.commit()
+        solve_id = solve.id
+        db.session.expunge_all()
+        return solve_id
+
+    def load(self, solve_id: int) -> dict:
+        self.queries = 0
+        solve = load_replay(solve_id)
+        replay = {
+            "moves": solve.get_moves(),
+            "camera_changes": solve.get_camera_changes(),
+            "scramble": solve.scramble.scramble_string,
+            "banned": solve.user.banned if solve.user else False
+        }
+        db.session.expunge_all()
+        return replay
+
+    def test_replay(self):
+        replay = self.load(self.add_solve(3))
+        self.assertEqual(
+            [(move["move"], move["sinceStart"]) for move in replay["moves"]],
+            [("R", 1000), ("U", 2000), ("R", 11000), ("U", 12000), ("R", 21000), ("U", 22000)]
+        )
+        self.assertEqual(
+            [change["sinceStart"] for change in replay["camera_changes"]],
+            [500, 10500, 11500, 20500]
+        )
+
+    def test_query_count(self):
+        self.load(self.add_solve(1))
+        queries = self.queries
+        for sessions in [2, 5, 20]:
+            self.load(self.add_solve(sessions))
+            self.assertEqual(self.queries, queries)
+
+
+class TestSeek(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.format = move_log.format
+
+    def tearDown(self):
+        move_log.format = self.format
+        super().tearDown()
+
+    def add_solve(self, sessions: int, moves_per_session: int) -> int:
+        # sessions of random moves, 200 ms apart, with a pause between them
+        scramble = Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).move("R U F' L2").serialize())
+        db.session.add(scramble)
+        db.session.commit()
+
+        start = datetime(2024, 1, 1)
+        solve = Solve(scramble_id=scramble.id, inspection_startdate=start, solve_startdate=start, state=scramble.cube_state)
+        db.session.add(solve)
+        db.session.commit()
+        cube = CubeEntity(size=3, state=scramble.cube_state, current_solve_id=solve.id)
+        db.session.add(cube)
+        db.session.commit()
+
+        self.add_sessions(solve.id, sessions, moves_per_session)
+        return solve.id
+
+    def add_sessions(self, solve_id: int, sessions: int, moves_per_session: int) -> None:
+        solve = db.session.get(Solve, solve_id)
+        cube = db.session.scalar(select(CubeEntity).where(CubeEntity.current_solve_id == solve_id))
+        start = datetime(2024, 1, 1) + timedelta(minutes=len(solve.solving_sessions))
+
+        rng = Random(solve_id * 1000 + len(solve.solving_sessions))
+        for i in range(sessions):
+            session_start = start + timedelta(minutes=i)
+            solve.start_session(session_start)
+            for j in range(moves_per_session):
+                move = rng.choice("UFRBLD") + rng.choice(["", "'", "2"])
+                cube.make_move(encode_move(move), session_start + timedelta(milliseconds=200 * (j + 1)))
+            solve.end_current_session(session_start + timedelta(milliseconds=200 * (moves_per_session + 1)))
+
+    def test_seek(self):
+        for format in ["rows", "blob"]:
+            move_log.format = format
+            solve = db.session.get(Solve, self.add_solve(3, 50))
+            moves = solve.get_moves()
+            self.assertEqual(len(moves), 150)
+            self.assertEqual(len(solve.keyframes), 150 // KEYFRAME_INTERVAL * state_size(3))
+
+            scramble = solve.scramble.cube_state
+            for move_count in range(0, len(moves) + 1, 7):
+                replayed = Cube(3, scramble).move(" ".join(move["move"] for move in moves[:move_count]))
+                self.assertEqual(solve.get_state_after(move_count), replayed.serialize(), (format, move_count))
+                self.assertEqual(
+                    solve.get_move_range(move_count, move_count + 10),
+                    [move["move"] for move in moves[move_count:move_count + 10]]
+                )
+
+            for t in [-1, 0, 200, 5000, 10199, 10200, 10201, 15000, 20400, 30600, 99999]:
+                expected = sum(1 for move in moves if move["sinceStart"] <= t)
+                self.assertEqual(solve.count_moves_until(t), expected, (format, t))
+
+    def test_upgraded_solve(self):
+        # a solve stored before keyframes were added, as upgrade_schema
+        # leaves it, is continued
+        move_log.format = "rows"
+        solve_id = self.add_solve(1, 40)
+        solve = db.session.get(Solve, solve_id)
+        solve.keyframes = bytes()
+        solve.keyframe_offset = 40 // KEYFRAME_INTERVAL
+        solve.state_move_count = None
+        db.session.commit()
+
+        self.add_sessions(solve_id, 2, 50)
+        db.session.expire_all()
+        solve = db.session.get(Solve, solve_id)
+        moves = solve.get_moves()
+        self.assertEqual(len(moves), 140)
+        self.assertEqual(len(solve.keyframes), (140 // KEYFRAME_INTERVAL - 1) * state_size(3))
+
+        scramble = solve.scramble.cube_state
+        for move_count in range(len(moves) + 1):
+            replayed = Cube(3, scramble).move(" ".join(move["move"] for move in moves[:move_count]))
+            self.assertEqual(solve.get_state_after(move_count), replayed.serialize(), move_count)
+
+        # the stored state is behind the move log
+        solve.state_move_count = 100
+        self.assertEqual(solve.get_current_state(), replayed.serialize())
+
+    def test_pending_moves(self):
+        # the moves of an ongoing session are read without writing them
+        for format in ["rows", "blob"]:
+            move_log.format = format
+            solve_id = self.add_solve(1, 40)
+            solve = db.session.get(Solve, solve_id)
+            cube = db.session.scalar(select(CubeEntity).where(CubeEntity.current_solve_id == solve_id))
+            solve.start_session(datetime(2024, 1, 1, 1))
+            for i, move in enumerate("R U F' L2 D B' R2 U'".split() * 4):
+                cube.make_move(encode_move(move), datetime(2024, 1, 1, 1) + timedelta(milliseconds=200 * (i + 1)))
+
+            writes = []
+            listener = lambda *args: writes.append(args[2])
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                moves = solve.get_moves()
+                self.assertEqual(len(moves), 72)
+                self.assertEqual(moves[-1], { "sinceStart": 8200 + 32 * 200, "move": "U'" })
+
+                scramble = solve.scramble.cube_state
+                for move_count in range(0, len(moves) + 1, 3):
+                    replayed = Cube(3, scramble).move(" ".join(move["move"] for move in moves[:move_count]))
+                    self.assertEqual(solve.get_state_after(move_count), replayed.serialize(), (format, move_count))
+                self.assertEqual(solve.count_moves_until(8200 + 200 * 10), 50)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+            self.assertEqual([statement for statement in writes if not statement.startswith("SELECT")], [])
+            self.assertEqual(len(move_log.get_pending(solve_id).moves), 32)
+
+            solve.end_current_session(datetime(2024, 1, 1, 1, 1))
+            self.assertEqual(db.session.get(Solve, solve_id).get_moves(), moves)
+
+    def test_decoded_sessions(self):
+        # seeking unpacks only the sessions around the keyframe
+        move_log.format = "blob"
+        solve = db.session.get(Solve, self.add_solve(8, 20))
+        db.session.expire_all()
+        solve = db.session.get(Solve, solve.id)
+        with mock.patch.object(model, "decode_moves", wraps=decode_moves) as decode:
+            self.assertEqual(solve.count_moves_until(7 * 4200 + 1000), 7 * 20 + 5)
+            self.assertEqual(decode.call_count, 1)
+
+            decode.reset_mock()
+            solve.get_state_after(150)
+            self.assertLessEqual(decode.call_count, 2)
+
+    def test_state_endpoint(self):
+        move_log.format = "blob"
+        solve = db.session.get(Solve, self.add_solve(2, 40))
+        client = app.test_client()
+
+        response = client.get(f"/api/solve/{solve.id}/state?t=5000")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["move_count"], 25)
+        self.assertEqual(response.json["state"], state_to_string(solve.get_state_after(25)))
+
+        self.assertEqual(client.get(f"/api/solve/{solve.id}/state").status_code, 400)
+        for t in ["abc", "nan", "inf"]:
+            self.assertEqual(client.get(f"/api/solve/{solve.id}/state?t={t}").status_code, 400)
+        self.assertEqual(client.get("/api/solve/999999/state?t=0").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""Pool of pre-generated scrambles.
+
+Generating a scramble of a 4x4 - 7x7 cube takes a call into a JavaScript
+scrambler, which blocks the socket server for the whole call. The pool keeps
+a few scrambles of each size ready and refills them in worker processes in
+the background, scrambles are generated synchronously only when the pool of
+the requested size is empty.
+"""
+from init import app, logger
+from cube import make_scramble
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, List, Optional, Tuple
+import multiprocessing
+import eventlet
+from eventlet import tpool
+
+# scramble string, serialized cube state, state hash
+PooledScramble = Tuple[str, bytes, int]
+
+
+class ScramblePool:
+    def __init__(self, sizes: List[int], depth: int, workers: int):
+        self.sizes = sizes
+        self.depth = depth
+        self.workers = workers
+
+        self.ready: Dict[int, Deque[PooledScramble]] = {size: deque() for size in sizes}
+        # number of scrambles being generated for each size
+        self.pending: Dict[int, int] = {size: 0 for size in sizes}
+
+        self.hits = 0
+        self.misses = 0
+
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self.executor is not None or self.depth == 0 or self.workers == 0:
+            return
+
+        # forked workers would share the eventlet hub and the database
+        # connections of the server process - spawned workers start a new
+        # interpreter, which imports the main module (and with it init, that
+        # monkey patches it) but does not run the server
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        for size in self.sizes:
+            self.refill(size)
+
+    def stop(self) -> None:
+        # the workers have to be shut down before the interpreter exits,
+        # otherwise the exit hangs waiting for the executor
+        executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def refill(self, size: int) -> None:
+        if self.executor is None or size not in self.ready:
+            return
+
+        # the executor is dropped when the pool breaks while refilling
+        while self.executor is not None and len(self.ready[size]) + self.pending[size] < self.depth:
+            self.pending[size] += 1
+            eventlet.spawn(self._generate, size)
+
+    def _generate(self, size: int) -> None:
+        # waiting for the result only blocks this green thread
+        try:
+            if self.executor is None:
+                return
+            scramble = self.executor.submit(make_scramble, size).result()
+            self.ready[size].append(scramble)
+        except BrokenProcessPool:
+            # a worker died, the pool cannot be used anymore - the scrambles
+            # are generated in native threads of the server process from now on
+            logger.exception("Scramble pool is broken, generating scrambles in threads")
+            self.executor = None
+            self.ready[size].append(tpool.execute(make_scramble, size))
+        except Exception:
+            logger.exception(f"Scramble generation for size {size} failed")
+        finally:
+            self.pending[size] -= 1
+
+    def get(self, size: int) -> PooledScramble:
+        ready = self.ready.get(size)
+        if ready:
+            self.hits += 1
+            scramble = ready.popleft()
+        else:
+            self.misses += 1
+            scramble = make_scramble(size)
+
+        self.refill(size)
+        return scramble
+
+    def metrics(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "depth": {size: len(ready) for size, ready in self.ready.items()},
+            "pending": dict(self.pending),
+            "target_depth": self.depth,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else None
+        }
+
+
+scramble_pool = ScramblePool(
+    sizes=app.config["SCRAMBLE_POOL_SIZES"],
+    depth=app.config["SCRAMBLE_POOL_DEPTH"],
+    workers=app.config["SCRAMBLE_POOL_WORKERS"]
+)
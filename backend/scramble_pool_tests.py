@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from scramble_pool import ScramblePool
+
+
+class Executor:
+    # runs the scrambles right away in this process
+    def __init__(self, broken: bool = False):
+        self.broken = broken
+
+    def submit(self, fn, *args) -> Future:
+        if self.broken:
+            raise BrokenProcessPool("a worker died")
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+class TestClass(unittest.TestCase):
+    def setUp(self):
+        # numbered scrambles, the green threads generating them run right away
+        numbers = count()
+        patches = [
+            mock.patch("scramble_pool.make_scramble", side_effect=lambda size: (f"{size} {next(numbers)}", bytes(), 0)),
+            mock.patch("scramble_pool.eventlet.spawn", side_effect=lambda fn, *args: fn(*args))
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.pool = ScramblePool(sizes=[3, 4], depth=3, workers=1)
+
+    def test_refill(self):
+        self.pool.executor = Executor()
+        for size in self.pool.sizes:
+            self.pool.refill(size)
+        self.assertEqual(self.pool.metrics()["depth"], { 3: 3, 4: 3 })
+        self.assertEqual(self.pool.metrics()["pending"], { 3: 0, 4: 0 })
+
+        # scrambles are handed out in the order they were generated and
+        # replaced right away
+        self.assertEqual(self.pool.get(3)[0], "3 0")
+        self.assertEqual(self.pool.get(3)[0], "3 1")
+        self.assertEqual(self.pool.metrics()["depth"], { 3: 3, 4: 3 })
+
+        # sizes that are not pooled are generated when requested
+        self.assertEqual(self.pool.get(5)[0], "5 8")
+        self.assertNotIn(5, self.pool.ready)
+
+    def test_empty_pool(self):
+        # without workers, every scramble is generated when requested
+        self.assertEqual(self.pool.get(3)[0], "3 0")
+        self.assertEqual(self.pool.get(3)[0], "3 1")
+        self.assertEqual(self.pool.metrics()["depth"], { 3: 0, 4: 0 })
+
+    def test_broken_pool(self):
+        self.pool.executor = Executor(broken=True)
+        with self.assertLogs("init", "ERROR"), mock.patch("scramble_pool.tpool.execute", side_effect=lambda fn, *args: fn(*args)) as execute:
+            self.pool.refill(3)
+
+        # the scramble is generated in a thread of this process and the pool
+        # is not used anymore
+        execute.assert_called_once()
+        self.assertIsNone(self.pool.executor)
+        self.assertEqual(self.pool.metrics()["depth"], { 3: 1, 4: 0 })
+        self.assertEqual(self.pool.metrics()["pending"], { 3: 0, 4: 0 })
+        self.assertEqual(self.pool.get(3)[0], "3 0")
+        self.assertEqual(self.pool.get(3)[0], "3 1")
+
+    def test_hit_rate(self):
+        self.assertIsNone(self.pool.metrics()["hit_rate"])
+        self.pool.get(3)
+        self.pool.executor = Executor()
+        self.pool.refill(3)
+        for _ in range(3):
+            self.pool.get(3)
+
+        metrics = self.pool.metrics()
+        self.assertEqual((metrics["hits"], metrics["misses"]), (3, 1))
+        self.assertEqual(metrics["hit_rate"], 0.75)
+
+
+if __name__ == "__main__":
+    unittest.main()
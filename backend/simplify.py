@@ -0,0 +1,239 @@
+from cube import Move, INVERTED_DIRECTION_LAYERS
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
+
+# face letters of each axis - the face that turns in the positive direction
+# of the axis, the opposite face and the middle layer
+AXIS_FACES = {
+    "x": ("R", "L", "M"),
+    "y": ("U", "D", "E"),
+    "z": ("F", "B", "S"),
+}
+
+# a quarter turn in the positive direction has amount 1
+AMOUNT_SUFFIX = ["", "", "2", "'"]
+
+# groups of moves on the same axis that simplify keeps open, cancellations
+# that reach deeper are not merged
+MAX_OPEN_GROUPS = 8
+
+
+def get_amount(move: Move) -> int:
+    """Returns the number of quarter turns of the move in the positive
+    direction of its axis.
+
+    Args:
+        move (Move): A move.
+
+    Returns:
+        int: 1, 2 or 3
+    """
+    sense = -1 if move.face in INVERTED_DIRECTION_LAYERS else 1
+    return (move.dir.value * sense) % 4
+
+
+def is_regular(move: Move, n: int) -> bool:
+    """Checks whether the move can be described by its layers and amount.
+
+    Moves that reach the outer layer on the opposite side (e.g. 3R on a 3x3)
+    are not, since the engine turns the wrong face for them. These moves
+    are never merged with others.
+
+    Args:
+        move (Move): A move.
+        n (int): Cube size.
+
+    Returns:
+        bool: True if the move can be merged with other moves on its axis.
+    """
+    if move.is_rotation:
+        return True
+    if move.is_middle:
+        return n >= 3
+    if move.wide:
+        return max(move.index, 2) <= n - 1
+    return 1 <= move.index <= n - 1
+
+
+def _block(face: str, size: int, amount: int) -> str:
+    # outer block of layers turned from the given face
+    if size == 1:
+        return face + AMOUNT_SUFFIX[amount]
+    if size == 2:
+        return face.lower() + AMOUNT_SUFFIX[amount]
+    return f"{size}{face.lower()}{AMOUNT_SUFFIX[amount]}"
+
+
+def _with_face_direction(face: str, amount: int) -> int:
+    # convert amount in the positive direction of the axis to the direction
+    # of the given face
+    return (-amount) % 4 if face in INVERTED_DIRECTION_LAYERS else amount
+
+
+def _emit_run(axis: str, n: int, start: int, end: int, amount: int) -> List[str]:
+    # moves that turn layers start..end (inclusive) of the axis by amount
+    positive, negative, middle = AXIS_FACES[axis]
+
+    if start == 0 and end == n - 1:
+        return [axis + AMOUNT_SUFFIX[amount]]
+
+    if start == 0:
+        return [_block(positive, end + 1, amount)]
+
+    if end == n - 1:
+        return [_block(negative, n - start, _with_face_direction(negative, amount))]
+
+    if start == end:
+        return [f"{start + 1}{positive}{AMOUNT_SUFFIX[amount]}"]
+
+    if start == 1 and end == n - 2:
+        return [middle.lower() + AMOUNT_SUFFIX[_with_face_direction(middle, amount)]]
+
+    # inner block of several layers
+    return [
+        _block(positive, end + 1, amount),
+        _block(positive, start, (-amount) % 4)
+    ]
+
+
+def _runs(amounts: List[int]) -> List[tuple]:
+    # maximal runs of layers turned by the same non-zero amount
+    runs = []
+    start = 0
+    for i in range(1, len(amounts) + 1):
+        if i == len(amounts) or amounts[i] != amounts[start]:
+            if amounts[start] != 0:
+                runs.append((start, i - 1, amounts[start]))
+            start = i
+    return runs
+
+
+def emit_axis(axis: str, amounts: List[int]) -> List[str]:
+    """Returns the shortest sequence of moves found that turns the layers of
+    one axis by given amounts. Out of equally long sequences, the one with
+    the least moves other than rotations is chosen.
+
+    Args:
+        axis (str): x, y or z
+        amounts (List[int]): For each layer of the axis, the number of quarter
+            turns in the positive direction of the axis. Layer 0 is the outer
+            layer of the positive face (R, U or F).
+
+    Returns:
+        List[str]: Moves in Rubik's cube notation.
+    """
+    n = len(amounts)
+    best: Optional[List[str]] = None
+    best_cost = (0, 0)
+
+    # try to express a part of the turns as a whole cube rotation
+    for rotation in range(4):
+        remaining = [(amount - rotation) % 4 for amount in amounts]
+        moves = [axis + AMOUNT_SUFFIX[rotation]] if rotation else []
+        for start, end, amount in _runs(remaining):
+            moves += _emit_run(axis, n, start, end, amount)
+
+        # a rotation is at most one of the moves
+        if best is None or (len(moves), len(moves) - bool(rotation)) < best_cost:
+            best = moves
+            best_cost = (len(moves), len(moves) - bool(rotation))
+
+    return best
+
+
+@dataclass
+class _AxisGroup:
+    # consecutive moves on the same axis
+    axis: str
+    # quarter turns of each layer (see emit_axis)
+    amounts: List[int]
+    # the original moves, as long as they can be shorter than the merged ones
+    moves: List[str] = field(default_factory=list)
+    count: int = 0
+
+    def emit(self) -> List[str]:
+        merged = emit_axis(self.axis, self.amounts)
+        # overlapping wide moves can be shorter than the merged moves
+        return merged if len(merged) <= self.count else self.moves
+
+
+def simplify(moves: Iterable[str], n: int) -> Iterator[str]:
+    """Simplifies a sequence of moves.
+
+    Consecutive moves on the same axis commute, so they are merged: inverse
+    moves cancel out, repeated moves are folded into double moves and layers
+    turned by the same amount are joined into wide moves or rotations.
+    When the moves of an axis cancel out completely, the moves around them
+    are merged as well (e.g. R U U' R' cancels out entirely), up to
+    MAX_OPEN_GROUPS groups of moves on alternating axes deep.
+
+    Moves are processed one by one. The merged moves of an axis are yielded
+    once MAX_OPEN_GROUPS groups follow them, before a move that cannot be
+    merged (see is_regular) and at the end of the sequence, so at most
+    MAX_OPEN_GROUPS groups are kept in memory.
+
+    The simplified sequence results in the same cube state as the original
+    sequence, including the orientation of the cube, and it is never longer
+    than the original sequence.
+
+    Args:
+        moves (Iterable[str]): Moves in Rubik's cube notation.
+        n (int): Cube size.
+
+    Yields:
+        str: Simplified moves in Rubik's cube notation.
+    """
+    # a group that cancels out is removed and the next moves can merge with
+    # the group before it
+    groups: Deque[_AxisGroup] = deque()
+    # merged moves of an axis are never longer than this
+    max_merged = 2 * n + 1
+
+    def flush() -> Iterator[str]:
+        while groups:
+            yield from groups.popleft().emit()
+
+    for move_str in moves:
+        move = Move.from_string(move_str)
+
+        if not is_regular(move, n):
+            yield from flush()
+            yield move_str
+            continue
+
+        if not groups or groups[-1].axis != move.get_axis():
+            groups.append(_AxisGroup(move.get_axis(), [0] * n))
+            if len(groups) > MAX_OPEN_GROUPS:
+                yield from groups.popleft().emit()
+        group = groups[-1]
+
+        group.count += 1
+        if group.count <= max_merged:
+            group.moves.append(move_str)
+        indices = range(n) if move.is_rotation else move.get_layer_indices(n)
+        amount = get_amount(move)
+        for index in indices:
+            group.amounts[index] = (group.amounts[index] + amount) % 4
+
+        if not any(group.amounts):
+            groups.pop()
+
+    yield from flush()
+
+
+def count_moves(moves: Iterable[str], n: int) -> Dict[str, int]:
+    """Counts moves of a simplified sequence.
+
+    Args:
+        moves (Iterable[str]): Moves in Rubik's cube notation.
+        n (int): Cube size.
+
+    Returns:
+        Dict[str, int]: Move counts in the execution turn metric (every move,
+            including rotations, counts as one) and in the slice turn metric
+            (rotations do not count).
+    """
+    simplified = list(simplify(moves, n))
+    rotations = sum(1 for move in simplified if Move.from_string(move).is_rotation)
+    return {"etm": len(simplified), "stm": len(simplified) - rotations}
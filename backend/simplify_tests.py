@@ -0,0 +1,80 @@
+import unittest
+from itertools import cycle, islice
+from random import Random
+from simplify import simplify, count_moves, emit_axis, MAX_OPEN_GROUPS
+from cube import compile_sequence
+from cube_tests import wr7x7scramble, wr7x7solve
+import numpy as np
+
+
+def same_permutation(n, a, b):
+    return np.array_equal(
+        compile_sequence(n, " ".join(a))[0],
+        compile_sequence(n, " ".join(b))[0]
+    )
+
+
+class TestClass(unittest.TestCase):
+    def test_cancel(self):
+        self.assertEqual(list(simplify("U U'".split(), 3)), [])
+        self.assertEqual(list(simplify("r r'".split(), 5)), [])
+        self.assertEqual(list(simplify("x y y' x'".split(), 3)), [])
+        self.assertEqual(list(simplify("R U U' R'".split(), 3)), [])
+        self.assertEqual(list(simplify("F R U U' R' F2".split(), 3)), ["F'"])
+        self.assertEqual(list(simplify("R U U' L".split(), 3)), ["R", "L"])
+        # moves that cannot be merged stop the cancellation
+        self.assertEqual(list(simplify("R U 3R U' R'".split(), 3)), ["R", "U", "3R", "U'", "R'"])
+
+    def test_streaming(self):
+        # moves are yielded before the sequence ends
+        self.assertEqual(list(islice(simplify(cycle(["R", "U"]), 3), 4)), ["R", "U", "R", "U"])
+        self.assertEqual(list(islice(simplify(cycle(["R"]), 3), 0)), [])
+
+        # cancellations up to MAX_OPEN_GROUPS deep are merged
+        moves = list(islice(cycle(["F", "R", "U"]), MAX_OPEN_GROUPS - 1))
+        inverse = [move + "'" for move in reversed(moves)]
+        self.assertEqual(list(simplify(["D"] + moves + inverse + ["D"], 3)), ["D2"])
+        moves.append("R")
+        inverse.insert(0, "R'")
+        self.assertEqual(len(list(simplify(["D"] + moves + inverse + ["D"], 3))), 2)
+
+        # a long group keeps only as many original moves as needed
+        self.assertEqual(list(simplify(["R"] * 1001, 3)), ["R"])
+
+    def test_fold(self):
+        self.assertEqual(list(simplify("R R R".split(), 3)), ["R'"])
+        self.assertEqual(list(simplify("U U F F".split(), 3)), ["U2", "F2"])
+        self.assertEqual(list(simplify("R L R".split(), 3)), ["R2", "L"])
+
+    def test_merge_layers(self):
+        self.assertEqual(list(simplify("R 2R".split(), 5)), ["r"])
+        self.assertEqual(list(simplify("4Rw 3Lw'".split(), 7)), ["x"])
+        self.assertEqual(emit_axis("x", [1, 1, 1, 1, 2]), ["x", "L'"])
+        self.assertEqual(emit_axis("y", [0, 2, 2, 2, 0]), ["e2"])
+
+    def test_same_permutation(self):
+        moves = (wr7x7scramble + " " + wr7x7solve).split()
+        simplified = list(simplify(moves, 7))
+        self.assertLess(len(simplified), len(moves))
+        self.assertTrue(same_permutation(7, moves, simplified))
+
+        rng = Random(0)
+        for n in range(2, 8):
+            for _ in range(200):
+                moves = []
+                for _ in range(rng.randint(0, 12)):
+                    face = rng.choice("UFRBLDxyzufrbld" + ("MSE" if n > 2 else ""))
+                    index = rng.randint(1, n - 1)
+                    prefix = str(index) if index > 1 and face not in "MSExyz" else ""
+                    moves.append(prefix + face + rng.choice(["", "'", "2"]))
+
+                simplified = list(simplify(moves, n))
+                self.assertLessEqual(len(simplified), len(moves))
+                self.assertTrue(same_permutation(n, moves, simplified), moves)
+
+    def test_count(self):
+        self.assertEqual(count_moves("R R x U U' y".split(), 3), {"etm": 3, "stm": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,23 @@
 from api import create_connection
+from connections import connections
 from init import db, socketio
-from model import DEFAULT_INSPECTION_TIME, Scramble, SocketConnection, Solve
+from model import DEFAULT_INSPECTION_TIME, CubeEntity, Scramble, Solve
+from cube import state_to_string
 
 from flask import request
 from flask_login import current_user
-from sqlalchemy import select
 
 from datetime import datetime, timedelta
 
 
 @socketio.on("solo_solve_start")
 def solo_solve_start():
-    connection = db.session.scalar(
-        select(SocketConnection).where(SocketConnection.socket_id == request.sid)
-    )
+    connection = connections.get(request.sid)
     if connection is None:
         return
+    cube: CubeEntity = db.session.get(CubeEntity, connection.cube_id)
 
-    scramble: Scramble = Scramble.new(connection.cube.size)
+    scramble: Scramble = Scramble.new(cube.size)
 
     now = datetime.now()
 
@@ -34,29 +34,28 @@ def solo_solve_start():
 
     solve.start_session(now + timedelta(seconds=DEFAULT_INSPECTION_TIME))
 
-    connection.cube.current_solve_id = solve.id
-    connection.cube.state = scramble.cube_state
+    cube.current_solve_id = solve.id
+    cube.state = scramble.cube_state
 
     db.session.commit()
 
     return {
-        "state": scramble.cube_state.decode("UTF-8")
+        "state": state_to_string(scramble.cube_state)
     }
 
 
 @socketio.on("save_solve")
 def save_solve():
-    connection = db.session.scalar(
-        select(SocketConnection).where(SocketConnection.socket_id == request.sid)
-    )
+    connection = connections.get(request.sid)
     if connection is None:
         return
+    cube: CubeEntity = db.session.get(CubeEntity, connection.cube_id)
 
-    solve = connection.cube.current_solve
+    solve = cube.current_solve
     if not solve:
         return
 
-    connection.cube.current_solve = None
+    cube.current_solve = None
     solve.end_current_session(datetime.now())
     solve.manually_saved = True
     db.session.commit()
@@ -69,26 +68,28 @@ def handle_solo_join():
 
 @socketio.on("change_layers")
 def change_layers(data):
-    connection = SocketConnection.get(request.sid)
-    connection.cube.change_layers(data["newSize"])
+    connection = connections.get(request.sid)
+    db.session.get(CubeEntity, connection.cube_id).change_layers(data["newSize"])
 
 
 @socketio.on("continue_solve")
 def continue_solve(data):
-    connection = SocketConnection.get(request.sid)
+    connection = connections.get(request.sid)
+    cube: CubeEntity = db.session.get(CubeEntity, connection.cube_id)
     solve = db.session.get(Solve, data["solve_id"])
     new_size = solve.scramble.cube_size
 
-    connection.cube.change_layers(new_size)
+    cube.change_layers(new_size)
 
     solve.start_session(datetime.now())
-    connection.cube.current_solve = solve
-    connection.cube.state = solve.state
+    cube.current_solve = solve
+    state = solve.get_current_state()
+    cube.state = state
 
     db.session.commit()
 
     return {
         "startTime": solve.time,
-        "state": solve.state.decode("UTF-8"),
+        "state": state_to_string(state),
         "layers": solve.scramble.cube_size
     }
\ No newline at end of file
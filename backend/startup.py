@@ -0,0 +1,54 @@
+"""Startup phase timing and warm-up progress, reported by /api/ready.
+
+The server starts serving as soon as the database is set up, the scramblers
+and the scramble pool are warmed up in a background task afterwards. The
+server is reported ready once the warm-up is done.
+"""
+from init import logger
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import time
+
+
+class Startup:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        # time since start (in seconds) when the warm-up was done
+        self.ready_after: Optional[float] = None
+        # warm-up tasks and whether they are done
+        self.warmup: Dict[str, bool] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        self.phases.append((name, duration))
+        logger.info(f"Startup phase {name} took {duration * 1000:.0f} ms")
+
+    def set_ready(self) -> None:
+        self.ready_after = time.perf_counter() - self.start
+        logger.info(f"Server ready {self.ready_after * 1000:.0f} ms after start")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after_ms": None if self.ready_after is None else round(self.ready_after * 1000),
+            "phases": [
+                {"name": name, "ms": round(duration * 1000)}
+                for name, duration in self.phases
+            ],
+            "warmup": {
+                "done": sum(self.warmup.values()),
+                "total": len(self.warmup),
+                "tasks": self.warmup
+            }
+        }
+
+
+startup = Startup()
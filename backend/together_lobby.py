@@ -1,10 +1,13 @@
 from init import app, socketio, db
 from flask_login import login_required, current_user
 from model import SocketConnection, TogetherLobby, CubeEntity, Solve, TogetherUser, Scramble, DEFAULT_INSPECTION_TIME
+from connections import connections
+from move_broadcast import move_broadcast
+from protocol import protocols
+from cube import state_to_string
 from flask import request, abort
 from datetime import datetime
 from typing import TypedDict
-from flask_socketio import join_room
 import json
 from uuid import UUID
 from sqlalchemy import select, func
@@ -21,7 +24,7 @@ def new_together_lobby():
         cube=cube
     )
 
-    together_lobby.creator = current_user
+    together_lobby.creator_id = current_user.id
 
     db.session.add(cube)
     db.session.add(together_lobby)
@@ -50,18 +53,19 @@ def together_user_join(data: TogetherJoinData):
         return {"status": 400, "msg": "You have already joined this lobby"}
 
     connection = SocketConnection()
-    connection.user = current_user
+    connection.user_id = current_user.id
     connection.socket_id = request.sid
     connection.cube = together_lobby.cube
     connection.together_lobby = together_lobby
 
     together_user = TogetherUser()
-    together_user.user = current_user
+    together_user.user_id = current_user.id
     together_lobby.users.append(together_user)
 
     db.session.add(connection)
     db.session.add(together_user)
     db.session.commit()
+    connections.add(connection)
 
     socketio.emit(
         "together_join",
@@ -69,27 +73,23 @@ def together_user_join(data: TogetherJoinData):
         room=together_lobby.get_room()
     )
 
-    join_room(together_lobby.get_room())
+    protocols.join(together_lobby.get_room())
 
     return {
         "status": 200,
         "users": [together_user.user.username for together_user in together_lobby.users],
         "cube_size": together_lobby.cube.size,
-        "cube_state": together_lobby.cube.state.decode("UTF-8"),
+        "cube_state": state_to_string(together_lobby.cube.state),
         "solveTime": together_lobby.cube.current_solve.get_ongoing_time() if together_lobby.cube.current_solve else None
     }
 
 
 def get_together_lobby() -> TogetherLobby | None:
-    connection = SocketConnection.get(request.sid)
-    if not connection:
+    connection = connections.get(request.sid)
+    if not connection or connection.together_lobby_id is None:
         return None
 
-    together_lobby = connection.together_lobby
-    if not together_lobby:
-        return None
-
-    return together_lobby
+    return db.session.get(TogetherLobby, connection.together_lobby_id)
 
 
 @app.route("/api/get_together_id", methods=["POST"])
@@ -107,18 +107,16 @@ def get_together_id():
 @socketio.on("together_reset")
 @login_required
 def together_reset():
-    connection = SocketConnection.get(request.sid)
-    if not connection:
-        return abort(400)
-
-    together_lobby = connection.together_lobby
+    together_lobby = get_together_lobby()
     if not together_lobby:
         return abort(400)
 
     together_lobby.cube.set_default_state()
-    socketio.emit(
+    # pending moves were made before the reset
+    move_broadcast.flush(together_lobby.get_room())
+    protocols.emit(
         "together_set_state",
-        { "state": together_lobby.cube.state.decode("UTF-8")},
+        { "state": state_to_string(together_lobby.cube.state)},
         room=together_lobby.get_room()
     )
 
@@ -151,10 +149,11 @@ def together_lobby_start():
 
     solve.start_session(solve_start)
 
-    socketio.emit(
+    move_broadcast.flush(together_lobby.get_room())
+    protocols.emit(
         "together_solve_start",
         {
-            "state": scramble.cube_state.decode("UTF-8"),
+            "state": state_to_string(scramble.cube_state),
         },
         room=together_lobby.get_room()
     )
@@ -169,6 +168,7 @@ def together_layers_change(data):
 
     together_lobby.cube.change_layers(new_size)
 
+    move_broadcast.flush(together_lobby.get_room())
     socketio.emit(
         "together_layers_change",
         data,
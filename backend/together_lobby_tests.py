@@ -0,0 +1,43 @@
+import unittest
+from flask.testing import FlaskClient
+from database_testing import DatabaseTestCase
+from init import app, socketio, db
+from model import User, TogetherUser
+import api
+import together_lobby
+
+
+class TestClass(DatabaseTestCase):
+    def login(self, user_id: int) -> FlaskClient:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+        return client
+
+    def join(self, user_id: int, lobby_id: int):
+        client = socketio.test_client(app, flask_test_client=self.login(user_id))
+        return client, client.emit("together_join", {"id": lobby_id}, callback=True)
+
+    def test_rejoin(self):
+        user = User(username="together")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        lobby_id = self.login(user_id).get("/api/together/new").json["id"]
+
+        client, response = self.join(user_id, lobby_id)
+        self.assertEqual(response["status"], 200)
+
+        # the user leaves the lobby when they disconnect
+        client.disconnect()
+        db.session.remove()
+        self.assertEqual(db.session.query(TogetherUser).count(), 0)
+
+        client, response = self.join(user_id, lobby_id)
+        self.assertEqual(response["status"], 200)
+        self.assertEqual(response["users"], ["together"])
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
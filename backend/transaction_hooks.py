@@ -0,0 +1,45 @@
+"""Callbacks run when the transaction of the database session ends.
+
+The buffered writers (move_log.py, camera_log.py) write in the transaction
+of the caller, which commits it. The written data is dropped from memory
+when the transaction is committed and queued again when it ends without a
+commit (rollback, or the session is closed). Savepoints do not end the
+transaction.
+"""
+from init import db
+from typing import Callable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+Callback = Callable[[], None]
+
+
+def after_transaction(committed: Optional[Callback] = None, rolled_back: Optional[Callback] = None) -> None:
+    # registers callbacks for the end of the current transaction of
+    # db.session, rolled back callbacks run in reverse order
+    db.session().info.setdefault("transaction_hooks", []).append((committed, rolled_back))
+
+
+def registered() -> bool:
+    # whether callbacks wait for the end of the current transaction
+    return "transaction_hooks" in db.session().info
+
+
+@event.listens_for(db.session, "after_commit")
+def _after_commit(session: Session) -> None:
+    # savepoints are released with this event as well
+    if session.in_nested_transaction():
+        return
+    for committed, _ in session.info.pop("transaction_hooks", []):
+        if committed is not None:
+            committed()
+
+
+@event.listens_for(db.session, "after_transaction_end")
+def _after_transaction_end(session: Session, transaction) -> None:
+    # the transaction ended without a commit
+    if transaction.parent is not None:
+        return
+    for _, rolled_back in reversed(session.info.pop("transaction_hooks", [])):
+        if rolled_back is not None:
+            rolled_back()
@@ -0,0 +1,44 @@
+import unittest
+from database_testing import DatabaseTestCase
+from init import db
+from cube import Cube
+from model import Scramble
+from transaction_hooks import after_transaction, registered
+
+
+class TestClass(DatabaseTestCase):
+    def add_scramble(self) -> None:
+        db.session.add(Scramble(cube_size=3, stored_scramble_string="", stored_cube_state=Cube(3).serialize()))
+
+    def test_commit(self):
+        calls = []
+        self.add_scramble()
+        after_transaction(committed=lambda: calls.append("committed"), rolled_back=lambda: calls.append("rolled back"))
+        self.assertTrue(registered())
+
+        # releasing a savepoint does not end the transaction
+        with db.session.begin_nested():
+            self.add_scramble()
+        self.assertEqual(calls, [])
+
+        db.session.commit()
+        self.assertEqual(calls, ["committed"])
+        self.assertFalse(registered())
+
+    def test_rollback(self):
+        calls = []
+        for name in ["first", "second"]:
+            self.add_scramble()
+            after_transaction(rolled_back=lambda name=name: calls.append(name))
+        db.session.rollback()
+        self.assertEqual(calls, ["second", "first"])
+
+        # the transaction ends without a commit when the session is closed
+        self.add_scramble()
+        after_transaction(rolled_back=lambda: calls.append("closed"))
+        db.session.remove()
+        self.assertEqual(calls, ["second", "first", "closed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
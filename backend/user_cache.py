@@ -0,0 +1,60 @@
+"""Cache of the users loaded by Flask-Login.
+
+The user loader runs for every request and every socket event that uses
+current_user. It returns immutable snapshots of the users, which are kept
+for USER_CACHE_TTL seconds (at most USER_CACHE_SIZE of them) and removed
+when the user changes. To change a user, load the User from the database.
+"""
+from init import app
+from model import ANONYMOUS_PREFIX, User, UserRole, db
+from flask_login import UserMixin
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True, eq=False)
+class UserSnapshot(UserMixin):
+    id: int
+    username: str
+    role: UserRole
+    banned: bool
+
+    def is_anonymous(self):
+        return self.username.startswith(ANONYMOUS_PREFIX)
+
+
+class UserCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # user id -> (expiration time, snapshot)
+        self.users: OrderedDict[int, Tuple[float, UserSnapshot]] = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        cached = self.users.get(user_id)
+        if cached is not None and cached[0] > monotonic():
+            self.users.move_to_end(user_id)
+            return cached[1]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.users.pop(user_id, None)
+            return None
+
+        snapshot = UserSnapshot(user.id, user.username, user.role, user.banned)
+        self.users[user_id] = (monotonic() + self.ttl, snapshot)
+        self.users.move_to_end(user_id)
+        if len(self.users) > self.max_size:
+            self.users.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int) -> None:
+        self.users.pop(user_id, None)
+
+
+user_cache = UserCache(
+    ttl=app.config["USER_CACHE_TTL"],
+    max_size=app.config["USER_CACHE_SIZE"]
+)
@@ -0,0 +1,51 @@
+import unittest
+from database_testing import DatabaseTestCase
+from init import db
+from model import User, UserRole
+from user_cache import UserCache
+
+
+class TestClass(DatabaseTestCase):
+    def add_user(self, username: str) -> int:
+        user = User(username=username)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    def test_snapshot(self):
+        cache = UserCache(ttl=60, max_size=10)
+        user_id = self.add_user("snapshot")
+        user = cache.get(user_id)
+        self.assertEqual((user.username, user.role, user.banned), ("snapshot", UserRole.USER, False))
+        self.assertEqual(user.get_id(), str(user_id))
+        self.assertTrue(user.is_authenticated)
+        self.assertFalse(user.is_anonymous())
+        self.assertEqual(user, db.session.get(User, user_id))
+        self.assertIsNone(cache.get(10 ** 6))
+
+    def test_invalidate(self):
+        cache = UserCache(ttl=60, max_size=10)
+        user_id = self.add_user("invalidate")
+        self.assertIs(cache.get(user_id), cache.get(user_id))
+
+        db.session.get(User, user_id).banned = True
+        db.session.commit()
+        self.assertFalse(cache.get(user_id).banned)
+        cache.invalidate(user_id)
+        self.assertTrue(cache.get(user_id).banned)
+
+        # expired snapshots are loaded again
+        cache.ttl = 0
+        cache.invalidate(user_id)
+        self.assertIsNot(cache.get(user_id), cache.get(user_id))
+
+    def test_size_bound(self):
+        cache = UserCache(ttl=60, max_size=2)
+        user_ids = [self.add_user(f"bound{i}") for i in range(3)]
+        for user_id in user_ids:
+            cache.get(user_id)
+        self.assertEqual(list(cache.users), user_ids[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
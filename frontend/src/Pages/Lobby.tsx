@@ -1,6 +1,7 @@
 import { useParams } from "react-router-dom"
-import React, { useEffect, useState } from "react"
+import React, { useEffect, useMemo, useState } from "react"
 import Cube from "../cube/cube";
+import * as THREE from "three";
 import {
     Badge,
     Button,
@@ -28,6 +29,8 @@ import SidePanelTimeList from "../components/SidePanelTimeList";
 import AdminPanelButton from "../components/LobbyAdminPanel";
 import { IconCrown } from "@tabler/icons-react";
 import { Overlay } from "../components/Overlay";
+import { MoveFrame, MoveFramePlayer } from "../cube/moveFrames";
+import { decodeCamera, decodeMatchStart, decodeMoveFrame } from "../protocol";
 import useCube from "../hooks/useCube";
 import { useSpeedMode } from "../hooks/useSpeedMode";
 import TimerDisplay from "../components/TimerDisplay";
@@ -186,6 +189,7 @@ export default function Lobby() {
     const [ready, setReady] = useState(false);
     const [isKicked, setIsKicked] = useState(false);
     const [enemies, setEnemies] = useState<Map<string, Enemy>>(new Map());
+    const movePlayer = useMemo(() => new MoveFramePlayer(), []);
     const [isAdmin, setIsAdmin] = useState(false);
     const [cubeSize, setCubeSize] = useState(3);
     const [lastRaceResults, setLastRaceResults] = useState<RaceResults>([]);
@@ -265,24 +269,26 @@ export default function Lobby() {
         stop(time, true);
     }
 
-    const onMove = ({username, move} : {username: string, move: string}) => {
-        const cube = enemies.get(username);
-        if (!cube) {
-            return;
-        }
-        cube.cube.makeMove(move);
+    const onMoves = (data: MoveFrame | ArrayBuffer) => {
+        // own moves are in the frame too, they are not in enemies
+        movePlayer.play(decodeMoveFrame(data), ({username, move}) => {
+            const cube = enemies.get(username);
+            if (!cube) {
+                return;
+            }
+            cube.cube.makeMove(move);
+        });
     }
 
     const onCamera = (data: any) => {
-        const username = data.username;
-        const position = data.position;
+        const {username, position} = decodeCamera(data);
 
         const cube = enemies.get(username);
         if (!cube) {
             return;
         }
 
-        cube.cube.updateCamera(position);
+        cube.cube.updateCamera(new THREE.Vector3(position.x, position.y, position.z));
     };
 
     // resize the canvases after somebody else connects/disconnects
@@ -307,7 +313,9 @@ export default function Lobby() {
     };
 
 
-    const onMatchStart = ({state, startTime} : {state: string, startTime: string}) => {
+    const onMatchStart = (data: {state: string, startTime: string} | ArrayBuffer) => {
+        const { state } = decodeMatchStart(data);
+        movePlayer.cancel();
         for (const enemy of enemies.values()) {
             enemy.cube.setState(state);
         }
@@ -362,7 +370,7 @@ export default function Lobby() {
         socket.on("lobby_ready_status_", onReadyChange);
         socket.on("solve_completed", onSomebodySolved)
         socket.on("your_solve_completed", onSolved);
-        socket.on("lobby_move", onMove);
+        socket.on("lobby_moves", onMoves);
         socket.on("lobby_camera", onCamera);
         socket.on("lobby_connection", onConnection);
         socket.on("lobby_disconnection", onDisconnection)
@@ -377,7 +385,7 @@ export default function Lobby() {
             socket.off("your_solve_completed", onSolved);
             socket.off("lobby_disconnection", onDisconnection)
             socket.off("lobby_ready_status_", onReadyChange);
-            socket.off("lobby_move", onMove);
+            socket.off("lobby_moves", onMoves);
             socket.off("lobby_camera", onCamera);
             socket.off("match_start", onMatchStart);
             socket.off("lobby_race_done", onRaceDone);
@@ -15,6 +15,8 @@ import { NavigationIcons } from "../components/NavigationButtons";
 import KeybindsButton from "../components/KeybindsButton";
 import SidePanelTimeList, { SolveBasic } from "../components/SidePanelTimeList";
 import Invitation from "../components/Invitation";
+import { MoveFrame } from "../cube/moveFrames";
+import { decodeCamera, decodeMoveFrame, decodeState } from "../protocol";
 
 interface JoinSuccess {
     status: 200;
@@ -75,18 +77,26 @@ function TogetherLobby({id} : {id: number}) {
         setUsers(users.filter(username => username !== oldUserUsername));
     }
 
-    const onMove = ({move, username} : {move: string, username: string}) => {
-        cube.makeMove(move, false, true);
+    const onMoves = (data: MoveFrame | ArrayBuffer) => {
+        // moves change the shared cube, they are applied right away and in order
+        for (const {move} of decodeMoveFrame(data).moves) {
+            cube.makeMove(move, false, true);
+        }
     }
 
-    const onCamera = ({position, username} : {position: THREE.Vector3, username: string}) => {
+    const onCamera = (data: {position: THREE.Vector3, username: string} | ArrayBuffer) => {
+        const {position, username} = decodeCamera(data);
         if (username !== authInfo.username) {
-            cube.updateCamera(position);
+            cube.updateCamera(new THREE.Vector3(position.x, position.y, position.z));
         }
     }
 
-    const onSetState = ({state} : {state: string}) => {
-        cube.setState(state);
+    const onSetState = (data: {state: string} | ArrayBuffer) => {
+        cube.setState(decodeState(data).state);
+    }
+
+    const onSolveStart = (data: {state: string} | ArrayBuffer) => {
+        startSolve(decodeState(data));
     }
 
     const onSolveEnd = ({time, id} : {time: number, id: number}) => {
@@ -103,19 +113,19 @@ function TogetherLobby({id} : {id: number}) {
     useEffect(() => {
         socket.on("together_join", onJoin);
         socket.on("together_dc", onDc);
-        socket.on("together_move", onMove);
+        socket.on("together_moves", onMoves);
         socket.on("together_camera", onCamera);
         socket.on("together_set_state", onSetState);
-        socket.on("together_solve_start", startSolve);
+        socket.on("together_solve_start", onSolveStart);
         socket.on("together_solve_end", onSolveEnd);
         socket.on("together_layers_change", onLayersChange);
         return () => {
             socket.off("together_join", onJoin);
             socket.off("together_dc", onDc);
-            socket.off("together_move", onMove);
+            socket.off("together_moves", onMoves);
             socket.off("together_camera", onCamera);
             socket.off("together_set_state", onSetState);
-            socket.off("together_solve_start", startSolve);
+            socket.off("together_solve_start", onSolveStart);
             socket.off("together_solve_end", onSolveEnd);
             socket.off("together_layers_change", onLayersChange);
         }
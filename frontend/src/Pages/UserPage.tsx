@@ -1,6 +1,6 @@
 import { Alert, Button, Container, Flex, Space, Text, Title, Tooltip } from "@mantine/core";
 import { useParams } from "react-router-dom";
-import { useCallback, useContext, useEffect, useState } from "react";
+import { useCallback, useContext, useEffect, useRef, useState } from "react";
 import { NavigationIcons } from "../components/NavigationButtons";
 import { Statistics } from "../components/Statistics";
 import { AuthContext } from "../authContext";
@@ -10,14 +10,16 @@ import TimeList, { Solve } from "../components/TimeList";
 import { UserSearchField } from "../components/UserSearchField";
 import { LineChart } from '@mantine/charts';
 import { print_time } from "../cube/timer";
-import { getAverage } from "../components/SidePanelTimeList";
+import { fetchSolvePages, getAverage } from "../components/SidePanelTimeList";
 
 type UserInfo = {
     username: string;
     role: string;
     banned: boolean;
     created_date: string;
+    // first page of the solves
     solves: Array<Solve>;
+    next: string | null;
 }
 
 function TimeChart({solves} : {solves: Array<Solve>}) {
@@ -52,8 +54,11 @@ export function User({username} : {username: string}) {
 
     const [user, setUser] = useState<UserInfo | null>(null);
     const [solves, setSolves] = useState<Solve[]>([]);
+    // the pages of an older fetch are ignored
+    const fetchCount = useRef(0);
 
     const fetchData = useCallback(() => {
+        const current = ++fetchCount.current;
         fetch(
             '/api/user_info', {
                 method: "POST",
@@ -65,6 +70,14 @@ export function User({username} : {username: string}) {
             (data: UserInfo) => {
                 setUser(data);
                 setSolves(data.solves);
+                if (data.next !== null) {
+                    return fetchSolvePages<Solve>(
+                        `/api/fetch_solves?username=${encodeURIComponent(username)}&limit=1000`,
+                        page => setSolves(solves => [...solves, ...page]),
+                        () => fetchCount.current !== current,
+                        data.next
+                    );
+                }
             }
         ).catch(err => console.log(err));
     }, [username])
@@ -102,7 +115,7 @@ export function User({username} : {username: string}) {
         }).catch(error => console.log(error))
     }
 
-    const statsSolves = user.solves.filter(solve => solve.cube_size === statsCubeSize);
+    const statsSolves = solves.filter(solve => solve.cube_size === statsCubeSize);
 
     const stats = (
         <>
@@ -151,7 +164,7 @@ export function User({username} : {username: string}) {
                     { authInfo.isAdmin && user?.role !== "admin" && <Button onClick={makeAdmin}>Make admin</Button> }
                 </Flex>
                 <Text>Profile created on: {user?.created_date}</Text>
-                { !user.banned && <Text>Total solves: {user?.solves.length}</Text> }
+                { !user.banned && <Text>Total solves: {solves.length}</Text> }
 
                 { user.banned &&
                     <Alert mt="md" color="red" icon={<IconBan />}>
@@ -23,10 +23,14 @@ export default function SidePanelTimeList({cubeSize, fromList, continueFn} : {cu
 
     useEffect(() => {
         if (username && !fromList) {
-            fetch(`/api/get_solves/${username}/${cubeSize}`)
-                .then(res => res.json()).then(data => {
-                    setSolves(data)
-                }).catch(err => console.log(err));
+            let cancelled = false;
+            setSolves([]);
+            fetchSolvePages<SolveBasic>(
+                `/api/get_solves/${username}/${cubeSize}`,
+                page => setSolves(solves => [...solves, ...page]),
+                () => cancelled
+            ).catch(err => console.log(err));
+            return () => { cancelled = true; };
         }
     }, [username, cubeSize, fromList])
 
@@ -45,6 +49,26 @@ export default function SidePanelTimeList({cubeSize, fromList, continueFn} : {cu
     );
 }
 
+export async function fetchSolvePages<T>(
+    url: string,
+    onPage: (solves: Array<T>) => void,
+    isCancelled: () => boolean,
+    cursor: string | null = null
+) {
+    // fetch the pages of solves ({"solves": [...], "next": cursor}) one by one,
+    // starting after the given cursor
+    do {
+        const separator = url.includes("?") ? "&" : "?";
+        const res = await fetch(cursor === null ? url : `${url}${separator}cursor=${encodeURIComponent(cursor)}`);
+        const page: {solves: Array<T>, next: string | null} = await res.json();
+        if (isCancelled()) {
+            return;
+        }
+        onPage(page.solves);
+        cursor = page.next;
+    } while (cursor !== null);
+}
+
 // function to sort solves by time, dnfs come last
 export function solveComp(a: SolveBasic, b: SolveBasic) {
     if (!a.completed) {
@@ -0,0 +1,46 @@
+// the server sends moves made in a room in frames (see backend/move_broadcast.py)
+export interface FrameMove {
+    username: string;
+    move: string;
+    // server timestamp in ms
+    time: number;
+}
+
+export interface MoveFrame {
+    moves: FrameMove[];
+}
+
+export class MoveFramePlayer {
+    // plays the moves of frames with the spacing they were made with
+    // a frame that arrives before the previous frame was played is played
+    // after it, so the order of the moves is kept
+    playedUntil = 0;
+    timeouts = new Set<number>();
+
+    play(frame: MoveFrame, apply: (move: FrameMove) => void) {
+        if (frame.moves.length === 0) return;
+
+        const now = performance.now();
+        const start = Math.max(now, this.playedUntil);
+        const first = frame.moves[0].time;
+
+        for (const move of frame.moves) {
+            const at = start + move.time - first;
+            const timeout = window.setTimeout(() => {
+                this.timeouts.delete(timeout);
+                apply(move);
+            }, at - now);
+            this.timeouts.add(timeout);
+            this.playedUntil = at;
+        }
+    }
+
+    cancel() {
+        // drop the moves that were not played yet
+        for (const timeout of this.timeouts) {
+            clearTimeout(timeout);
+        }
+        this.timeouts.clear();
+        this.playedUntil = 0;
+    }
+}
@@ -4,6 +4,7 @@ import { print_time } from "../cube/timer";
 import useStopwatch from "./useStopwatch";
 import useCountdown from "./useCountdown";
 import { socket } from "../socket";
+import { encodeCamera } from "../protocol";
 import * as THREE from "three"
 import { parse_move } from "../cube/move";
 import { useHotkeys } from "react-hotkeys-hook";
@@ -14,6 +15,13 @@ export const MIN_CUBE_SIZE = 2
 export const MAX_CUBE_SIZE = 20
 
 
+type MoveAck = { status: "ok", delay: number } | { status: "throttled", retryAfter: number };
+
+function sleep(ms: number) {
+    return new Promise(r => setTimeout(r, ms));
+}
+
+
 function print_solve_time(time: number | null) {
     if (!time) {
         return "DNF";
@@ -44,7 +52,16 @@ export default function useCube() {
             if (emitting) return;
             emitting = true;
             while (toEmit.length) {
-                await socket.emitWithAck("move", {move: toEmit.shift()});
+                const response: MoveAck | undefined = await socket.emitWithAck("move", {move: toEmit[0]});
+                // the server is rate limiting the moves, send the move again later
+                if (response?.status === "throttled") {
+                    await sleep(response.retryAfter);
+                    continue;
+                }
+                toEmit.shift();
+                if (response?.delay) {
+                    await sleep(response.delay);
+                }
             }
             emitting = false;
         }
@@ -55,15 +72,42 @@ export default function useCube() {
         }
         cube.addOnMoveEventListener(send_move);
 
+        // camera positions are not sent while the server is rate limiting
+        // them, only the last one is sent afterwards
+        let cameraPausedUntil = 0;
+        let lastCamera: THREE.Vector3 | null = null;
+        let cameraTimeout: ReturnType<typeof setTimeout> | undefined;
+
         function send_camera(new_position: THREE.Vector3) {
-            socket.emit("camera", {position: new_position});
+            if (Date.now() < cameraPausedUntil) {
+                lastCamera = new_position;
+                return;
+            }
+            socket.emit("camera", encodeCamera(new_position));
         }
         cube.addOnCameraEventListener(send_camera);
 
+        function onRateLimited({event, retryAfter}: {event: string, retryAfter: number}) {
+            if (event !== "camera") return;
+            cameraPausedUntil = Date.now() + retryAfter;
+            clearTimeout(cameraTimeout);
+            cameraTimeout = setTimeout(() => {
+                // the timer can fire slightly before the pause ends
+                cameraPausedUntil = 0;
+                if (lastCamera) {
+                    socket.emit("camera", encodeCamera(lastCamera));
+                    lastCamera = null;
+                }
+            }, retryAfter);
+        }
+        socket.on("rate_limited", onRateLimited);
+
         cube.initControls();
 
         return () => {
             cube.destroyControls();
+            socket.off("rate_limited", onRateLimited);
+            clearTimeout(cameraTimeout);
         }
     }, [cube])
 
@@ -107,7 +151,7 @@ export default function useCube() {
             const move = parse_move(moveString);
             move.reverse();
             cube.makeMove(move.toString());
-            await new Promise(r => setTimeout(r, 200));
+            await sleep(200);
         }
     }
 
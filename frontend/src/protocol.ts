@@ -0,0 +1,96 @@
+// wire formats of socket events (see backend/protocol.py)
+// JSON is the default, MessagePack can be chosen by setting the "protocol"
+// key in local storage or REACT_APP_SOCKET_PROTOCOL to "msgpack"
+import { decode } from "@msgpack/msgpack";
+import { FrameMove, MoveFrame } from "./cube/moveFrames";
+
+export const PROTOCOL = localStorage.getItem("protocol") ?? process.env.REACT_APP_SOCKET_PROTOCOL ?? "json";
+
+// move codes - see encode_move in backend/cube.py
+const MOVE_FACES = "UFRBLDMSExyz";
+const DIRECTION_SUFFIXES = ["", "'", "2"];
+
+export function moveFromCode(code: number): string {
+    const face = MOVE_FACES[code & 0b1111];
+    const direction = DIRECTION_SUFFIXES[(code >> 4) & 0b11];
+    const wide = (code >> 6) & 1 ? "w" : "";
+    const index = code >> 7;
+    return (index > 1 ? index.toString() : "") + face + wide + direction;
+}
+
+// packed cube states - see encode_state in backend/cube.py
+// two header bytes (format version and cube size), then 3 bits per sticker
+const COLOR_LETTERS = "WGRBOY";
+const BITS_PER_STICKER = 3;
+
+export function unpackState(buffer: Uint8Array): string {
+    const n = buffer[1];
+    let state = "";
+    for (let sticker = 0; sticker < 6 * n * n; sticker++) {
+        let code = 0;
+        for (let bit = sticker * BITS_PER_STICKER; bit < (sticker + 1) * BITS_PER_STICKER; bit++) {
+            code = (code << 1) | ((buffer[2 + (bit >> 3)] >> (7 - (bit & 7))) & 1);
+        }
+        state += COLOR_LETTERS[code];
+    }
+    return state;
+}
+
+// camera positions are 3 little endian float32 values
+interface Position {
+    x: number;
+    y: number;
+    z: number;
+}
+
+function unpackPosition(buffer: Uint8Array): Position {
+    const view = new DataView(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+    return { x: view.getFloat32(0, true), y: view.getFloat32(4, true), z: view.getFloat32(8, true) };
+}
+
+export function encodeCamera(position: Position) {
+    if (PROTOCOL !== "msgpack") {
+        return {position: position};
+    }
+    const buffer = new ArrayBuffer(12);
+    const view = new DataView(buffer);
+    view.setFloat32(0, position.x, true);
+    view.setFloat32(4, position.y, true);
+    view.setFloat32(8, position.z, true);
+    return buffer;
+}
+
+// decoders return the JSON payload of an event in either format
+function unpack(data: ArrayBuffer): any {
+    return decode(new Uint8Array(data));
+}
+
+export function decodeMoveFrame(data: MoveFrame | ArrayBuffer): MoveFrame {
+    if (!(data instanceof ArrayBuffer)) return data;
+    const [first, moves] = unpack(data) as [number, [string, number, number][]];
+    return {
+        moves: moves.map(([username, code, delta]): FrameMove => ({
+            username: username,
+            move: moveFromCode(code),
+            time: first + delta
+        }))
+    };
+}
+
+export function decodeCamera(data: {username: string, position: Position} | ArrayBuffer) {
+    if (!(data instanceof ArrayBuffer)) return data;
+    const [username, position] = unpack(data) as [string, Uint8Array];
+    return { username: username, position: unpackPosition(position) };
+}
+
+export function decodeState(data: {state: string} | ArrayBuffer) {
+    if (!(data instanceof ArrayBuffer)) return data;
+    const [state] = unpack(data) as [Uint8Array];
+    return { state: unpackState(state) };
+}
+
+export function decodeMatchStart(data: {state: string, startTime: string} | ArrayBuffer) {
+    if (!(data instanceof ArrayBuffer)) return data;
+    const [state, startTime] = unpack(data) as [Uint8Array, string];
+    return { state: unpackState(state), startTime: startTime };
+}
@@ -1,4 +1,5 @@
 // https://socket.io/how-to/use-with-react
 import { io } from 'socket.io-client';
+import { PROTOCOL } from './protocol';
 
-export const socket = io({ autoConnect: false });
\ No newline at end of file
+export const socket = io({ autoConnect: false, auth: { protocol: PROTOCOL } });